@@ -2,315 +2,296 @@ import os
 import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import subprocess
+import collections
+import itertools
 import threading
-import configparser
-import tempfile
-from concurrent.futures import ThreadPoolExecutor
+import time
+import traceback
 
-# 配置文件名
-CONFIG_FILE = "config.ini"
-
-# --- 辅助类：滚动框架 (保持不变) ---
-class ScrollableFrame(ttk.Frame):
-    def __init__(self, container, *args, **kwargs):
-        super().__init__(container, *args, **kwargs)
-        self.canvas = tk.Canvas(self, borderwidth=0, highlightthickness=0)
-        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
-        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
-
-    def _on_mousewheel(self, event):
-        self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-
-# --- 核心类：Git 操作及依赖管理基类 ---
-class GitItemBase:
-    def __init__(self, app, path, display_name):
-        self.app = app
-        self.full_path = path
-        self.display_name = display_name
-        self.is_update_available = False
-        self.has_requirements = False
-
-    def check_requirements(self):
-        """检查是否存在 requirements.txt"""
-        req_path = os.path.join(self.full_path, "requirements.txt")
-        self.has_requirements = os.path.exists(req_path)
-        return self.has_requirements
-
-    def run_cmd_generic(self, cmd_args, cwd=None, show_window=False):
-        """通用的命令行执行方法 (用于 git 和 pip)"""
-        target_cwd = cwd if cwd else self.full_path
-        return self.app.run_cmd(cmd_args, target_cwd, show_window)
-
-    def run_git(self, args):
-        cmd = [self.app.git_exe] + args
-        return self.run_cmd_generic(cmd)
-    
-    def run_pip_install(self):
-        """执行 pip install -r requirements.txt，弹出终端窗口并在完成后暂停"""
-        if not self.has_requirements:
-            return False, "未找到 requirements.txt"
-        
-        # 使用配置中的 python 路径
-        python_exe = self.app.python_exe
-        if not python_exe:
-            return False, "未配置 Python 路径"
-
-        req_path = os.path.join(self.full_path, "requirements.txt")
-        
-        # 构建环境变量
-        env = os.environ.copy()
-        proxy_url = self.app.proxy_url
-        env_lines = ""
-        if proxy_url:
-            env_lines = f'set "http_proxy={proxy_url}"\nset "https_proxy={proxy_url}"\n'
-
-        # 创建临时 bat 脚本：执行 pip install 并在结束后暂停
-        bat_content = f'''@echo off
-chcp 65001 >nul
-echo ============================================
-echo   安装依赖: {self.display_name}
-echo ============================================
-echo.
-{env_lines}"{python_exe}" -m pip install -r "{req_path}"
-echo.
-if %errorlevel% equ 0 (
-    echo ============================================
-    echo   依赖安装完成！
-    echo ============================================
-) else (
-    echo ============================================
-    echo   依赖安装出错，请检查上方错误信息
-    echo ============================================
+from updater_core import (
+    CheckScheduler, GitItemBase, NodesWatcher, OperationLog, StatusCache, UpdatePipeline, UpdaterBase, VersionEntry,
+    COMMIT_LOG_FORMAT, git_state_fingerprint, parse_commit_log,
 )
-echo.
-pause
-'''
-        try:
-            # 写入临时 bat 文件
-            fd, bat_path = tempfile.mkstemp(suffix='.bat', prefix='comfy_pip_')
-            with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                f.write(bat_content)
-            
-            # 使用 CREATE_NEW_CONSOLE 弹出新终端窗口
-            CREATE_NEW_CONSOLE = 0x00000010
-            process = subprocess.Popen(
-                ['cmd', '/c', bat_path],
-                cwd=self.full_path,
-                creationflags=CREATE_NEW_CONSOLE,
-                env=env
-            )
-            # 等待终端窗口关闭（用户按任意键后）
-            process.wait()
-            
-            # 清理临时文件
-            try:
-                os.remove(bat_path)
-            except:
-                pass
-            
-            if process.returncode == 0:
-                return True, "依赖安装完成"
-            else:
-                return False, f"pip 安装返回错误码: {process.returncode}"
-        except Exception as e:
-            return False, str(e)
+from updater_deps import collect_dependency_plan, collect_requirement_lines
+from updater_profile import ImportProfiler
+from updater_trace import traced
+from updater_snapshot import SnapshotRestore, capture_snapshot, diff_snapshot, load_snapshot, save_snapshot
+
+# --- 线程桥接：后台线程/事件循环把界面更新投递到 Tk 主线程 ---
+class TkBridge:
+    """界面更新总线：Tk 只能在主线程中操作，其它线程通过 post() 投递回调，主线程按固定节拍批量执行
+
+    post(..., key=k) 投递可合并的更新：同一 key 尚未执行的回调只保留最新一次（保持原来的位置），
+    回调必须根据当时的完整状态设置界面。invalidate() 登记重绘，每个节拍末尾同一 key 只重绘一次。
+    每个节拍最多执行 FRAME_BUDGET_MS 的回调，剩余的留到下一个节拍，大量行同时完成时界面仍能响应。
+    """
+    POLL_MS = 16
+    FRAME_BUDGET_MS = 10
 
-    def check_status_base(self):
-        if not os.path.exists(os.path.join(self.full_path, ".git")):
-            return "非Git仓库", "gray", False
-        
-        self.run_git(["fetch"]) 
-        code, out, _ = self.run_git(["status", "-uno"])
-        
-        if "behind" in out or "落后" in out:
-            return "检测到新版本", "red", True
-        elif "detached" in out:
-             return "处于历史版本", "orange", False
-        
-        return "最新版本", "green", False
-
-    def fetch_versions_base(self):
-        versions = ["最新版本 (Latest)"]
-        if not os.path.exists(os.path.join(self.full_path, ".git")):
-            return []
-        
-        # Tags
-        code, out, _ = self.run_git(["tag", "--sort=-creatordate"])
-        if code == 0 and out:
-            tags = out.split('\n')[:8]
-            for t in tags:
-                if t.strip(): versions.append(f"Tag: {t.strip()}")
-
-        # Commits
-        code, out, _ = self.run_git(["log", "--pretty=format:%h - %s", "-n", "15"])
-        if code == 0 and out:
-            commits = out.split('\n')
-            for c in commits:
-                if c.strip(): versions.append(f"Commit: {c.strip()}")
-        return versions
-
-    def do_update_logic(self, selection, silent=False):
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()   # key -> (func, args)，无 key 的回调用序号占位
+        self._seq = itertools.count()
+        self._redraw = collections.OrderedDict()    # key -> (func, args)
+        self.coalesced = 0          # 被合并掉的更新次数
+        self.last_drain_ms = 0.0
+        self.root.after(self.POLL_MS, self._drain)
+
+    def post(self, func, *args, key=None):
+        if key is None:
+            key = ("seq", next(self._seq))
+        with self._lock:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = (func, args)
+
+    def invalidate(self, key, func, *args):
+        """登记在本节拍末尾执行的重绘，同一 key 只执行一次"""
+        with self._lock:
+            self._redraw[key] = (func, args)
+
+    @property
+    def backlog(self):
+        return len(self._pending)
+
+    def _drain(self):
+        start = time.perf_counter()
+        deadline = start + self.FRAME_BUDGET_MS / 1000
+        while True:
+            with self._lock:
+                if not self._pending:
+                    break
+                _, (func, args) = self._pending.popitem(last=False)
+            self._call(func, args)
+            if time.perf_counter() >= deadline:
+                break
+        # 重绘只涉及可视区域内的行，每个节拍都全部完成
+        with self._lock:
+            redraw, self._redraw = self._redraw, collections.OrderedDict()
+        for func, args in redraw.values():
+            self._call(func, args)
+        self.last_drain_ms = (time.perf_counter() - start) * 1000
+        self.root.after(self.POLL_MS, self._drain)
+
+    @staticmethod
+    def _call(func, args):
         try:
-            def try_force_reset(err_msg):
-                keywords = ["overwritten by merge", "stash them", "local changes", "aborted"]
-                if any(k in err_msg for k in keywords):
-                    if messagebox.askyesno("冲突解决", 
-                        f"检测到 {self.display_name} 有本地修改导致更新失败。\n\n是否【丢弃本地修改】并强制更新？"):
-                        r_code, _, r_err = self.run_git(["reset", "--hard", "HEAD"])
-                        return r_code == 0
-                return False
-
-            if "最新版本" in selection:
-                code, out, _ = self.run_git(["remote", "show", "origin"])
-                head_branch = "master" 
-                if "HEAD branch" in out:
-                    for line in out.splitlines():
-                        if "HEAD branch" in line:
-                            head_branch = line.split(":")[-1].strip()
-                            break
-                
-                self.run_git(["checkout", head_branch])
-                code, out, err = self.run_git(["pull"])
-                if code != 0:
-                    if try_force_reset(err):
-                        code, out, err = self.run_git(["pull"])
-
-                if code == 0:
-                    return True, "更新成功"
-                else:
-                    return False, f"更新失败: {err}"
-
-            elif "Tag:" in selection or "Commit:" in selection:
-                target = selection.replace("Tag: ", "").strip() if "Tag:" in selection else selection.split(" ")[1].strip()
-                code, _, err = self.run_git(["checkout", target])
-                if code != 0:
-                    if try_force_reset(err):
-                        code, _, err = self.run_git(["checkout", target])
-                
-                if code == 0:
-                    return True, f"已回退: {target}"
-                else:
-                    return False, f"切换失败: {err}"
-            return False, "未选择操作"
-
+            func(*args)
         except Exception as e:
-            return False, str(e)
-
-# --- 插件行UI (继承自 GitItemBase) ---
-class PluginRow(GitItemBase):
-    def __init__(self, parent_frame, app, folder_name):
-        full_path = os.path.join(app.nodes_path, folder_name)
-        super().__init__(app, full_path, folder_name)
-        
-        self.frame = tk.Frame(parent_frame, bd=1, relief=tk.RIDGE, bg="white")
-        self.frame.pack(fill="x", pady=2, padx=5)
+            print(f"UI callback error: {e}", file=sys.stderr)
+            traceback.print_exc()
+
+
+# --- 插件数据模型：状态与控件分离，列表只为可见行创建控件 ---
+class PluginRecord(GitItemBase):
+    """单个插件的全部状态；界面通过 PluginRowWidget 按需显示，控件可被回收复用"""
+    __slots__ = ("status_text", "status_color", "versions", "selected_index", "versions_head",
+                 "versions_loading", "action_state", "action_text", "pip_state", "pip_text",
+                 "delete_state", "delete_text", "cancelled", "fingerprint", "fetched_at", "import_profile")
+
+    def __init__(self, app, folder_name):
+        super().__init__(app, os.path.join(app.nodes_path, folder_name), folder_name)
+        self.status_text = "等待检查..."
+        self.status_color = "gray"
+        # 版本列表在展开下拉框时才加载，初始只有"最新版本"
+        self.versions = [VersionEntry.latest()]
+        self.selected_index = 0
+        self.versions_head = None       # 当前版本列表对应的 HEAD SHA（按 HEAD 记忆）
+        self.versions_loading = False
+        self.action_state, self.action_text = "disabled", "执行操作"
+        self.pip_state, self.pip_text = "disabled", "安装依赖"
+        self.delete_state, self.delete_text = "normal", "删除"
+        self.cancelled = False
+        self.fingerprint = None     # 最近一次检查时的 git_state_fingerprint
+        self.fetched_at = None
+        self.import_profile = app.profile_history.latest(self.full_path)  # 最近一次导入耗时分析
+
+    def start(self, priority=0, force=False):
+        """先显示缓存状态，只有缓存缺失、超过 TTL 或 force 时才交给调度器排队检查"""
+        cached = None if force else self.app.status_cache.get(self.full_path)
+        if cached is not None:
+            self.fingerprint = cached["fingerprint"]
+            self.fetched_at = cached["fetched_at"]
+            self.ahead_count, self.behind_count = cached.get("ahead_behind", (0, 0))
+            if cached["versions"]:
+                self.versions_head = cached["head"]
+                self.set_versions([VersionEntry.from_dict(d) for d in cached["versions"]])
+            self._apply_result(tuple(cached["status"]), self.check_requirements())
+        if cached is None or self.app.status_cache.is_stale(cached):
+            self.app.check_scheduler.submit(self, self.init_data, priority)
+
+    def recheck_if_changed(self, priority=0):
+        """HEAD 或 refs 自上次检查后被外部改动时，仅按本地 refs 重新计算状态（不 fetch）"""
+        if self.fingerprint is None or git_state_fingerprint(self.full_path) == self.fingerprint:
+            return False
+        self.app.check_scheduler.submit(self, lambda: self.init_data(fetch=False), priority)
+        return True
+
+    def cancel(self):
+        """该行被移除：丢弃后续结果并终止正在运行的 git 命令"""
+        self.cancelled = True
+        self.cancel_token.cancel()
+
+    def refresh_view(self):
+        """登记重绘该行，在本节拍末尾执行（仅当它正处于可视区域时才有控件）"""
+        self.app.ui.invalidate(self, self.app.plugin_view.refresh_record, self)
+
+    async def init_data(self, fetch=True):
+        """启动时只做 fetch + 领先/落后检查，版本列表留到展开下拉框时再加载（在命令引擎中运行）"""
+        if self.cancelled: return
+        fingerprint = git_state_fingerprint(self.full_path)
+        text, color, is_update = await self.check_status_async(fetch)
+        offline = fetch and self.fetch_error is not None
+        if offline:
+            # 远程主机不可用：沿用上次成功检查的结果，不刷新 fetched_at，TTL 到期后再试
+            cached = self.app.status_cache.get(self.full_path)
+            if cached is not None:
+                text, color, is_update = cached["status"]
+                self.ahead_count, self.behind_count = cached.get("ahead_behind", (0, 0))
+        elif fetch:
+            self.fetched_at = time.time()
+        self.is_update_available = is_update
         
-        # 1. 名字
-        self.lbl_name = tk.Label(self.frame, text=folder_name, width=28, anchor="w", font=("Arial", 9, "bold"), bg="white")
-        self.lbl_name.pack(side="left", padx=5)
-
-        # 2. 状态
-        self.lbl_status = tk.Label(self.frame, text="等待检查...", width=12, fg="gray", bg="white")
-        self.lbl_status.pack(side="left", padx=5)
-
-        # 3. 版本下拉
-        self.var_version = tk.StringVar()
-        self.combo_versions = ttk.Combobox(self.frame, textvariable=self.var_version, width=25, state="readonly")
-        self.combo_versions.set("加载中...")
-        self.combo_versions.pack(side="left", padx=5)
+        # 检查依赖文件
+        has_req = self.check_requirements()
 
-        # 4. 执行操作按钮
-        self.btn_action = tk.Button(self.frame, text="执行操作", command=self.on_action_click, bg="#f0f0f0", state="disabled", width=8)
-        self.btn_action.pack(side="left", padx=5)
+        # fetch 带回了新的 refs（可能有新标签）时，已记忆的版本列表作废
+        if git_state_fingerprint(self.full_path) != fingerprint:
+            self.versions_head = None
 
-        # 5. 依赖修复按钮 (新增)
-        self.btn_pip = tk.Button(self.frame, text="安装依赖", command=self.on_pip_click, bg="#e3f2fd", state="disabled", width=8)
-        self.btn_pip.pack(side="right", padx=5)
+        _, head_sha = self.git_reader().read_head()
+        if head_sha:
+            versions = self.versions if self.versions_head == head_sha else []
+            entry = self.app.status_cache.put(self.full_path, (text, color, is_update), versions, head_sha,
+                                              (self.ahead_count, self.behind_count), self.fetched_at or 0)
+            self.fingerprint = entry["fingerprint"]
+        else:
+            self.fingerprint = git_state_fingerprint(self.full_path)
 
-        # 6. 删除插件按钮
-        self.btn_delete = tk.Button(self.frame, text="删除", command=self.on_delete_click, bg="#ffcdd2", fg="#c62828", width=6)
-        self.btn_delete.pack(side="right", padx=5)
+        def update_ui():
+            if self.cancelled: return
+            self._apply_result((f"{text} (离线)" if offline else text, color, is_update), has_req)
+            self.refresh_view()
+            self.app.schedule_cache_flush()
 
-        threading.Thread(target=self.init_data, daemon=True).start()
+        self.app.ui.post(update_ui, key=(self, "status"))
 
-    def init_data(self):
-        text, color, is_update = self.check_status_base()
+    def _apply_result(self, status, has_req):
+        text, color, is_update = status
         self.is_update_available = is_update
-        
-        # 检查依赖文件
-        has_req = self.check_requirements()
+        self.status_text, self.status_color = text, color
+        if color == "gray":  # 非 Git 仓库，没有可选版本
+            self.set_versions([])
+        self.action_state = "normal"
+        if not self.update_dependency_state(has_req):
+            # 索引未收录该插件的需求（新装或更新后 requirements 有变化），后台补全后再刷新
+            self.app.refresh_environment_index(automatic=True)
+
+    def update_dependency_state(self, has_req=None):
+        """按环境索引设置依赖按钮：有缺失时可点击并显示缺几项，全部满足时禁用；
+        索引尚未就绪时保持可点击并返回 False"""
+        if self.pip_text == "安装中...":
+            return True
+        if has_req is None:
+            has_req = self.check_requirements()
+        if not has_req:
+            self.pip_state, self.pip_text = "disabled", "无依赖"
+            return True
+        deps = self.dependency_status()
+        if deps is None:
+            self.pip_state, self.pip_text = "normal", "安装依赖"
+            return False
+        if deps.satisfied:
+            self.pip_state, self.pip_text = "disabled", deps.describe()
+        else:
+            self.pip_state, self.pip_text = "normal", deps.describe()
+        return True
 
-        versions = self.fetch_versions_base()
+    def set_versions(self, versions):
+        self.versions = versions
+        self.selected_index = 0
 
-        def update_ui():
-            self.lbl_status.config(text=text, fg=color)
-            self._update_combo(versions)
-            if has_req:
-                self.btn_pip.config(state="normal")
-            else:
-                self.btn_pip.config(state="disabled", text="无依赖")
-
-        self.app.root.after(0, update_ui)
+    def request_versions(self):
+        """下拉框展开前调用：HEAD 未变时直接使用记忆的列表，否则后台加载"""
+        if self.versions_loading:
+            return
+        _, head_sha = self.git_reader().read_head()
+        if not head_sha or head_sha == self.versions_head:
+            return
+        self.versions_loading = True
+        self.app.check_scheduler.submit(("versions", self), lambda: self._load_versions(head_sha),
+                                        CheckScheduler.PRIORITY_INTERACTIVE)
 
-    def _update_combo(self, versions):
-        self.combo_versions['values'] = versions
-        if versions: self.combo_versions.current(0)
-        else: self.combo_versions.set("无版本记录")
-        self.btn_action.config(state="normal")
+    async def _load_versions(self, head_sha):
+        versions = await self.fetch_versions_async()
+        self.app.status_cache.update_versions(self.full_path, head_sha, versions)
 
-    def on_action_click(self):
-        selection = self.var_version.get()
-        if not selection: return
-        if messagebox.askyesno("确认", f"对插件 {self.display_name} 执行:\n{selection}?"):
-            self.btn_action.config(state="disabled", text="执行中...")
-            threading.Thread(target=self.do_update, args=(selection, False), daemon=True).start()
-
-    def do_update(self, selection, silent=False):
-        success, msg = self.do_update_logic(selection, silent)
+        def update_ui():
+            self.versions_loading = False
+            if self.cancelled: return
+            self.versions_head = head_sha
+            self.set_versions(versions)
+            widget = self.app.plugin_view.refresh_record(self)
+            if widget is not None:
+                widget.repost_combo()
+            self.app.schedule_cache_flush()
+
+        self.app.ui.post(update_ui)
+
+    def _track_progress(self, log):
+        """把操作进度显示在状态列（回调来自后台线程，转到界面线程更新）"""
+        def on_progress(log):
+            if log.state != OperationLog.RUNNING or not log.phase:
+                return
+            text = log.progress_text()
+
+            def update():
+                if self.cancelled: return
+                self.status_text, self.status_color = text, "blue"
+                self.refresh_view()
+            # 下载进度很频繁，同一行尚未显示的进度只保留最新一条
+            self.app.ui.post(update, key=(self, "progress"))
+        log.add_listener(on_progress)
+
+    def do_update(self, version, silent=False):
+        log = self.app.new_operation_log(f"{self.display_name}: {version.label()}")
+        self._track_progress(log)
+        success, msg = self.do_update_logic(version, silent, log)
+        log.finish(success, msg)
         def post_ui():
-            self.btn_action.config(state="normal", text="执行操作")
+            self.action_state, self.action_text = "normal", "执行操作"
             if success:
-                self.lbl_status.config(text="操作成功", fg="green")
+                self.status_text, self.status_color = "操作成功", "green"
                 self.is_update_available = False
+                self.behind_count = 0
+            else:
+                self.status_text, self.status_color = "操作失败", "red"
+            self.refresh_view()
+            if success:
                 if not silent: messagebox.showinfo("成功", f"{self.display_name}: {msg}")
             else:
-                self.lbl_status.config(text="操作失败", fg="red")
                 if not silent: messagebox.showerror("失败", f"{self.display_name}: {msg}")
-        self.app.root.after(0, post_ui)
-    
-    def on_pip_click(self):
-        if messagebox.askyesno("安装依赖", f"即将为 {self.display_name} 执行 pip install。\n请确保网络通畅（代理已配置）。\n\n继续吗？"):
-            self.btn_pip.config(state="disabled", text="安装中...")
-            threading.Thread(target=self.do_pip, daemon=True).start()
+        self.app.ui.post(post_ui)
 
     def do_pip(self):
-        success, msg = self.run_pip_install()
+        previous_status = (self.status_text, self.status_color)
+        log = self.app.new_operation_log(f"安装依赖: {self.display_name}")
+        self._track_progress(log)
+        success, msg = self.run_pip_install(log)
+        # pip 改变了环境，重建索引后按钮才能反映真实的满足情况
+        self.app.environment_index.ensure(self.app)
         def post_ui():
-            self.btn_pip.config(state="normal", text="安装依赖")
+            self.pip_state, self.pip_text = "normal", "安装依赖"
+            self.update_dependency_state()
+            self.status_text, self.status_color = previous_status
+            self.refresh_view()
+            self.app.refresh_environment_index()
             if success:
                 messagebox.showinfo("Pip 安装成功", f"{self.display_name} 依赖安装完成。\n\n日志片段:\n{msg[-500:]}")
             else:
                 messagebox.showerror("Pip 安装失败", f"{self.display_name} 依赖安装出错。\n\n错误信息:\n{msg}")
-        self.app.root.after(0, post_ui)
-
-    def on_delete_click(self):
-        """删除插件按钮点击事件"""
-        if messagebox.askyesno("确认删除", f"确定要删除插件【{self.display_name}】吗？\n\n此操作不可恢复！"):
-            self.btn_delete.config(state="disabled", text="删除中...")
-            threading.Thread(target=self.do_delete, daemon=True).start()
+        self.app.ui.post(post_ui)
 
     def do_delete(self):
         """执行删除操作"""
@@ -329,12 +310,450 @@ class PluginRow(GitItemBase):
         
         def post_ui():
             if success:
-                self.frame.destroy()
+                self.app.remove_plugin_record(self)
                 messagebox.showinfo("删除成功", f"插件【{self.display_name}】已删除。")
             else:
-                self.btn_delete.config(state="normal", text="删除")
+                self.delete_state, self.delete_text = "normal", "删除"
+                self.refresh_view()
                 messagebox.showerror("删除失败", f"删除插件失败:\n{msg}")
-        self.app.root.after(0, post_ui)
+        self.app.ui.post(post_ui)
+
+
+def _import_label(profile):
+    """导入耗时列的文字与颜色：越慢越醒目，比上次明显变慢时加 ↑"""
+    if profile is None or profile.status == "skipped":
+        return {"text": "", "fg": "gray"}
+    if profile.status != "ok":
+        return {"text": profile.describe(), "fg": "red"}
+    color = "red" if profile.seconds >= 2 else "orange" if profile.seconds >= 0.5 else "gray"
+    return {"text": profile.describe() + (" ↑" if profile.regression else ""), "fg": color}
+
+
+def _import_sort_key(record):
+    """按导入耗时从高到低排列，失败与超时排在最前，没有分析结果的排在最后"""
+    profile = record.import_profile
+    if profile is None or profile.status == "skipped":
+        return (2, 0.0, record.display_name.lower())
+    if profile.status != "ok":
+        return (0, 0.0, record.display_name.lower())
+    return (1, -profile.seconds, record.display_name.lower())
+
+
+# --- 插件行控件：可回收，show() 切换绑定的 PluginRecord ---
+class PluginRowWidget:
+    def __init__(self, parent, app):
+        self.app = app
+        self.record = None
+        
+        self.frame = tk.Frame(parent, bd=1, relief=tk.RIDGE, bg="white")
+        
+        # 1. 名字
+        self.lbl_name = tk.Label(self.frame, width=28, anchor="w", font=("Arial", 9, "bold"), bg="white")
+        self.lbl_name.pack(side="left", padx=5)
+
+        # 2. 状态
+        self.lbl_status = tk.Label(self.frame, width=12, bg="white")
+        self.lbl_status.pack(side="left", padx=5)
+
+        # 3. 导入耗时（最近一次分析结果）
+        self.lbl_import = tk.Label(self.frame, width=14, bg="white")
+        self.lbl_import.pack(side="left", padx=5)
+
+        # 4. 版本下拉
+        self.var_version = tk.StringVar()
+        self.combo_versions = ttk.Combobox(self.frame, textvariable=self.var_version, width=25, state="readonly",
+                                           postcommand=self._on_combo_open)
+        self.combo_versions.bind("<<ComboboxSelected>>", self._on_combo_selected)
+        self.combo_versions.pack(side="left", padx=5)
+
+        # 5. 执行操作按钮
+        self.btn_action = tk.Button(self.frame, command=self.on_action_click, bg="#f0f0f0", width=8)
+        self.btn_action.pack(side="left", padx=5)
+
+        # 6. 依赖修复按钮
+        self.btn_pip = tk.Button(self.frame, command=self.on_pip_click, bg="#e3f2fd", width=10)
+        self.btn_pip.pack(side="right", padx=5)
+
+        # 7. 删除插件按钮
+        self.btn_delete = tk.Button(self.frame, command=self.on_delete_click, bg="#ffcdd2", fg="#c62828", width=6)
+        self.btn_delete.pack(side="right", padx=5)
+
+    def show(self, record):
+        self.record = record
+        self.render()
+
+    def render(self):
+        r = self.record
+        self.lbl_name.config(text=r.display_name)
+        self.lbl_status.config(text=r.status_text, fg=r.status_color)
+        self.lbl_import.config(**_import_label(r.import_profile))
+        labels = [v.label() for v in r.versions]
+        if r.versions_loading:
+            labels.append("加载中...")
+        self.combo_versions['values'] = labels
+        if r.versions: self.combo_versions.current(min(r.selected_index, len(r.versions) - 1))
+        else: self.combo_versions.set("无版本记录")
+        self.btn_action.config(state=r.action_state, text=r.action_text)
+        self.btn_pip.config(state=r.pip_state, text=r.pip_text)
+        self.btn_delete.config(state=r.delete_state, text=r.delete_text)
+
+    def _on_combo_open(self):
+        if self.record is None: return
+        self.record.request_versions()
+        if self.record.versions_loading:
+            self.combo_versions['values'] = [v.label() for v in self.record.versions] + ["加载中..."]
+
+    def _on_combo_selected(self, event=None):
+        if self.record is not None:
+            self.record.selected_index = self.combo_versions.current()
+
+    def repost_combo(self):
+        """列表加载完成时下拉框若仍处于展开状态，重新展开以显示新内容"""
+        try:
+            popdown = self.combo_versions.tk.call("ttk::combobox::PopdownWindow", self.combo_versions)
+            if self.combo_versions.tk.call("winfo", "ismapped", popdown):
+                self.combo_versions.tk.call("ttk::combobox::Unpost", self.combo_versions)
+                self.combo_versions.tk.call("ttk::combobox::Post", self.combo_versions)
+        except tk.TclError:
+            pass
+
+    def on_action_click(self):
+        record = self.record
+        index = self.combo_versions.current()
+        if index < 0 or index >= len(record.versions): return
+        version = record.versions[index]
+        if messagebox.askyesno("确认", f"对插件 {record.display_name} 执行:\n{version.label()}?"):
+            record.action_state, record.action_text = "disabled", "执行中..."
+            record.refresh_view()
+            threading.Thread(target=record.do_update, args=(version, False), daemon=True).start()
+    
+    def on_pip_click(self):
+        record = self.record
+        if messagebox.askyesno("安装依赖", f"即将为 {record.display_name} 执行 pip install。\n请确保网络通畅（代理已配置）。\n\n继续吗？"):
+            record.pip_state, record.pip_text = "disabled", "安装中..."
+            record.refresh_view()
+            threading.Thread(target=record.do_pip, daemon=True).start()
+
+    def on_delete_click(self):
+        """删除插件按钮点击事件"""
+        record = self.record
+        if messagebox.askyesno("确认删除", f"确定要删除插件【{record.display_name}】吗？\n\n此操作不可恢复！"):
+            record.delete_state, record.delete_text = "disabled", "删除中..."
+            record.refresh_view()
+            threading.Thread(target=record.do_delete, daemon=True).start()
+
+
+# --- 虚拟化插件列表：只为可视区域内的行创建控件，滚动时回收复用 ---
+class PluginListView(ttk.Frame):
+    ROW_HEIGHT = 36
+
+    def __init__(self, container, app, *args, on_scroll=None, **kwargs):
+        super().__init__(container, *args, **kwargs)
+        self.app = app
+        self.on_scroll = on_scroll
+        self.records = []
+        self._pool = []      # [(widget, canvas 窗口 id)]
+        self._shown = {}     # record -> widget
+        self.canvas = tk.Canvas(self, borderwidth=0, highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_yscroll, yscrollincrement=self.ROW_HEIGHT)
+
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.bind("<Configure>", self._on_resize)
+        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+
+    def _on_mousewheel(self, event):
+        self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._layout()
+        if self.on_scroll:
+            self.on_scroll()
+
+    def _on_resize(self, event):
+        for _, item in self._pool:
+            self.canvas.itemconfigure(item, width=event.width - 10)
+        self._layout()
+
+    def set_records(self, records, keep_position=False):
+        self.records = records
+        self.canvas.configure(scrollregion=(0, 0, 0, len(records) * self.ROW_HEIGHT))
+        if not keep_position:
+            self.canvas.yview_moveto(0)
+        self._shown.clear()
+        for widget, _ in self._pool:
+            widget.record = None
+        self._layout()
+
+    def visible_range(self):
+        top = max(0, int(self.canvas.canvasy(0)) // self.ROW_HEIGHT)
+        count = self.canvas.winfo_height() // self.ROW_HEIGHT + 2
+        return top, min(len(self.records), top + count)
+
+    def visible_records(self):
+        first, last = self.visible_range()
+        return self.records[first:last]
+
+    def refresh_record(self, record):
+        """重绘记录对应的行，返回该行控件；不在可视区域时返回 None"""
+        widget = self._shown.get(record)
+        if widget is not None:
+            widget.render()
+        return widget
+
+    def _layout(self):
+        first, last = self.visible_range()
+        width = max(1, self.canvas.winfo_width() - 10)
+        while len(self._pool) < last - first:
+            widget = PluginRowWidget(self.canvas, self.app)
+            item = self.canvas.create_window(0, 0, window=widget.frame, anchor="nw",
+                                             width=width, height=self.ROW_HEIGHT - 4)
+            self._pool.append((widget, item))
+
+        self._shown.clear()
+        for i, (widget, item) in enumerate(self._pool):
+            index = first + i
+            if index < last:
+                record = self.records[index]
+                self._shown[record] = widget
+                if widget.record is not record:
+                    widget.show(record)
+                self.canvas.coords(item, 5, index * self.ROW_HEIGHT + 2)
+                self.canvas.itemconfigure(item, state="normal")
+            else:
+                widget.record = None
+                self.canvas.itemconfigure(item, state="hidden")
+
+# --- 操作日志面板：左侧为最近的操作，右侧实时显示选中操作的输出与进度 ---
+class OperationLogPanel(tk.Frame):
+    MAX_OPERATIONS = 50
+    REFRESH_MS = 200
+    STATE_ICONS = {OperationLog.RUNNING: "⏳", OperationLog.SUCCEEDED: "✅", OperationLog.FAILED: "❌"}
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.logs = []              # 最新的在前
+        self._labels = []           # 与 logs 对应的列表文字，变化时才更新
+        self._shown = None
+        self._shown_seq = 0
+
+        paned = ttk.PanedWindow(self, orient="horizontal")
+        paned.pack(fill="both", expand=True, padx=5, pady=5)
+
+        self.listbox = tk.Listbox(paned, width=40, exportselection=False)
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        paned.add(self.listbox, weight=1)
+
+        right = tk.Frame(paned)
+        paned.add(right, weight=3)
+        header = tk.Frame(right)
+        header.pack(fill="x")
+        self.lbl_phase = tk.Label(header, text="", anchor="w")
+        self.lbl_phase.pack(side="left", fill="x", expand=True)
+        self.progress = ttk.Progressbar(header, length=200, maximum=100)
+        self.progress.pack(side="right", padx=5)
+
+        self.text = tk.Text(right, wrap=tk.NONE, state="disabled", font=("Consolas", 9))
+        scrollbar = ttk.Scrollbar(right, command=self.text.yview)
+        self.text.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.text.pack(side="left", fill="both", expand=True)
+
+        self.after(self.REFRESH_MS, self._tick)
+
+    def add(self, log):
+        """在界面线程中调用；新操作排在最前，没有正在查看的运行中操作时自动切换过去"""
+        self.logs.insert(0, log)
+        self._labels.insert(0, None)
+        self.listbox.insert(0, "")
+        if len(self.logs) > self.MAX_OPERATIONS:
+            self.logs.pop()
+            self._labels.pop()
+            self.listbox.delete(tk.END)
+        if self._shown is None or self._shown.state != OperationLog.RUNNING or self._shown not in self.logs:
+            self._show(log)
+
+    def _on_select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection:
+            self._show(self.logs[selection[0]])
+
+    def _show(self, log):
+        self._shown = log
+        self._shown_seq = 0
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        self.text.config(state="disabled")
+        index = self.logs.index(log)
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self._render()
+
+    def _tick(self):
+        # 输出可能每秒上千行，这里定时批量刷新，而不是每行都投递到界面线程
+        for index, log in enumerate(self.logs):
+            label = f"{self.STATE_ICONS[log.state]} {log.title}"
+            if log.state == OperationLog.RUNNING and log.phase:
+                label += f" · {log.progress_text()}"
+            if label != self._labels[index]:
+                self._labels[index] = label
+                self.listbox.delete(index)
+                self.listbox.insert(index, label)
+                if log is self._shown:
+                    self.listbox.selection_set(index)
+        self._render()
+        self.after(self.REFRESH_MS, self._tick)
+
+    def _render(self):
+        log = self._shown
+        if log is None:
+            return
+        self.lbl_phase.config(text=log.progress_text() or log.title)
+        if log.percent is not None:
+            self.progress.config(mode="determinate", value=log.percent)
+        else:
+            self.progress.config(mode="determinate", value=100 if log.state != OperationLog.RUNNING else 0)
+        if log.seq == self._shown_seq:
+            return
+        lines, truncated = log.lines_since(self._shown_seq)
+        if not lines:
+            return
+        at_bottom = self.text.yview()[1] >= 0.999
+        self.text.config(state="normal")
+        if truncated and self._shown_seq:
+            self.text.insert(tk.END, "... (较早的输出已丢弃)\n")
+        self.text.insert(tk.END, "\n".join(text for _, text in lines) + "\n")
+        # 文本框同样只保留最近 MAX_LINES 行
+        excess = int(self.text.index("end-1c").split(".")[0]) - OperationLog.MAX_LINES
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+        self.text.config(state="disabled")
+        if at_bottom:
+            self.text.see(tk.END)
+        self._shown_seq = lines[-1][0]
+
+
+# --- 诊断：每条 git / pip 命令的耗时统计与 Chrome Trace 导出 ---
+def _format_seconds(seconds):
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+class DiagnosticsPanel(tk.Frame):
+    REFRESH_MS = 1000
+    RECENT_SPANS = 300
+
+    def __init__(self, parent, app):
+        super().__init__(parent)
+        self.app = app
+        self._last_seq = None
+
+        toolbar = tk.Frame(self)
+        toolbar.pack(fill="x", padx=5, pady=5)
+        self.lbl_summary = tk.Label(toolbar, text="", anchor="w")
+        self.lbl_summary.pack(side="left", fill="x", expand=True)
+        tk.Button(toolbar, text="导出 Chrome Trace...", command=self.export_trace).pack(side="right", padx=5)
+        tk.Button(toolbar, text="清空", command=self.clear).pack(side="right", padx=5)
+        tk.Button(toolbar, text="刷新", command=lambda: self.refresh(force=True)).pack(side="right", padx=5)
+        self.var_auto = tk.BooleanVar(value=True)
+        tk.Checkbutton(toolbar, text="自动刷新", variable=self.var_auto).pack(side="right", padx=5)
+
+        paned = ttk.PanedWindow(self, orient="vertical")
+        paned.pack(fill="both", expand=True, padx=5, pady=5)
+        top = ttk.PanedWindow(paned, orient="horizontal")
+        paned.add(top, weight=2)
+        self.tree_commands = self._make_tree(top, ("命令", "类型", "次数", "失败", "平均", "p50", "p95", "最大", "平均排队", "输出"),
+                                             (120, 90, 50, 50, 70, 70, 70, 70, 70, 70), weight=3)
+        self.tree_phases = self._make_tree(top, ("阶段", "命令数", "命令耗时"), (180, 60, 80), weight=1)
+        self.tree_spans = self._make_tree(paned, ("开始", "仓库", "阶段", "命令", "排队", "耗时", "返回码", "输出"),
+                                          (70, 160, 140, 120, 70, 70, 60, 70), weight=3)
+        self.after(self.REFRESH_MS, self._tick)
+
+    @staticmethod
+    def _make_tree(paned, headings, widths, weight):
+        frame = tk.Frame(paned)
+        paned.add(frame, weight=weight)
+        columns = tuple(f"c{i}" for i in range(len(headings)))
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=8)
+        for col, text, width in zip(columns, headings, widths):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor="w")
+        scrollbar = ttk.Scrollbar(frame, command=tree.yview)
+        tree.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        tree.pack(side="left", fill="both", expand=True)
+        return tree
+
+    @property
+    def tracer(self):
+        return self.app.engine.tracer
+
+    def _tick(self):
+        # 只在选项卡可见时刷新，且命令记录有变化才重建表格
+        if self.var_auto.get() and self.winfo_ismapped():
+            self.refresh()
+        self.after(self.REFRESH_MS, self._tick)
+
+    def refresh(self, force=False):
+        spans = self.tracer.spans()
+        seq = spans[-1].seq if spans else 0
+        if seq == self._last_seq and not force:
+            return
+        self._last_seq = seq
+
+        stats = self.tracer.stats()
+        self.tree_commands.delete(*self.tree_commands.get_children())
+        for s in stats:
+            self.tree_commands.insert("", tk.END, values=(
+                s.name, s.kind, s.count, s.errors, _format_seconds(s.mean), _format_seconds(s.percentile(50)),
+                _format_seconds(s.percentile(95)), _format_seconds(s.max), _format_seconds(s.mean_queue),
+                _format_size(s.bytes_out)))
+
+        self.tree_phases.delete(*self.tree_phases.get_children())
+        for phase, count, wall in self.tracer.phase_totals():
+            self.tree_phases.insert("", tk.END, values=(phase, count, _format_seconds(wall)))
+
+        self.tree_spans.delete(*self.tree_spans.get_children())
+        for span in reversed(spans[-self.RECENT_SPANS:]):
+            code = "取消" if span.code is None else span.code
+            self.tree_spans.insert("", tk.END, values=(
+                f"{span.queued - self.tracer.origin:.1f}s", span.repo, span.phase or "-", span.name,
+                _format_seconds(span.queue_wait), _format_seconds(span.wall), code, _format_size(span.bytes_out)))
+
+        total = sum(s.count for s in stats)
+        failed = sum(s.errors for s in stats)
+        busy = sum(s.total for s in stats)
+        ui = self.app.ui
+        self.lbl_summary.config(text=f"命令 {total} 条，失败 {failed}，命令耗时合计 {busy:.1f}s（并发执行，可能大于实际用时）"
+                                     f" · 界面更新合并 {ui.coalesced} 次，积压 {ui.backlog}，上一节拍 {ui.last_drain_ms:.1f}ms")
+
+    def clear(self):
+        self.tracer.clear()
+        self.refresh(force=True)
+
+    def export_trace(self):
+        path = filedialog.asksaveasfilename(title="导出 Chrome Trace", defaultextension=".json",
+                                            initialfile=time.strftime("updater-trace-%Y%m%d-%H%M%S.json"),
+                                            filetypes=[("JSON", "*.json"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            self.tracer.export(path)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出失败: {e}")
+            return
+        messagebox.showinfo("完成", f"已导出 {len(self.tracer.spans())} 条命令记录。\n"
+                                  f"可在 chrome://tracing 或 https://ui.perfetto.dev 中打开。\n{path}")
+
 
 # --- ComfyUI 本体管理 UI ---
 class CoreManagerFrame(tk.Frame, GitItemBase):
@@ -342,6 +761,7 @@ class CoreManagerFrame(tk.Frame, GitItemBase):
         tk.Frame.__init__(self, parent)
         self.app = app
         GitItemBase.__init__(self, app, "", "ComfyUI 本体")
+        self.versions = []
         
         self.create_widgets()
     
@@ -403,59 +823,56 @@ class CoreManagerFrame(tk.Frame, GitItemBase):
             return
         
         self.btn_check.config(state="disabled")
-        threading.Thread(target=self._async_check, daemon=True).start()
-
-    def _async_check(self):
-        text, color, is_update = self.check_status_base()
-        _, current_commit, _ = self.run_git(["log", "-1", "--format=%h - %s (%cd)", "--date=short"])
-        versions = self.fetch_versions_base()
+        self.app.engine.submit(self._async_check(), self.cancel_token)
+
+    @traced("core")
+    async def _async_check(self):
+        text, color, is_update = await self.check_status_async()
+        # 一次元数据查询同时提供下拉框、当前 Commit 与最近历史
+        versions = await self.fetch_versions_async(commit_limit=20)
+        commits = [v for v in versions if v.kind == VersionEntry.COMMIT]
+        current_commit = f"{commits[0].short_sha} - {commits[0].subject} ({commits[0].date})" if commits else ""
         has_req = self.check_requirements()
         
         # 获取版本更新记录（本地与远程的差异）
-        commit_log = self._fetch_commit_log()
+        commit_log = await self._fetch_commit_log(commits)
 
         def update_ui():
             self.lbl_status_large.config(text=text, fg=color)
             self.lbl_commit_info.config(text=f"当前Commit: {current_commit}")
-            self.combo_versions['values'] = versions
+            self.versions = versions
+            self.combo_versions['values'] = [v.label() for v in versions]
             if versions: self.combo_versions.current(0)
             self.btn_check.config(state="normal")
-            
-            if has_req:
-                self.btn_core_pip.config(state="normal")
-            else:
-                self.btn_core_pip.config(state="disabled", text="根目录无 requirements.txt")
+            self.update_dependency_state(has_req)
             
             # 更新Commit日志显示
             self._update_commit_log(commit_log)
         
-        self.app.root.after(0, update_ui)
+        self.app.ui.post(update_ui)
 
-    def _fetch_commit_log(self):
-        """获取本地与远程之间的Commit差异日志"""
+    async def _fetch_commit_log(self, recent_commits):
+        """获取本地与远程之间的Commit差异日志，recent_commits 为已取得的本地历史"""
         try:
-            # 获取当前分支名
-            code, branch_name, _ = self.run_git(["rev-parse", "--abbrev-ref", "HEAD"])
-            if code != 0 or not branch_name:
-                branch_name = "master"
-            
-            # 获取本地与远程的差异Commit（即将更新的内容）
-            code, ahead_log, _ = self.run_git(["log", f"HEAD..origin/{branch_name}", 
-                                               "--pretty=format:[%h] %s (%cd) - %an", "--date=short"])
-            
             log_content = ""
-            if code == 0 and ahead_log.strip():
-                log_content += f"═══ 待更新内容 (共{ahead_log.count(chr(10))+1}条) ═══\n{ahead_log}\n\n"
+            # 只有确实落后时才查询待更新的提交（即将更新的内容）
+            if self.behind_count:
+                reader = self.git_reader()
+                branch_name = reader.current_branch()
+                upstream = reader.upstream_ref(branch_name) if branch_name else "@{upstream}"
+                code, out, _ = await self.run_git_async(["log", f"HEAD..{upstream}", f"--format={COMMIT_LOG_FORMAT}", "--date=short"])
+                pending = parse_commit_log(out) if code == 0 else []
+                if pending:
+                    pending_text = "\n".join(c.log_line() for c in pending)
+                    log_content += f"═══ 待更新内容 (共{len(pending)}条) ═══\n{pending_text}\n\n"
             
-            # 获取最近的Commit历史（本地已安装的）
-            code, recent_log, _ = self.run_git(["log", "-20", 
-                                                "--pretty=format:[%h] %s (%cd) - %an", "--date=short"])
-            if code == 0 and recent_log.strip():
+            # 最近的Commit历史（本地已安装的）
+            if recent_commits:
                 if log_content:
                     log_content += "═══ 最近已安装的版本 ═══\n"
                 else:
                     log_content += "═══ 最近版本历史 ═══\n"
-                log_content += recent_log
+                log_content += "\n".join(c.log_line() for c in recent_commits)
             
             return log_content if log_content else "暂无版本记录"
         except Exception as e:
@@ -469,14 +886,25 @@ class CoreManagerFrame(tk.Frame, GitItemBase):
         self.commit_log_text.config(state="disabled")
 
     def on_execute(self):
-        selection = self.var_version.get()
-        if not selection: return
-        if messagebox.askyesno("风险提示", f"即将对 ComfyUI 本体执行:\n{selection}\n\n注意：如果要更新本体，最好先备份。确定继续吗？"):
+        index = self.combo_versions.current()
+        if index < 0 or index >= len(self.versions): return
+        version = self.versions[index]
+        if messagebox.askyesno("风险提示", f"即将对 ComfyUI 本体执行:\n{version.label()}\n\n注意：如果要更新本体，最好先备份。确定继续吗？"):
             self.btn_execute.config(state="disabled", text="执行中...")
-            threading.Thread(target=self._async_execute, args=(selection,), daemon=True).start()
-
-    def _async_execute(self, selection):
-        success, msg = self.do_update_logic(selection)
+            threading.Thread(target=self._async_execute, args=(version,), daemon=True).start()
+
+    def _track_progress(self, log):
+        def on_progress(log):
+            if log.state == OperationLog.RUNNING and log.phase:
+                text = log.progress_text()
+                self.app.ui.post(lambda: self.lbl_status_large.config(text=text, fg="blue"))
+        log.add_listener(on_progress)
+
+    def _async_execute(self, version):
+        log = self.app.new_operation_log(f"ComfyUI: {version.label()}")
+        self._track_progress(log)
+        success, msg = self.do_update_logic(version, log=log)
+        log.finish(success, msg)
         def post():
             self.btn_execute.config(state="normal", text="执行更新/回退")
             if success:
@@ -484,7 +912,24 @@ class CoreManagerFrame(tk.Frame, GitItemBase):
                 self.refresh_data()
             else:
                 messagebox.showerror("失败", msg)
-        self.app.root.after(0, post)
+        self.app.ui.post(post)
+
+    def update_dependency_state(self, has_req=None):
+        """按环境索引设置依赖按钮，只有确实缺少依赖（或无法判断）时才可点击"""
+        if self.btn_core_pip.cget("text") == "安装中...":
+            return
+        if has_req is None:
+            has_req = self.check_requirements()
+        if not has_req:
+            self.btn_core_pip.config(state="disabled", text="根目录无 requirements.txt")
+            return
+        deps = self.dependency_status()
+        if deps is None:
+            self.btn_core_pip.config(state="normal", text="安装/修复依赖 (pip install -r requirements.txt)")
+        elif deps.satisfied:
+            self.btn_core_pip.config(state="disabled", text=f"依赖已满足 ({deps.total} 项)")
+        else:
+            self.btn_core_pip.config(state="normal", text=f"安装依赖 ({deps.describe()})")
 
     def on_core_pip(self):
         if messagebox.askyesno("依赖修复", "即将对 ComfyUI 根目录执行 pip install -r requirements.txt。\n\n这可能需要一些时间，请耐心等待。"):
@@ -492,37 +937,50 @@ class CoreManagerFrame(tk.Frame, GitItemBase):
             threading.Thread(target=self._async_pip, daemon=True).start()
 
     def _async_pip(self):
-        success, msg = self.run_pip_install()
+        log = self.app.new_operation_log("安装依赖: ComfyUI")
+        self._track_progress(log)
+        success, msg = self.run_pip_install(log)
+        self.app.environment_index.ensure(self.app)
         def post():
             self.btn_core_pip.config(state="normal", text="安装/修复依赖")
+            self.update_dependency_state()
+            self.app.refresh_environment_index()
             if success:
-                messagebox.showinfo("成功", "本体依赖安装完成。")
+                messagebox.showinfo("成功", f"本体依赖安装完成。\n{msg[-500:]}")
             else:
                 messagebox.showerror("失败", f"安装出错:\n{msg}")
-        self.app.root.after(0, post)
+        self.app.ui.post(post)
 
 
 # --- 主程序类 ---
-class ComfyUpdaterApp:
+class ComfyUpdaterApp(UpdaterBase):
     def __init__(self, root):
+        super().__init__()
         self.root = root
         self.root.title("ComfyUI 版本管理器 👻CK👻 (Pro)")
         self.root.geometry("1150x800")
-
-        self.config = configparser.ConfigParser()
-        
-        # 默认值
-        self.git_exe = "git"
-        self.python_exe = "python"
-        self.comfyui_root = ""
-        self.nodes_path = ""
-        self.proxy_url = "" 
+        self.conflict_policy = "ask"
+        self.ui = TkBridge(root)
         
-        self.plugin_rows = []
+        self.plugin_records = []
+        self._scroll_job = None
+        self._cache_flush_job = None
+        self._index_thread = None           # 后台补全环境索引的线程
+        self._index_refresh_pending = False
+        self._index_failed_for = None       # 上次构建索引失败时的 python_exe
         
         # 加载配置
         self.load_config()
 
+        # 插件状态检查调度器
+        self.check_scheduler = CheckScheduler(self.engine, self.check_concurrency)
+        # 插件状态缓存
+        self.status_cache = StatusCache(self.cache_path, self.cache_ttl_minutes * 60)
+        # custom_nodes 目录监视（其他工具安装/删除插件或外部 git 操作时自动同步）
+        self.nodes_watcher = NodesWatcher(lambda: self.nodes_path, self._on_nodes_changed,
+                                          self.watch_interval_seconds, self._on_watcher_stats)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # 1. 顶部设置面板 (重写，支持输入框和选择)
         self.setup_settings_ui()
 
@@ -536,12 +994,23 @@ class ComfyUpdaterApp:
         
         plugin_toolbar = tk.Frame(self.tab_plugins)
         plugin_toolbar.pack(fill="x", pady=5)
+        tk.Button(plugin_toolbar, text="强制全部刷新", command=lambda: self.refresh_plugin_list(force=True)).pack(side="right", padx=5)
         tk.Button(plugin_toolbar, text="刷新列表", command=self.refresh_plugin_list).pack(side="right", padx=5)
         self.btn_update_all = tk.Button(plugin_toolbar, text="一键更新所有插件", command=self.update_all_plugins, bg="#c8e6c9")
         self.btn_update_all.pack(side="right", padx=5)
-
-        self.list_container = ScrollableFrame(self.tab_plugins)
-        self.list_container.pack(fill="both", expand=True, padx=10, pady=5)
+        self.btn_pip_all = tk.Button(plugin_toolbar, text="安装全部依赖", command=self.install_all_requirements, bg="#e3f2fd")
+        self.btn_pip_all.pack(side="right", padx=5)
+        tk.Button(plugin_toolbar, text="保存快照", command=self.save_snapshot_file).pack(side="left", padx=5)
+        self.btn_restore = tk.Button(plugin_toolbar, text="还原快照", command=self.restore_snapshot_file)
+        self.btn_restore.pack(side="left", padx=5)
+        self.btn_profile = tk.Button(plugin_toolbar, text="分析启动耗时", command=self.profile_plugins)
+        self.btn_profile.pack(side="left", padx=5)
+        self.var_sort_import = tk.BooleanVar(value=False)
+        tk.Checkbutton(plugin_toolbar, text="按导入耗时排序", variable=self.var_sort_import,
+                       command=self.refresh_plugin_list).pack(side="left", padx=5)
+
+        self.plugin_view = PluginListView(self.tab_plugins, self, on_scroll=self._on_plugin_list_scroll)
+        self.plugin_view.pack(fill="both", expand=True, padx=10, pady=5)
 
         # Tab 2: 本体管理
         self.tab_core = tk.Frame(self.notebook)
@@ -550,9 +1019,25 @@ class ComfyUpdaterApp:
         self.core_manager = CoreManagerFrame(self.tab_core, self)
         self.core_manager.pack(fill="both", expand=True)
 
+        # Tab 3: 操作日志（git / pip 的实时输出）
+        self.tab_logs = tk.Frame(self.notebook)
+        self.notebook.add(self.tab_logs, text=" 📜 操作日志 ")
+        self.log_panel = OperationLogPanel(self.tab_logs)
+        self.log_panel.pack(fill="both", expand=True)
+
+        # Tab 4: 诊断
+        self.tab_diagnostics = tk.Frame(self.notebook)
+        self.notebook.add(self.tab_diagnostics, text=" 🩺 诊断 ")
+        self.diagnostics_panel = DiagnosticsPanel(self.tab_diagnostics, self)
+        self.diagnostics_panel.pack(fill="both", expand=True)
+
         # 3. 底部状态栏
-        self.status_bar = tk.Label(root, text="就绪", bd=1, relief=tk.SUNKEN, anchor="w")
-        self.status_bar.pack(side="bottom", fill="x")
+        status_frame = tk.Frame(root)
+        status_frame.pack(side="bottom", fill="x")
+        self.watch_status = tk.Label(status_frame, text="目录监视: 关闭", bd=1, relief=tk.SUNKEN, anchor="e")
+        self.watch_status.pack(side="right")
+        self.status_bar = tk.Label(status_frame, text="就绪", bd=1, relief=tk.SUNKEN, anchor="w")
+        self.status_bar.pack(side="left", fill="x", expand=True)
 
         # 初始化路径检查
         if self.comfyui_root:
@@ -593,51 +1078,33 @@ class ComfyUpdaterApp:
         self.entry_proxy.grid(row=3, column=1, padx=5, pady=2)
         tk.Button(top_frame, text="应用配置", bg="#ffecb3", command=self.apply_config_from_ui).grid(row=3, column=2, padx=5)
 
-    def load_config(self):
-        if not os.path.exists(CONFIG_FILE): return
+    def save_config(self):
+        """将当前内存中的变量写入 config.ini"""
         try:
-            self.config.read(CONFIG_FILE, encoding='utf-8')
-            if 'Settings' in self.config:
-                self.git_exe = self.config['Settings'].get('git_path', 'git').strip()
-                self.python_exe = self.config['Settings'].get('python_path', 'python').strip()
-                
-                p = self.config['Settings'].get('comfyui_root_path', '').strip()
-                if p:
-                    # 如果是相对路径，转为绝对路径
-                    if not os.path.isabs(p):
-                        p = os.path.abspath(os.path.join(os.getcwd(), p))
-                    self.comfyui_root = p
-            
-            if 'Network' in self.config:
-                self.proxy_url = self.config['Network'].get('https_proxy', '').strip()
+            self.write_config()
         except Exception as e:
-            print(f"Load config error: {e}")
+            messagebox.showerror("错误", f"保存配置文件失败: {e}")
 
-    def save_config(self):
-        """将当前内存中的变量写入 config.ini"""
-        if 'Settings' not in self.config: self.config['Settings'] = {}
-        if 'Network' not in self.config: self.config['Network'] = {}
+    def confirm_discard_changes(self, display_name):
+        """在主线程弹窗询问是否丢弃本地修改（可从工作线程调用）"""
+        if threading.current_thread() is threading.main_thread():
+            return self._ask_discard_changes(display_name)
+        answer = {}
+        done = threading.Event()
 
-        self.config['Settings']['git_path'] = self.git_exe
-        self.config['Settings']['python_path'] = self.python_exe
-        
-        # 尝试存相对路径以便便携，如果不在同级目录则存绝对路径
-        try:
-            rel_path = os.path.relpath(self.comfyui_root, os.getcwd())
-            if ".." in rel_path and not rel_path.startswith(".."): # 简单的判断
-                 self.config['Settings']['comfyui_root_path'] = self.comfyui_root
-            else:
-                 self.config['Settings']['comfyui_root_path'] = rel_path
-        except:
-            self.config['Settings']['comfyui_root_path'] = self.comfyui_root
+        def ask():
+            try:
+                answer["value"] = self._ask_discard_changes(display_name)
+            finally:
+                done.set()
 
-        self.config['Network']['https_proxy'] = self.proxy_url
+        self.ui.post(ask)
+        done.wait()
+        return answer.get("value", False)
 
-        try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                self.config.write(f)
-        except Exception as e:
-            messagebox.showerror("错误", f"保存配置文件失败: {e}")
+    def _ask_discard_changes(self, display_name):
+        return messagebox.askyesno("冲突解决",
+            f"检测到 {display_name} 有本地修改导致更新失败。\n\n是否【丢弃本地修改】并强制更新？")
 
     # --- UI 事件处理 ---
     def browse_root(self):
@@ -679,8 +1146,7 @@ class ComfyUpdaterApp:
 
     def set_root_path(self, root_path, update_ui=True):
         if not root_path: return
-        self.comfyui_root = root_path
-        self.nodes_path = os.path.join(root_path, "custom_nodes")
+        self.set_paths(root_path)
         
         # 1. 刷新本体 Tab
         self.core_manager.set_path(self.comfyui_root)
@@ -688,76 +1154,382 @@ class ComfyUpdaterApp:
         # 2. 刷新插件 Tab
         if os.path.exists(self.nodes_path):
             self.refresh_plugin_list()
+            if self.watch_interval_seconds > 0:
+                self.nodes_watcher.start()
+                self.watch_status.config(text=f"目录监视: 每 {self.watch_interval_seconds:g}s")
         else:
             if update_ui: # 避免初始化时弹窗
                 pass 
 
-    def run_cmd(self, cmd_args, cwd, show_window=False):
-        """执行命令，统一处理代理和环境
-        
-        Args:
-            cmd_args: 命令参数列表
-            cwd: 工作目录
-            show_window: 是否显示终端窗口（用于pip安装等需要用户查看进度的操作）
-        """
-        try:
-            startupinfo = None
-            # 默认隐藏窗口，但show_window=True时显示（用于pip安装）
-            if os.name == 'nt' and not show_window:
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            
-            env = os.environ.copy()
-            env["GIT_TERMINAL_PROMPT"] = "0"
-            env["GCM_INTERACTIVE"] = "never"
-            if self.proxy_url:
-                env["http_proxy"] = self.proxy_url
-                env["https_proxy"] = self.proxy_url
-
-            result = subprocess.run(
-                cmd_args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                text=True, encoding='utf-8', errors='ignore', 
-                startupinfo=startupinfo, env=env, timeout=300 # pip 可能比较慢，超时设长一点
-            )
-            return result.returncode, result.stdout.strip(), result.stderr.strip()
-        except Exception as e:
-            return -1, "", str(e)
-
-    def refresh_plugin_list(self):
-        for widget in self.list_container.scrollable_frame.winfo_children():
-            widget.destroy()
-        self.plugin_rows.clear()
-
-        if not os.path.exists(self.nodes_path): return
+    def refresh_plugin_list(self, force=False):
+        """对比 custom_nodes 目录与现有记录：只为新目录建行、移除已删除的目录，
+        HEAD/refs 有变化的仓库重新计算状态；force=True 时全部重建并重新 fetch"""
+        folders = self.list_plugin_folders()
+        existing = {record.display_name: record for record in self.plugin_records}
+        same_root = all(os.path.dirname(r.full_path) == self.nodes_path for r in self.plugin_records)
+        if force or not same_root:
+            # 丢弃旧行尚未开始的检查任务，正在执行的任务通过 cancelled 标记中止
+            self.check_scheduler.cancel_all()
+            for record in self.plugin_records:
+                record.cancel()
+            existing = {}
+
+        records = []
+        for index, folder in enumerate(folders):
+            record = existing.pop(folder, None)
+            if record is None:
+                record = PluginRecord(self, folder)
+                # 按列表顺序排队，靠前（首屏可见）的行先检查
+                record.start(priority=index, force=force)
+            else:
+                record.recheck_if_changed(priority=index)
+            records.append(record)
+        for record in existing.values():
+            record.cancel()
+        if self.var_sort_import.get():
+            records.sort(key=_import_sort_key)
+
+        self.plugin_records = records
+        self.plugin_view.set_records(records, keep_position=not force and same_root)
+        self.refresh_environment_index()
+
+    def refresh_environment_index(self, automatic=False):
+        """后台确认环境索引收录了本体与所有插件的需求（必要时调用一次 python_exe），
+        完成后刷新各行的依赖按钮；automatic=True 时，同一 Python 上次构建失败就不再重试"""
+        if automatic and self._index_failed_for == self.python_exe:
+            return
+        if self._index_thread is not None and self._index_thread.is_alive():
+            self._index_refresh_pending = True
+            return
 
-        folders = [f for f in os.listdir(self.nodes_path) if os.path.isdir(os.path.join(self.nodes_path, f))]
-        
-        for folder in folders:
-            if folder.startswith("__") or folder.startswith("."): continue
-            row = PluginRow(self.list_container.scrollable_frame, self, folder)
-            self.plugin_rows.append(row)
+        def work():
+            while True:
+                self._index_refresh_pending = False
+                lines = [line for ls in collect_requirement_lines(self).values() for line in ls]
+                ok = self.environment_index.ensure(self, lines) is not None
+                self._index_failed_for = None if ok else self.python_exe
+                if not self._index_refresh_pending:
+                    break
+            self.ui.post(self._apply_dependency_states)
+
+        self._index_thread = threading.Thread(target=work, daemon=True)
+        self._index_thread.start()
+
+    def _apply_dependency_states(self):
+        for record in self.plugin_records:
+            if not record.cancelled:
+                record.update_dependency_state()
+                record.refresh_view()
+        self.core_manager.update_dependency_state()
+
+    def remove_plugin_record(self, record):
+        record.cancel()
+        if record in self.plugin_records:
+            self.plugin_records.remove(record)
+        self.plugin_view.set_records(self.plugin_records, keep_position=True)
+
+    def schedule_cache_flush(self):
+        """合并多行的写入请求，稍后统一把状态缓存写回磁盘"""
+        if self._cache_flush_job is None:
+            self._cache_flush_job = self.root.after(2000, self._flush_cache)
+
+    def _flush_cache(self):
+        self._cache_flush_job = None
+        self.status_cache.flush()
+        self.remote_metadata.flush()
+
+    def _on_nodes_changed(self, added, removed, changed):
+        """监视线程回调，转到主线程处理"""
+        self.ui.post(lambda: self._apply_nodes_delta(added, removed, changed))
+
+    def _apply_nodes_delta(self, added, removed, changed):
+        for name in removed:
+            self.status_cache.remove(os.path.join(self.nodes_path, name))
+        if added or removed:
+            # 增量刷新：只为新目录建行、移除已删除的目录
+            self.refresh_plugin_list()
+            return
+        for index, record in enumerate(self.plugin_records):
+            if record.display_name in changed:
+                record.recheck_if_changed(priority=index)
+
+    def _on_watcher_stats(self, watcher):
+        text = (f"目录监视: 每 {watcher.interval:g}s · 上次扫描 {watcher.last_wall_ms:.1f}ms"
+                f" (CPU {watcher.last_cpu_ms:.1f}ms) · 平均 CPU {watcher.cpu_percent:.2f}%")
+        self.ui.post(lambda: self.watch_status.config(text=text))
+
+    def new_operation_log(self, title):
+        log = super().new_operation_log(title)
+        self.ui.post(self.log_panel.add, log)
+        return log
+
+    def on_close(self):
+        self.nodes_watcher.stop()
+        self.check_scheduler.cancel_all()
+        self.engine.stop()
+        self.status_cache.flush()
+        self.remote_metadata.flush()
+        self.root.destroy()
+
+    def _on_plugin_list_scroll(self):
+        """滚动时合并事件，稍后把可视区域内的行提到检查队列最前"""
+        if self._scroll_job is not None:
+            self.root.after_cancel(self._scroll_job)
+        self._scroll_job = self.root.after(150, self._promote_visible_rows)
+
+    def _promote_visible_rows(self):
+        self._scroll_job = None
+        self.check_scheduler.promote(self.plugin_view.visible_records())
 
     def update_all_plugins(self):
-        targets = [row for row in self.plugin_rows if row.is_update_available]
+        targets = [r for r in self.plugin_records if r.is_update_available and r.behind_count > 0]
         if not targets:
             messagebox.showinfo("提示", "当前没有检测到需要更新的插件。")
             return
 
-        if not messagebox.askyesno("批量更新", f"检测到 {len(targets)} 个插件有新版本。\n是否开始批量更新？"):
+        total_behind = sum(r.behind_count for r in targets)
+        if not messagebox.askyesno("批量更新", f"检测到 {len(targets)} 个插件有新版本（共落后 {total_behind} 个提交）。\n是否开始批量更新？"):
             return
 
         self.btn_update_all.config(state="disabled", text="正在更新...")
-        
-        def run_batch():
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                for row in targets:
-                    row.btn_action.config(state="disabled", text="队列中...")
-                    executor.submit(row.do_update, "最新版本 (Latest)", True)
-            
-            self.root.after(0, lambda: self.btn_update_all.config(state="normal", text="一键更新所有插件"))
-            self.root.after(0, lambda: messagebox.showinfo("完成", "批量更新流程已结束。"))
+        for record in targets:
+            record.action_state, record.action_text = "disabled", "队列中..."
+            record.status_text, record.status_color = "等待获取...", "blue"
+            record.refresh_view()
+
+        def on_event(result, stage):
+            # 事件循环线程中调用，转到界面线程更新对应行
+            self.ui.post(self._on_update_event, result, stage, key=(result.item, "update"))
+
+        log = self.new_operation_log(f"一键更新 {len(targets)} 个插件")
+        pipeline = UpdatePipeline(self, targets, on_event=on_event, log=log)
+        future = self.engine.submit(pipeline.run())
+
+        def finished(future):
+            # 关闭时停止命令引擎会取消任务，此时 exception() 会抛出 CancelledError
+            log.finish(not future.cancelled() and future.exception() is None and all(r.ok for r in pipeline.results))
+            self.ui.post(self._show_update_summary, pipeline)
+        future.add_done_callback(finished)
+
+    def _on_update_event(self, result, stage):
+        record = result.item
+        if record.cancelled:
+            return
+        if stage == "fetch":
+            if result.fetch_state == "ok":
+                record.status_text, record.status_color = "已获取，等待快进...", "blue"
+            else:
+                record.status_text, record.status_color = result.message or "获取失败", "red"
+                record.action_state, record.action_text = "normal", "执行操作"
+        else:
+            record.action_state, record.action_text = "normal", "执行操作"
+            if result.merge_state == "updated":
+                record.status_text, record.status_color = f"已更新 (+{result.behind})", "green"
+            elif result.merge_state == "up-to-date":
+                record.status_text, record.status_color = "最新版本", "green"
+            elif result.merge_state == "failed":
+                record.status_text, record.status_color = "更新失败", "red"
+            else:
+                record.status_text, record.status_color = result.message, "orange"
+        record.refresh_view()
+
+    def _show_summary_window(self, title, headings, widths, rows, footer):
+        """批量操作结束后以表格列出每个仓库的结果，footer 为各阶段吞吐等汇总文字"""
+        win = tk.Toplevel(self.root)
+        win.title(title)
+        win.geometry("900x450")
+        columns = tuple(f"c{i}" for i in range(len(headings)))
+        tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col, text, width in zip(columns, headings, widths):
+            tree.heading(col, text=text)
+            tree.column(col, width=width, anchor="w")
+        for row in rows:
+            tree.insert("", tk.END, values=row)
+        tree.pack(fill="both", expand=True, padx=5, pady=5)
+        tk.Label(win, text=footer, justify="left", anchor="w").pack(fill="x", padx=5, pady=5)
+        tk.Button(win, text="关闭", command=win.destroy).pack(pady=5)
+
+    def _show_update_summary(self, pipeline):
+        self.btn_update_all.config(state="normal", text="一键更新所有插件")
+        labels = {"ok": "成功", "failed": "失败", "skipped": "跳过", "pending": "-",
+                  "updated": "已更新", "up-to-date": "已是最新"}
+        rows = [(r.item.display_name, labels[r.fetch_state], labels[r.merge_state], r.behind,
+                 f"{r.fetch_seconds + r.merge_seconds:.2f}s", r.message) for r in pipeline.results]
+        stats = "\n".join(stage.summary() for stage in pipeline.stages.values())
+        updated = sum(1 for r in pipeline.results if r.merge_state == "updated")
+        failed = sum(1 for r in pipeline.results if not r.ok)
+        stats += f"\n总计: 更新 {updated}, 失败 {failed}, 总用时 {pipeline.elapsed:.2f}s"
+        self._show_summary_window("批量更新结果", ("插件", "获取", "快进", "提交数", "耗时", "信息"),
+                                  (200, 60, 80, 60, 70, 400), rows, stats)
+
+    # --- 快照：保存 / 还原整个安装的版本状态 ---
+    def save_snapshot_file(self):
+        if not self.comfyui_root or not os.path.isdir(self.comfyui_root):
+            messagebox.showerror("错误", "请先设置 ComfyUI 根目录。")
+            return
+        path = filedialog.asksaveasfilename(title="保存快照", defaultextension=".json",
+                                            initialfile=time.strftime("snapshot-%Y%m%d-%H%M%S.json"),
+                                            filetypes=[("JSON", "*.json"), ("All Files", "*.*")])
+        if not path:
+            return
+        snapshot = capture_snapshot(self)
+        try:
+            save_snapshot(path, snapshot)
+        except OSError as e:
+            messagebox.showerror("错误", f"保存快照失败: {e}")
+            return
+        messagebox.showinfo("完成", f"已记录 {len(snapshot['repos'])} 个仓库的版本。\n{path}")
+
+    def restore_snapshot_file(self):
+        path = filedialog.askopenfilename(title="选择快照文件", filetypes=[("JSON", "*.json"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            snapshot = load_snapshot(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"读取快照失败: {e}")
+            return
+        results = diff_snapshot(self, snapshot)
+        changes = [r for r in results if r.action in r.CHANGES]
+        problems = [r for r in results if not r.ok]
+        if not changes:
+            extra = "\n" + "\n".join(f"{r.item.display_name}: {r.describe()}" for r in problems) if problems else ""
+            messagebox.showinfo("提示", f"当前状态与快照一致，无需还原。{extra}")
+            return
+        lines = [f"{r.item.display_name}: {r.describe()}" for r in changes[:15]]
+        if len(changes) > 15:
+            lines.append(f"... 等共 {len(changes)} 个仓库")
+        if not messagebox.askyesno("还原快照", f"快照时间: {snapshot.get('created_at', '未知')}\n"
+                                   f"以下仓库将被切换到快照中的版本：\n\n" + "\n".join(lines)):
+            return
+
+        self.btn_restore.config(state="disabled", text="还原中...")
+        log = self.new_operation_log(f"还原快照: {os.path.basename(path)}")
+        restore = SnapshotRestore(self, results, log=log)
+        future = self.engine.submit(restore.run())
+
+        def finished(future):
+            log.finish(not future.cancelled() and future.exception() is None and all(r.ok for r in restore.pending))
+            self.ui.post(self._show_restore_summary, restore)
+        future.add_done_callback(finished)
+
+    def _show_restore_summary(self, restore):
+        self.btn_restore.config(state="normal", text="还原快照")
+        labels = {"restored": "已还原", "failed": "失败", "skipped": "跳过", "pending": "-"}
+        rows = [(r.item.display_name, labels[r.state], "是" if r.fetched else "否",
+                 f"{r.seconds:.2f}s", r.message or r.describe()) for r in restore.pending]
+        stats = "\n".join(stage.summary() for stage in restore.stages.values())
+        restored = sum(1 for r in restore.pending if r.state == "restored")
+        stats += f"\n总计: 还原 {restored}, 失败 {len(restore.pending) - restored}, 总用时 {restore.elapsed:.2f}s"
+        self._show_summary_window("快照还原结果", ("仓库", "结果", "重新获取", "耗时", "信息"),
+                                  (200, 70, 70, 70, 450), rows, stats)
+        # 只会为新克隆的插件建行，其余行按 HEAD/refs 变化重新检查
+        self.core_manager.refresh_data()
+        self.refresh_plugin_list()
+
+    def profile_plugins(self):
+        """在独立的 Python 进程中逐个导入插件，找出拖慢 ComfyUI 启动的插件"""
+        records = [r for r in self.plugin_records if not r.cancelled]
+        if not records:
+            return
+        if not messagebox.askyesno("分析启动耗时",
+                                   f"将使用 {self.python_exe} 在独立进程中导入 {len(records)} 个插件"
+                                   f"（同时 {self.profile_concurrency} 个，单个超时 {self.profile_timeout}s）。\n"
+                                   "插件的导入代码会被执行，是否继续？"):
+            return
+        self.btn_profile.config(state="disabled", text="分析中...")
+
+        def on_event(profile):
+            # 事件循环线程中调用，转到界面线程更新对应行
+            record = by_path.get(profile.path)
+            if record is not None:
+                self.ui.post(self._on_profile_event, record, profile, key=(record, "profile"))
+
+        by_path = {r.full_path: r for r in records}
+        profiler = ImportProfiler(self, records, on_event=on_event)
+        future = self.engine.submit(profiler.run())
+
+        def finished(future):
+            self.ui.post(self._show_profile_summary, profiler, "已取消" if future.cancelled() else future.exception())
+        future.add_done_callback(finished)
+
+    def _on_profile_event(self, record, profile):
+        if record.cancelled:
+            return
+        record.import_profile = profile
+        record.refresh_view()
+
+    def _show_profile_summary(self, profiler, error):
+        self.btn_profile.config(state="normal", text="分析启动耗时")
+        if error is not None:
+            messagebox.showerror("错误", f"分析失败: {error}")
+            return
+        labels = {"ok": "成功", "failed": "失败", "timeout": "超时", "skipped": "跳过", "pending": "-"}
+        rows = []
+        for p in profiler.profiles:
+            if p.status == "skipped":
+                continue
+            top = ", ".join(f"{m} {s:.2f}s" for m, s in p.top_modules[:3])
+            note = p.regression_text() or (p.error.strip().splitlines() or [""])[-1]
+            rows.append((p.name, labels[p.status], f"{p.seconds:.2f}s", f"{p.peak_mb:.0f}MB", f"+{p.delta_mb:.0f}MB",
+                         top, note))
+        total = sum(p.seconds for p in profiler.profiles if p.status == "ok")
+        failed = sum(1 for p in profiler.profiles if p.status in ("failed", "timeout"))
+        slower = sum(1 for p in profiler.profiles if p.regression)
+        footer = (f"导入耗时合计 {total:.2f}s（单独导入时，插件共用的依赖会被重复计算），失败 {failed}，"
+                  f"比上次明显变慢 {slower}，分析用时 {profiler.elapsed:.2f}s")
+        self._show_summary_window("插件导入耗时", ("插件", "结果", "导入耗时", "峰值内存", "增加内存", "最慢的模块", "说明"),
+                                  (180, 50, 70, 70, 70, 250, 300), rows, footer)
+        # 列表按导入耗时排序，最慢的插件排在最前
+        self.var_sort_import.set(True)
+        self.refresh_plugin_list()
+
+    def install_all_requirements(self):
+        """合并本体与所有插件的 requirements.txt，一次 pip install 统一解析"""
+        if not self.nodes_path:
+            return
+        self.btn_pip_all.config(state="disabled", text="分析依赖...")
+
+        def reset_button():
+            self.btn_pip_all.config(state="normal", text="安装全部依赖")
+
+        def run():
+            plan = collect_dependency_plan(self)
+            self.ui.post(lambda: confirm(plan))
+
+        def confirm(plan):
+            if not plan.merged:
+                reset_button()
+                messagebox.showinfo("提示", "没有找到需要安装的依赖。")
+                return
+            message = plan.summary()
+            if plan.conflicts:
+                message += "\n\n冲突的包将只保留 ComfyUI 本体的约束（本体未声明则不限版本），由 pip 统一选择。"
+            if not messagebox.askyesno("安装全部依赖", message + "\n\n是否执行一次合并的 pip install？"):
+                reset_button()
+                return
+            self.btn_pip_all.config(text="安装中...")
+            threading.Thread(target=install, args=(plan,), daemon=True).start()
+
+        def install(plan):
+            merged_path = plan.write_temp_file()
+            try:
+                log = self.new_operation_log("安装全部依赖")
+                log.append(plan.summary())
+                success, msg = self.install_requirements(merged_path, "全部插件与本体", self.comfyui_root, log, remember=False)
+            finally:
+                try:
+                    os.remove(merged_path)
+                except OSError:
+                    pass
+            self.ui.post(reset_button)
+            self.ui.post(self.refresh_environment_index)
+            if success:
+                self.ui.post(lambda: messagebox.showinfo("完成", f"已处理 {plan.package_count} 个包的依赖：{msg}"))
+            else:
+                self.ui.post(lambda: messagebox.showerror("失败", msg))
 
-        threading.Thread(target=run_batch, daemon=True).start()
+        threading.Thread(target=run, daemon=True).start()
 
 if __name__ == "__main__":
     root = tk.Tk()
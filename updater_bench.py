@@ -0,0 +1,400 @@
+"""性能基准：生成可复现的合成 custom_nodes 插件群，无界面计时（不导入 tkinter，只需要 git，不访问网络）
+
+每个插件有一个本地裸仓库作为 origin，提交历史、标签数量与"落后/分叉/有本地修改"的比例均可配置，
+相同参数与 seed 生成的插件群完全一致。每轮依次计时：
+    cold-start   删除状态缓存后启动：列出插件目录，逐个按本地 refs 计算首屏状态
+    warm-start   缓存有效时再次启动：只校验缓存指纹，不启动 git 进程
+    check-all    fetch 并检查所有插件（与命令行 check 相同）
+    update-all   两段流水线更新所有落后的插件
+    restore      按生成时的快照还原，插件群回到初始状态，下一轮可以直接复用
+结果写成 JSON，可用 --compare 与之前的结果对比：
+    python updater_bench.py --repos 10 100 --repeat 3 --output bench.json
+    python updater_bench.py --repos 1000 --history 200 --tags 20 --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from updater_cli import HeadlessUpdater, cmd_check
+from updater_core import CACHE_FILE, REMOTE_CACHE_FILE, UpdatePipeline
+from updater_snapshot import SnapshotRestore, capture_snapshot, diff_snapshot, load_snapshot, save_snapshot
+
+BENCH_VERSION = 1
+SCENARIOS = ("cold-start", "warm-start", "check-all", "update-all", "restore")
+MANIFEST_FILE = "fleet.json"
+SNAPSHOT_FILE = "initial.lock.json"
+# 固定作者与时间，保证同样的参数生成同样的 SHA
+BASE_TIME = 1700000000
+GIT_IDENTITY = {
+    "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.invalid",
+    "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.invalid",
+}
+
+
+# --- 生成插件群 ---
+class FleetSpec:
+    """插件群参数；fingerprint 相同的目录可以直接复用"""
+    FIELDS = ("repos", "history", "tags", "behind", "behind_ratio", "diverged_ratio", "dirty_ratio", "seed")
+
+    def __init__(self, repos, history=50, tags=5, behind=3, behind_ratio=0.3, diverged_ratio=0.05,
+                 dirty_ratio=0.05, seed=1):
+        self.repos = repos
+        self.history = max(history, behind + 1)
+        self.tags = min(tags, self.history)
+        self.behind = behind
+        self.behind_ratio = behind_ratio
+        self.diverged_ratio = diverged_ratio
+        self.dirty_ratio = dirty_ratio
+        self.seed = seed
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def layout(self):
+        """按 seed 决定每个插件的初始状态：0 与上游一致，或落后若干提交，以及是否分叉、是否有本地修改"""
+        rng = random.Random(self.seed)
+        plan = []
+        for index in range(self.repos):
+            behind = self.behind if rng.random() < self.behind_ratio else 0
+            plan.append({
+                "name": f"Node{index:04d}",
+                "behind": behind,
+                "diverged": rng.random() < self.diverged_ratio,
+                "dirty": rng.random() < self.dirty_ratio,
+            })
+        return plan
+
+
+def _git(args, cwd=None, stdin=None):
+    env = dict(os.environ, **GIT_IDENTITY)
+    env["GIT_TERMINAL_PROMPT"] = "0"
+    result = subprocess.run(["git"] + args, cwd=cwd, input=stdin, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} 失败: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout.decode("utf-8", "replace")
+
+
+def _history_stream(name, spec):
+    """git fast-import 输入：history 个提交，标签均匀分布，最后一个标签落在最新提交上"""
+    tag_at = {}
+    for k in range(spec.tags):
+        tag_at[(k + 1) * spec.history // spec.tags] = f"v0.{k + 1}.0"
+    lines = []
+    for i in range(1, spec.history + 1):
+        message = f"{name}: change {i}\n".encode("utf-8")
+        content = (f"# {name} revision {i}\n" + f"VALUE_{i % 8} = {i}\n" * 8).encode("utf-8")
+        lines.append(f"commit refs/heads/main\nmark :{i}\n"
+                     f"committer bench <bench@example.invalid> {BASE_TIME + i * 3600} +0000\n"
+                     f"data {len(message)}\n".encode("utf-8") + message)
+        if i == 1:
+            init = b"NODE_CLASS_MAPPINGS = {}\n"
+            lines.append(f"M 644 inline __init__.py\ndata {len(init)}\n".encode("utf-8") + init)
+        lines.append(f"M 644 inline nodes_{i % 8}.py\ndata {len(content)}\n".encode("utf-8") + content + b"\n")
+        if i in tag_at:
+            lines.append(f"reset refs/tags/{tag_at[i]}\nfrom :{i}\n\n".encode("utf-8"))
+    return b"".join(lines)
+
+
+def _make_repo(origins, target, name, spec, state):
+    origin = os.path.join(origins, f"{name}.git")
+    _git(["init", "-q", "--bare", "-b", "main", origin])
+    _git(["fast-import", "--quiet"], cwd=origin, stdin=_history_stream(name, spec))
+    _git(["clone", "-q", origin, target])
+    if state["behind"]:
+        _git(["reset", "-q", "--hard", f"HEAD~{state['behind']}"], cwd=target)
+    if state["diverged"]:
+        with open(os.path.join(target, "local_patch.py"), "w", encoding="utf-8") as f:
+            f.write("LOCAL = True\n")
+        _git(["add", "local_patch.py"], cwd=target)
+        _git(["commit", "-q", "-m", "local patch", "--date", str(BASE_TIME)], cwd=target)
+    if state["dirty"]:
+        with open(os.path.join(target, "__init__.py"), "a", encoding="utf-8") as f:
+            f.write("# edited locally\n")
+
+
+class Fleet:
+    """磁盘上的一个插件群：origins/ 存放裸仓库，ComfyUI/custom_nodes/ 存放插件"""
+    def __init__(self, path, spec):
+        self.path = os.path.abspath(path)
+        self.spec = spec
+        self.build_seconds = 0.0
+        self.reused = False
+
+    @property
+    def config_path(self):
+        return os.path.join(self.path, "config.ini")
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.path, SNAPSHOT_FILE)
+
+    def _manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def prepare(self, rebuild=False, jobs=None):
+        """参数与已有插件群一致时复用（先按快照还原），否则重新生成"""
+        manifest = self._manifest()
+        if not rebuild and manifest and manifest.get("spec") == self.spec.to_dict() \
+                and manifest.get("version") == BENCH_VERSION and os.path.exists(self.snapshot_path):
+            self.reused = True
+            self.build_seconds = manifest.get("build_seconds", 0.0)
+            scenario_restore(self, jobs)[1].engine.stop()
+            return self
+        start = time.perf_counter()
+        self.build(jobs)
+        self.build_seconds = round(time.perf_counter() - start, 4)
+        with open(os.path.join(self.path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": BENCH_VERSION, "spec": self.spec.to_dict(), "build_seconds": self.build_seconds},
+                      f, indent=2)
+        return self
+
+    def build(self, jobs=None):
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        origins = os.path.join(self.path, "origins")
+        root = os.path.join(self.path, "ComfyUI")
+        nodes = os.path.join(root, "custom_nodes")
+        os.makedirs(origins)
+
+        core = FleetSpec(0, history=self.spec.history, tags=self.spec.tags, seed=self.spec.seed)
+        _make_repo(origins, root, "ComfyUI", core, {"behind": 0, "diverged": False, "dirty": False})
+        os.makedirs(nodes)
+        layout = self.spec.layout()
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 4) as executor:
+            futures = [executor.submit(_make_repo, origins, os.path.join(nodes, state["name"]), state["name"],
+                                       self.spec, state) for state in layout]
+            for future in futures:
+                future.result()
+
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            f.write(f"[Settings]\ngit_path = git\npython_path = {sys.executable}\ncomfyui_root_path = ComfyUI\n\n"
+                    f"[Performance]\ncheck_concurrency = {jobs or 8}\n")
+        save_snapshot(self.snapshot_path, capture_snapshot(self.updater()))
+
+    def updater(self, jobs=None):
+        return HeadlessUpdater(self.config_path, jobs=jobs)
+
+    def clear_caches(self):
+        for name in (CACHE_FILE, REMOTE_CACHE_FILE):
+            path = os.path.join(self.path, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# --- 场景 ---
+def _start(fleet, jobs):
+    """启动时的首屏：有效缓存直接使用，缓存缺失时按本地 refs 计算状态（不 fetch）"""
+    updater = fleet.updater(jobs)
+    hits = 0
+    try:
+        items = updater.items()
+        misses = [item for item in items if updater.status_cache.get(item.full_path) is None]
+        hits = len(items) - len(misses)
+
+        def first_paint(item):
+            updater.remember_status(item, item.check_status_base(False))
+        updater.map_parallel(first_paint, misses)
+        updater.status_cache.flush()
+        return {"repos": len(items), "cache_hits": hits}, updater
+    except Exception:
+        updater.engine.stop()
+        raise
+
+
+def scenario_cold_start(fleet, jobs):
+    fleet.clear_caches()
+    return _start(fleet, jobs)
+
+
+def scenario_warm_start(fleet, jobs):
+    return _start(fleet, jobs)
+
+
+def scenario_check_all(fleet, jobs):
+    updater = fleet.updater(jobs)
+    results = cmd_check(updater, argparse.Namespace(offline=False, core=False))
+    updater.status_cache.flush()
+    updater.remote_metadata.flush()
+    return {
+        "repos": len(results),
+        "failed": sum(1 for r in results if not r.get("ok")),
+        "update_available": sum(1 for r in results if r.get("update_available")),
+    }, updater
+
+
+def scenario_update_all(fleet, jobs):
+    updater = fleet.updater(jobs)
+    pipeline = UpdatePipeline(updater, updater.items())
+    updater.engine.call(pipeline.run())
+    actions = {}
+    for result in pipeline.results:
+        actions[result.merge_state] = actions.get(result.merge_state, 0) + 1
+    return {"repos": len(pipeline.results), "actions": actions}, updater
+
+
+def scenario_restore(fleet, jobs):
+    """还原到生成时的快照；有本地修改的仓库按 skip 处理，不会被重置"""
+    updater = fleet.updater(jobs)
+    results = diff_snapshot(updater, load_snapshot(fleet.snapshot_path))
+    restore = SnapshotRestore(updater, results)
+    updater.engine.call(restore.run())
+    states = {}
+    for result in results:
+        states[result.state] = states.get(result.state, 0) + 1
+    return {"repos": len(results), "changed": len(restore.pending), "states": states}, updater
+
+
+SCENARIO_FUNCS = {
+    "cold-start": scenario_cold_start,
+    "warm-start": scenario_warm_start,
+    "check-all": scenario_check_all,
+    "update-all": scenario_update_all,
+    "restore": scenario_restore,
+}
+
+
+async def _settle():
+    """等待场景留下的后台任务（如远程元数据刷新）结束，它们的耗时也计入场景"""
+    current = asyncio.current_task()
+    while True:
+        pending = [task for task in asyncio.all_tasks() if task is not current]
+        if not pending:
+            return
+        await asyncio.wait(pending)
+
+
+def run_scenario(fleet, name, jobs):
+    start = time.perf_counter()
+    detail, updater = SCENARIO_FUNCS[name](fleet, jobs)
+    updater.engine.call(_settle())
+    elapsed = time.perf_counter() - start
+    tracer = updater.engine.tracer
+    updater.engine.stop()
+    commands = {f"{s.kind}:{s.name}": {"count": s.count, "total": round(s.total, 4), "p95": round(s.percentile(95), 4)}
+                for s in tracer.stats()}
+    return dict(detail, elapsed=round(elapsed, 4), processes=sum(c["count"] for c in commands.values()),
+                commands=commands)
+
+
+# --- 汇总与对比 ---
+def summarize(runs):
+    """每个场景多轮耗时的最小值、中位数与最大值"""
+    summary = {}
+    for name in SCENARIOS:
+        values = [run[name]["elapsed"] for run in runs if name in run]
+        if values:
+            summary[name] = {"min": min(values), "median": round(statistics.median(values), 4), "max": max(values)}
+    return summary
+
+
+def compare(report, baseline):
+    """按插件数量与场景比较中位数，返回文本表格"""
+    old = {str(entry["spec"]["repos"]): entry["summary"] for entry in baseline.get("fleets", [])}
+    lines = [f"{'插件数':>6}  {'场景':<12}{'基线':>10}{'本次':>10}{'变化':>9}"]
+    for entry in report["fleets"]:
+        before = old.get(str(entry["spec"]["repos"]))
+        if before is None:
+            continue
+        for name, stats in entry["summary"].items():
+            if name not in before:
+                continue
+            a, b = before[name]["median"], stats["median"]
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+            lines.append(f"{entry['spec']['repos']:>6}  {name:<12}{a:>9.3f}s{b:>9.3f}s{change:>9}")
+    return "\n".join(lines)
+
+
+def environment_info():
+    try:
+        git_version = _git(["--version"]).strip()
+    except (OSError, RuntimeError):
+        git_version = "unknown"
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git": git_version,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ComfyUI-Updater 性能基准：合成插件群，结果以 JSON 输出")
+    parser.add_argument("--repos", type=int, nargs="+", default=[10, 100],
+                        help="插件数量，可给出多个 (如 10 100 1000)")
+    parser.add_argument("--history", type=int, default=50, help="每个插件的提交数")
+    parser.add_argument("--tags", type=int, default=5, help="每个插件的标签数")
+    parser.add_argument("--behind", type=int, default=3, help="落后的插件比上游少几个提交")
+    parser.add_argument("--behind-ratio", type=float, default=0.3, help="落后于上游的插件比例")
+    parser.add_argument("--diverged-ratio", type=float, default=0.05, help="有本地提交（不能快进）的插件比例")
+    parser.add_argument("--dirty-ratio", type=float, default=0.05, help="工作区有本地修改的插件比例")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子，相同参数与种子生成相同的插件群")
+    parser.add_argument("--repeat", type=int, default=3, help="每个插件群重复的轮数")
+    parser.add_argument("--jobs", type=int, help="并发检查的仓库数量 (check_concurrency)，默认 8")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS),
+                        help="只运行这些场景")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "comfyui-updater-bench"),
+                        help="插件群存放目录，参数不变时复用")
+    parser.add_argument("--rebuild", action="store_true", help="忽略已有插件群，重新生成")
+    parser.add_argument("--output", default="-", help="JSON 结果输出文件，- 表示标准输出")
+    parser.add_argument("--compare", metavar="FILE", help="与之前保存的结果对比，表格输出到 stderr")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = {
+        "version": BENCH_VERSION,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(),
+        "jobs": args.jobs or 8,
+        "fleets": [],
+    }
+    for count in args.repos:
+        spec = FleetSpec(count, args.history, args.tags, args.behind, args.behind_ratio, args.diverged_ratio,
+                         args.dirty_ratio, args.seed)
+        fleet = Fleet(os.path.join(args.workdir, f"fleet-{count}"), spec)
+        print(f"[{count}] 准备插件群: {fleet.path}", file=sys.stderr)
+        fleet.prepare(args.rebuild, args.jobs)
+        runs = []
+        for round_index in range(args.repeat):
+            run = {}
+            for name in args.scenarios:
+                run[name] = run_scenario(fleet, name, args.jobs)
+                print(f"[{count}] 第 {round_index + 1} 轮 {name:<11} {run[name]['elapsed']:8.3f}s "
+                      f"({run[name]['processes']} 个进程)", file=sys.stderr)
+            if "restore" not in args.scenarios and "update-all" in args.scenarios:
+                # 没有运行 restore 时也要回到初始状态，否则下一轮没有可更新的插件
+                scenario_restore(fleet, args.jobs)[1].engine.stop()
+            runs.append(run)
+        report["fleets"].append({"spec": spec.to_dict(), "path": fleet.path, "build_seconds": fleet.build_seconds,
+                                 "reused": fleet.reused, "runs": runs, "summary": summarize(runs)})
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+"""ComfyUI-Updater 命令行模式（无界面，不导入 tkinter）
+
+适合在没有显示器的渲染节点上批量检查/更新，结果以 JSON 输出：
+    python updater_cli.py check
+    python updater_cli.py --output result.json update-all --conflict reset
+    python updater_cli.py pin ComfyUI-Manager=2.0 SomeNode=abc1234
+    python updater_cli.py pip --core
+    python updater_cli.py pip-all --dry-run
+    python updater_cli.py deps
+    python updater_cli.py mirror --repack
+    python updater_cli.py snapshot before.lock.json
+    python updater_cli.py restore before.lock.json --dry-run
+    python updater_cli.py profile --preload torch
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from updater_core import CONFIG_FILE, GitItemBase, StatusCache, UpdatePipeline, UpdaterBase, VersionEntry
+from updater_deps import collect_dependency_plan, collect_requirement_lines
+from updater_profile import ImportProfiler
+from updater_snapshot import SnapshotRestore, capture_snapshot, diff_snapshot, load_snapshot, save_snapshot
+
+CORE_NAME = "ComfyUI"
+
+
+class HeadlessUpdater(UpdaterBase):
+    """复用 config.ini 与状态缓存的无界面运行环境"""
+    def __init__(self, config_path=CONFIG_FILE, root=None, jobs=None, conflict_policy="skip"):
+        super().__init__(config_path)
+        self.load_config()
+        if root:
+            self.comfyui_root = os.path.abspath(root)
+        if jobs:
+            self.check_concurrency = jobs
+        self.conflict_policy = conflict_policy
+        self.set_paths(self.comfyui_root)
+        self.status_cache = StatusCache(self.cache_path, self.cache_ttl_minutes * 60)
+        self.report_extra = {}  # 命令附加到 JSON 报告中的字段
+
+    def items(self, names=None, include_core=False):
+        items = []
+        if include_core:
+            items.append(GitItemBase(self, self.comfyui_root, CORE_NAME))
+        for folder in self.list_plugin_folders():
+            if names is None or folder in names:
+                items.append(GitItemBase(self, os.path.join(self.nodes_path, folder), folder))
+        return items
+
+    def map_parallel(self, func, items):
+        with ThreadPoolExecutor(max_workers=max(1, self.check_concurrency)) as executor:
+            return list(executor.map(func, items))
+
+    def remember_status(self, item, status):
+        """把检查结果写入状态缓存，图形界面下次启动可以直接使用"""
+        _, head_sha = item.git_reader().read_head()
+        if not head_sha:
+            return
+        cached = self.status_cache.get(item.full_path)
+        versions = []
+        if cached and cached.get("head") == head_sha:
+            versions = [VersionEntry.from_dict(d) for d in cached["versions"]]
+        self.status_cache.put(item.full_path, status, versions, head_sha, (item.ahead_count, item.behind_count))
+
+
+def _new_result(item):
+    return {"name": item.display_name, "path": item.full_path, "ok": True, "timings": {}}
+
+
+def _timed(result, phase, func, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        result["timings"][phase] = round(time.perf_counter() - start, 4)
+
+
+def _record_status(updater, item, result, fetch=True):
+    text, color, is_update = _timed(result, "status", item.check_status_base, fetch)
+    _, head_sha = item.git_reader().read_head()
+    result.update({
+        "is_git": color != "gray",
+        "status": text,
+        "update_available": is_update,
+        "ahead": item.ahead_count,
+        "behind": item.behind_count,
+        "head": head_sha,
+    })
+    if result["is_git"]:
+        result["fetch_strategy"] = item.fetch_strategy()
+    if item.fetch_error:
+        # fetch 失败时的结果只基于本地 refs，不写入缓存
+        result["fetch_error"] = item.fetch_error
+    else:
+        updater.remember_status(item, (text, color, is_update))
+    return is_update
+
+
+def _run_guarded(func):
+    """单个仓库出错不影响其余仓库，异常记录到结果中"""
+    def wrapper(item):
+        start = time.perf_counter()
+        result = _new_result(item)
+        try:
+            func(item, result)
+        except Exception as e:
+            result["ok"] = False
+            result["message"] = str(e)
+        result["elapsed"] = round(time.perf_counter() - start, 4)
+        return result
+    return wrapper
+
+
+def cmd_check(updater, args):
+    def check(item, result):
+        _record_status(updater, item, result, fetch=not args.offline)
+    return updater.map_parallel(_run_guarded(check), updater.items(include_core=args.core))
+
+
+def cmd_update_all(updater, args):
+    """两段流水线：并发 fetch 后本地 merge --ff-only，汇总表输出到 stderr"""
+    pipeline = UpdatePipeline(updater, updater.items(include_core=args.core))
+    updater.engine.call(pipeline.run())
+    print(pipeline.summary_table(), file=sys.stderr)
+    updater.report_extra["stages"] = pipeline.stats_dict()
+    return [result.to_dict() for result in pipeline.results]
+
+
+def cmd_pin(updater, args):
+    targets = {}
+    for spec in args.specs:
+        name, sep, ref = spec.partition("=")
+        if not sep or not name or not ref:
+            raise SystemExit(f"无效的参数 {spec!r}，格式应为 插件名=标签或提交")
+        targets[name] = ref
+    if args.core:
+        targets[CORE_NAME] = args.core
+
+    items = updater.items(names=set(targets), include_core=bool(args.core))
+    missing = set(targets) - {item.display_name for item in items}
+    results = [dict(name=name, ok=False, message="未找到该插件目录") for name in sorted(missing)]
+
+    def pin(item, result):
+        ref = targets[item.display_name]
+        reader = item.git_reader()
+        if reader.resolve_ref(f"refs/tags/{ref}") or ref in item.remote_tags():
+            version = VersionEntry(VersionEntry.TAG, ref=ref)
+        else:
+            version = VersionEntry(VersionEntry.COMMIT, sha=ref)
+        ok, msg = _timed(result, "checkout", item.do_update_logic, version, True)
+        result.update({"ref": ref, "ok": ok, "message": msg, "head": item.git_reader().read_head()[1]})
+    return results + updater.map_parallel(_run_guarded(pin), items)
+
+
+def cmd_pip(updater, args):
+    names = set(args.names) if args.names else None
+    items = [item for item in updater.items(names=names, include_core=args.core) if item.check_requirements()]
+
+    def pip(item, result):
+        ok, msg = _timed(result, "pip", item.run_pip_install)
+        result.update({"ok": ok, "message": msg[-2000:]})
+    # 多个 pip 同时写入同一个环境会互相冲突，这里逐个执行
+    return [_run_guarded(pip)(item) for item in items]
+
+
+def cmd_pip_all(updater, args):
+    start = time.perf_counter()
+    plan = collect_dependency_plan(updater)
+    result = {
+        "name": "merged-requirements",
+        "ok": True,
+        "sources": [name for name, _ in plan.sources],
+        "packages": plan.package_count,
+        "conflicts": [c.describe() for c in plan.conflicts],
+        "requirements": plan.to_requirements_text().splitlines(),
+        "timings": {"plan": round(time.perf_counter() - start, 4)},
+    }
+    print(plan.summary(), file=sys.stderr)
+    if args.dry_run or not plan.merged:
+        result["action"] = "dry-run" if args.dry_run else "none"
+        return [result]
+
+    merged_path = plan.write_temp_file()
+    try:
+        ok, msg = _timed(result, "pip", updater.install_requirements, merged_path, "pip-all",
+                         updater.comfyui_root, log=None, remember=False)
+    finally:
+        os.remove(merged_path)
+    result.update({"action": "installed" if ok else "failed", "ok": ok, "message": msg[-2000:]})
+    return [result]
+
+
+def cmd_deps(updater, args):
+    """按环境索引列出本体与各插件缺少的依赖，不执行 pip；索引有效时不启动 python_exe"""
+    index = updater.environment_index
+    start = time.perf_counter()
+    reused = index.is_valid(updater.python_exe)
+    lines = [line for ls in collect_requirement_lines(updater).values() for line in ls]
+    if index.ensure(updater, lines) is None:
+        raise SystemExit(f"无法读取 {updater.python_exe} 环境中已安装的包")
+    updater.report_extra["environment"] = {
+        "python": updater.python_exe,
+        "packages": len(index.dists(updater.python_exe) or {}),
+        "index": "cached" if reused and index.lookup(updater.python_exe, lines) is not None else "rebuilt",
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+    results = []
+    for item in updater.items(include_core=True):
+        status = item.dependency_status()
+        if status is None:
+            continue
+        results.append({
+            "name": item.display_name, "path": item.full_path, "ok": not status.missing,
+            "status": status.describe(), "requirements": status.total,
+            "missing": [{"requirement": line, "installed": version} for line, version in status.missing],
+            "unknown": status.unknown,
+        })
+    return results
+
+
+def cmd_mirror(updater, args):
+    """把所有上游同步到共享对象池，插件仓库通过 alternates 借用对象"""
+    if args.path:
+        updater.mirror_path = os.path.abspath(args.path)
+    mirror = updater.mirror
+    if mirror is None:
+        raise SystemExit("未配置对象池：请在 config.ini 的 [Mirror] 中设置 path，或使用 --path")
+    if mirror.offline:
+        raise SystemExit("[Mirror] offline = true 时不能同步对象池")
+
+    def sync(item, result):
+        if not item.is_git_repo():
+            result.update({"ok": False, "message": "非Git仓库"})
+            return
+        _record_status(updater, item, result)
+        result["ok"] = item.fetch_error is None
+        if result["ok"] and args.repack:
+            # 删除本地与对象池重复的对象，之后该仓库依赖对象池，不能删除对象池目录
+            code, _, err = _timed(result, "repack", item.run_git, ["repack", "-a", "-d", "-l", "-q"])
+            if code != 0:
+                result.update({"ok": False, "message": err[-2000:]})
+    results = updater.map_parallel(_run_guarded(sync), updater.items(include_core=args.core))
+    updater.report_extra["mirror"] = {"path": mirror.path, "size_mb": round(mirror.size() / 1024 / 1024, 2)}
+    return results
+
+
+def cmd_snapshot(updater, args):
+    snapshot = capture_snapshot(updater)
+    save_snapshot(args.file, snapshot)
+    return [dict(entry, ok=True) for entry in snapshot["repos"]]
+
+
+def cmd_restore(updater, args):
+    """与快照比较，只还原不一致的仓库；--dry-run 只输出差异"""
+    try:
+        snapshot = load_snapshot(args.file)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"读取快照失败: {e}")
+    results = diff_snapshot(updater, snapshot)
+    if not args.dry_run:
+        restore = SnapshotRestore(updater, results)
+        updater.engine.call(restore.run())
+        print(restore.summary_table(), file=sys.stderr)
+        updater.report_extra["stages"] = restore.stats_dict()
+    updater.report_extra["snapshot"] = {"file": args.file, "created_at": snapshot.get("created_at"),
+                                        "changed": sum(1 for r in results if r.action in r.CHANGES)}
+    return [r.to_dict() for r in results]
+
+
+def cmd_profile(updater, args):
+    """在独立进程中导入每个插件，按导入耗时从高到低输出，并写入历史记录"""
+    names = set(args.names) if args.names else None
+    preload = [m.strip() for m in args.preload.split(",") if m.strip()] if args.preload is not None else None
+    profiler = ImportProfiler(updater, updater.items(names=names), args.concurrency, args.timeout, preload)
+    updater.engine.call(profiler.run())
+    print(profiler.summary_table(), file=sys.stderr)
+    results = []
+    for profile in profiler.profiles:
+        result = dict(profile.to_dict(), ok=profile.ok)
+        if profile.regression is not None:
+            result["regression"] = profile.regression_text()
+            result["previous"] = profile.regression
+        results.append(result)
+    return results
+
+
+COMMANDS = {
+    "check": cmd_check,
+    "update-all": cmd_update_all,
+    "pin": cmd_pin,
+    "pip": cmd_pip,
+    "pip-all": cmd_pip_all,
+    "deps": cmd_deps,
+    "mirror": cmd_mirror,
+    "snapshot": cmd_snapshot,
+    "restore": cmd_restore,
+    "profile": cmd_profile,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ComfyUI-Updater 命令行模式，结果以 JSON 输出")
+    parser.add_argument("--config", default=CONFIG_FILE, help="配置文件路径 (默认 config.ini)")
+    parser.add_argument("--root", help="ComfyUI 根目录，默认读取配置文件")
+    parser.add_argument("--jobs", type=int, help="并发检查的仓库数量，默认读取 check_concurrency")
+    parser.add_argument("--output", default="-", help="JSON 结果输出文件，- 表示标准输出")
+    parser.add_argument("--trace", metavar="FILE", help="把每条 git / pip 命令的耗时导出为 Chrome Trace 文件")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("check", help="检查所有插件的更新状态")
+    p.add_argument("--offline", action="store_true", help="不执行 git fetch，只比较本地 refs")
+    p.add_argument("--core", action="store_true", help="同时检查 ComfyUI 本体")
+
+    p = sub.add_parser("update-all", help="更新所有落后于上游的插件")
+    p.add_argument("--core", action="store_true", help="同时更新 ComfyUI 本体")
+    p.add_argument("--conflict", choices=["skip", "reset"], default="skip",
+                   help="遇到本地修改时：skip 跳过该仓库，reset 丢弃本地修改")
+
+    p = sub.add_parser("pin", help="把插件切换到指定标签或提交")
+    p.add_argument("specs", nargs="*", metavar="NAME=REF")
+    p.add_argument("--core", metavar="REF", help="同时把 ComfyUI 本体切换到 REF")
+    p.add_argument("--conflict", choices=["skip", "reset"], default="skip",
+                   help="遇到本地修改时：skip 跳过该仓库，reset 丢弃本地修改")
+
+    p = sub.add_parser("pip", help="为插件安装 requirements.txt 依赖")
+    p.add_argument("names", nargs="*", help="只处理这些插件，默认全部")
+    p.add_argument("--core", action="store_true", help="同时安装 ComfyUI 本体依赖")
+
+    p = sub.add_parser("pip-all", help="合并本体与所有插件的依赖，一次 pip install 完成")
+    p.add_argument("--dry-run", action="store_true", help="只输出合并结果与冲突，不执行安装")
+
+    sub.add_parser("deps", help="列出本体与各插件缺少的依赖（使用环境索引，不执行 pip）")
+
+    p = sub.add_parser("mirror", help="把所有上游同步到共享对象池（[Mirror] path）")
+    p.add_argument("--path", help="对象池目录，默认读取配置文件")
+    p.add_argument("--core", action="store_true", help="同时同步 ComfyUI 本体")
+    p.add_argument("--repack", action="store_true", help="同步后删除插件仓库中与对象池重复的对象")
+
+    p = sub.add_parser("snapshot", help="把本体与所有插件的 URL、分支、SHA 写入快照文件")
+    p.add_argument("file", help="快照文件路径 (JSON)")
+
+    p = sub.add_parser("restore", help="按快照文件并发还原，只处理与快照不一致的仓库")
+    p.add_argument("file", help="快照文件路径 (JSON)")
+    p.add_argument("--dry-run", action="store_true", help="只列出与快照的差异，不做修改")
+    p.add_argument("--conflict", choices=["skip", "reset"], default="skip",
+                   help="遇到本地修改时：skip 跳过该仓库，reset 丢弃本地修改")
+
+    p = sub.add_parser("profile", help="在独立进程中导入每个插件，找出拖慢 ComfyUI 启动的插件")
+    p.add_argument("names", nargs="*", help="只分析这些插件，默认全部")
+    p.add_argument("--concurrency", type=int, help="同时运行的 Python 进程数，默认读取 [Profile] concurrency")
+    p.add_argument("--timeout", type=int, help="单个插件的超时秒数，默认读取 [Profile] timeout")
+    p.add_argument("--preload", help="预先导入、不计入插件耗时的模块，逗号分隔（如 torch），默认读取 [Profile] preload")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    updater = HeadlessUpdater(args.config, args.root, args.jobs, getattr(args, "conflict", "skip"))
+    if not updater.comfyui_root or not os.path.isdir(updater.comfyui_root):
+        print(f"ComfyUI 根目录不存在: {updater.comfyui_root or '(未配置)'}", file=sys.stderr)
+        return 2
+
+    started_at = time.time()
+    start = time.perf_counter()
+    results = COMMANDS[args.command](updater, args)
+    elapsed = time.perf_counter() - start
+    updater.status_cache.flush()
+    updater.remote_metadata.flush()
+
+    failed = [r for r in results if not r.get("ok")]
+    report = {
+        "command": args.command,
+        "root": updater.comfyui_root,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started_at)),
+        "elapsed": round(elapsed, 4),
+        "jobs": updater.check_concurrency,
+        "summary": {
+            "total": len(results),
+            "ok": len(results) - len(failed),
+            "failed": len(failed),
+            "update_available": sum(1 for r in results if r.get("update_available")),
+        },
+        "repos": results,
+    }
+    report.update(updater.report_extra)
+    if args.trace:
+        tracer = updater.engine.tracer
+        tracer.export(args.trace)
+        report["commands"] = [stats.to_dict() for stats in tracer.stats()]
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(f"{args.command}: {len(results)} 个仓库, 失败 {len(failed)}, 耗时 {elapsed:.2f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
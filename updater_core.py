@@ -0,0 +1,1596 @@
+"""ComfyUI-Updater 的核心逻辑（不依赖 tkinter）
+
+图形界面 (main.py) 与命令行模式 (updater_cli.py) 共用这里的配置读写、
+命令执行、.git 读取、状态缓存与 Git 操作。
+"""
+import asyncio
+import os
+import threading
+import configparser
+import tempfile
+import heapq
+import itertools
+import collections
+import re
+import json
+import hashlib
+import time
+import sys
+
+from updater_engine import CancelToken, CommandEngine, HostPolicy, remote_host
+from updater_mirror import MirrorStore
+from updater_profile import PROFILE_HISTORY_FILE, ProfileHistory
+from updater_trace import traced
+from updater_deps import (
+    ENVIRONMENT_INDEX_FILE, REQUIREMENTS_CACHE_FILE, EnvironmentIndex, RequirementsCache, find_unmet_requirements,
+    remember_requirements_installed,
+)
+
+# 配置文件名
+CONFIG_FILE = "config.ini"
+# 状态缓存文件 (与 config.ini 放在一起)
+CACHE_FILE = "status_cache.json"
+# 远程元数据缓存文件（默认分支、远程标签）
+REMOTE_CACHE_FILE = "remote_cache.json"
+# git fetch 策略：完整 / 不下载文件内容的部分克隆 / 只取较新的历史 / 按仓库大小自动选择
+FETCH_FULL, FETCH_BLOBLESS, FETCH_AUTO = "full", "blobless", "auto"
+
+# --- 调度器：有界并发 + 优先级的状态检查队列 ---
+class CheckScheduler:
+    """集中调度插件状态检查，限制同时进行的检查数量
+
+    任务是无参数的协程函数，在 CommandEngine 的事件循环中执行，
+    数百个插件同时排队也不需要数百个线程。
+    数值越小优先级越高；可视区域内的行会被提升到最前。
+    cancel_all() 会丢弃所有排队任务（正在执行的任务由各自的 CancelToken 中止）。
+    """
+    PRIORITY_INTERACTIVE = -2  # 用户主动触发（如展开下拉框）
+    PRIORITY_VISIBLE = -1
+
+    def __init__(self, engine, max_workers=8):
+        self.engine = engine
+        self.max_workers = max(1, int(max_workers))
+        self._lock = threading.Lock()
+        self._heap = []        # [priority, seq, key, func]，func 为 None 表示已作废
+        self._entries = {}     # key -> 堆中的有效条目
+        self._seq = itertools.count()
+        self._workers = 0
+        self._running = 0
+
+    def submit(self, key, func, priority=0):
+        with self._lock:
+            self._discard(key)
+            entry = [priority, next(self._seq), key, func]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            self._ensure_workers()
+
+    def promote(self, keys, priority=PRIORITY_VISIBLE):
+        """提升仍在排队中的任务的优先级（如滚动到可视区域的行）"""
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= priority:
+                    continue
+                func = entry[3]
+                entry[3] = None
+                new_entry = [priority, next(self._seq), key, func]
+                self._entries[key] = new_entry
+                heapq.heappush(self._heap, new_entry)
+
+    def cancel_all(self):
+        with self._lock:
+            self._heap.clear()
+            self._entries.clear()
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self.max_workers = max(1, int(max_workers))
+            self._ensure_workers()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[3] = None
+
+    def _ensure_workers(self):
+        while self._workers < self.max_workers and self._workers < len(self._entries) + self._running:
+            self._workers += 1
+            self.engine.submit(self._worker_loop())
+
+    def _next_task(self):
+        with self._lock:
+            while self._heap and self._heap[0][3] is None:
+                heapq.heappop(self._heap)
+            # 超出并发上限或队列已空时协程直接结束，下次提交时再按需创建
+            if self._workers > self.max_workers or not self._heap:
+                self._workers -= 1
+                return None
+            _, _, key, func = heapq.heappop(self._heap)
+            self._entries.pop(key, None)
+            self._running += 1
+            return func
+
+    async def _worker_loop(self):
+        while True:
+            func = self._next_task()
+            if func is None:
+                return
+            try:
+                await func()
+            except asyncio.CancelledError:
+                pass  # 该行已被移除
+            except Exception as e:
+                print(f"Check task error: {e}", file=sys.stderr)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+# --- 纯 Python 的 .git 读取器：本地查询无需启动 git 进程 ---
+def _is_sha(text):
+    return len(text) in (40, 64) and all(c in "0123456789abcdef" for c in text)
+
+
+class GitDirReader:
+    """直接读取 HEAD、loose refs、packed-refs 与 .git/config
+
+    支持 .git 文件形式的 gitdir 指向（submodule / worktree）。
+    读不出结果时返回 None，由调用方回退到 git 命令行。
+    """
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.git_dir = self._find_git_dir(repo_path)
+        self.common_dir = self._find_common_dir(self.git_dir) if self.git_dir else None
+        self._packed = None
+        self._config = None
+
+    @staticmethod
+    def _read_text(path):
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @classmethod
+    def _find_git_dir(cls, repo_path):
+        dot_git = os.path.join(repo_path, ".git")
+        if os.path.isdir(dot_git):
+            return dot_git
+        content = cls._read_text(dot_git) if os.path.isfile(dot_git) else None
+        if content and content.startswith("gitdir:"):
+            target = content[len("gitdir:"):].strip()
+            if not os.path.isabs(target):
+                target = os.path.join(repo_path, target)
+            target = os.path.normpath(target)
+            if os.path.isdir(target):
+                return target
+        return None
+
+    @classmethod
+    def _find_common_dir(cls, git_dir):
+        content = cls._read_text(os.path.join(git_dir, "commondir"))
+        if content and content.strip():
+            common = content.strip()
+            if not os.path.isabs(common):
+                common = os.path.join(git_dir, common)
+            return os.path.normpath(common)
+        return git_dir
+
+    @property
+    def is_repo(self):
+        return self.git_dir is not None
+
+    def read_head(self):
+        """返回 (符号引用, SHA)。分离头指针时符号引用为 None"""
+        content = self._read_text(os.path.join(self.git_dir, "HEAD")) if self.git_dir else None
+        if not content:
+            return None, None
+        content = content.strip()
+        if content.startswith("ref:"):
+            ref = content[4:].strip()
+            return ref, self.resolve_ref(ref)
+        if _is_sha(content):
+            return None, content
+        return None, None
+
+    def current_branch(self):
+        ref, _ = self.read_head()
+        if ref and ref.startswith("refs/heads/"):
+            return ref[len("refs/heads/"):]
+        return None
+
+    def is_detached(self):
+        ref, sha = self.read_head()
+        return ref is None and sha is not None
+
+    def resolve_ref(self, ref, _depth=0):
+        if not self.git_dir or _depth > 5:
+            return None
+        for base in (self.git_dir, self.common_dir):
+            content = self._read_text(os.path.join(base, *ref.split("/")))
+            if content is None:
+                continue
+            content = content.strip()
+            if content.startswith("ref:"):
+                return self.resolve_ref(content[4:].strip(), _depth + 1)
+            if _is_sha(content):
+                return content
+        return self.packed_refs().get(ref)
+
+    def packed_refs(self):
+        if self._packed is None:
+            self._packed = {}
+            content = self._read_text(os.path.join(self.common_dir, "packed-refs")) if self.common_dir else None
+            for line in (content or "").splitlines():
+                if not line or line[0] in "#^":
+                    continue
+                sha, _, name = line.partition(" ")
+                if _is_sha(sha) and name:
+                    self._packed[name.strip()] = sha
+        return self._packed
+
+    def config(self):
+        """解析 .git/config，返回 {(section, subsection): {key: value}}，键名统一为小写"""
+        if self._config is None:
+            self._config = {}
+            content = self._read_text(os.path.join(self.common_dir, "config")) if self.common_dir else None
+            section = None
+            for raw in (content or "").splitlines():
+                line = raw.strip()
+                if not line or line[0] in "#;":
+                    continue
+                if line.startswith("["):
+                    header = line[1:line.find("]")].strip()
+                    name, _, sub = header.partition(" ")
+                    section = (name.lower(), sub.strip().strip('"') or None)
+                    self._config.setdefault(section, {})
+                elif section is not None:
+                    key, _, value = line.partition("=")
+                    self._config[section][key.strip().lower()] = value.strip().strip('"')
+        return self._config
+
+    def config_value(self, section, subsection, key, default=None):
+        return self.config().get((section, subsection), {}).get(key.lower(), default)
+
+    def remote_url(self, remote="origin"):
+        return self.config_value("remote", remote, "url")
+
+    def remote_default_branch(self, remote="origin"):
+        """读取 refs/remotes/<remote>/HEAD 符号引用得到远程默认分支名，不存在时返回 None"""
+        prefix = f"refs/remotes/{remote}/"
+        content = self._read_text(os.path.join(self.common_dir, *prefix.split("/")[:-1], "HEAD")) if self.common_dir else None
+        content = (content or "").strip()
+        if content.startswith("ref:") and content[4:].strip().startswith(prefix):
+            return content[4:].strip()[len(prefix):]
+        return None
+
+    def is_shallow(self):
+        return bool(self.common_dir) and os.path.isfile(os.path.join(self.common_dir, "shallow"))
+
+    def is_partial(self, remote="origin"):
+        return self.config_value("remote", remote, "promisor", "").lower() == "true"
+
+    def upstream_ref(self, branch):
+        """根据 branch.<name>.remote/merge 推算上游引用，未配置时按 origin/<branch> 处理"""
+        remote = self.config_value("branch", branch, "remote", "origin")
+        merge = self.config_value("branch", branch, "merge", f"refs/heads/{branch}")
+        if remote == ".":
+            return merge
+        if merge.startswith("refs/heads/"):
+            merge = merge[len("refs/heads/"):]
+        return f"refs/remotes/{remote}/{merge}"
+
+    def state_files(self):
+        """影响仓库状态判断的文件：HEAD、packed-refs 以及 refs 下的所有 loose ref"""
+        if not self.git_dir:
+            return []
+        files = [os.path.join(self.git_dir, "HEAD"), os.path.join(self.common_dir, "packed-refs")]
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.common_dir, "refs")):
+            dirnames.sort()
+            files.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+        return files
+
+
+# --- 状态缓存：持久化到磁盘，启动时先显示缓存再后台刷新 ---
+def git_state_fingerprint(repo_path):
+    """根据 .git/HEAD、refs 与 packed-refs 的修改时间生成指纹，任一变化即视为缓存失效"""
+    parts = []
+    for path in GitDirReader(repo_path).state_files():
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{path}:-")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class StatusCache:
+    """插件状态缓存：记录上次检查的状态、版本列表、HEAD SHA 与 fetch 时间
+
+    条目以仓库路径为键，并保存 git_state_fingerprint；指纹不一致时条目作废。
+    """
+    VERSION = 3
+
+    def __init__(self, path, ttl_seconds=1800):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def _key(repo_path):
+        return os.path.normcase(os.path.abspath(repo_path))
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._entries = data.get("entries", {})
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, repo_path):
+        """返回仍然有效的缓存条目，仓库状态已变化时返回 None"""
+        key = self._key(repo_path)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.get("fingerprint") != git_state_fingerprint(repo_path):
+            with self._lock:
+                self._entries.pop(key, None)
+                self._dirty = True
+            return None
+        return entry
+
+    def is_stale(self, entry):
+        return time.time() - entry.get("fetched_at", 0) > self.ttl_seconds
+
+    def put(self, repo_path, status, versions, head_sha, ahead_behind=(0, 0), fetched_at=None):
+        entry = {
+            "status": list(status),
+            "ahead_behind": list(ahead_behind),
+            "versions": [v.to_dict() for v in versions],
+            "head": head_sha,
+            "fetched_at": fetched_at if fetched_at is not None else time.time(),
+            "fingerprint": git_state_fingerprint(repo_path),
+        }
+        with self._lock:
+            self._entries[self._key(repo_path)] = entry
+            self._dirty = True
+        return entry
+
+    def remove(self, repo_path):
+        with self._lock:
+            if self._entries.pop(self._key(repo_path), None) is not None:
+                self._dirty = True
+
+    def update_versions(self, repo_path, head_sha, versions):
+        """补充按需加载的版本列表，仅当缓存条目仍对应同一个 HEAD 时写入"""
+        with self._lock:
+            entry = self._entries.get(self._key(repo_path))
+            if entry is not None and entry.get("head") == head_sha:
+                entry["versions"] = [v.to_dict() for v in versions]
+                self._dirty = True
+
+    def flush(self):
+        """有改动时写回磁盘（先写临时文件再替换，避免中途退出损坏缓存）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": self.VERSION, "entries": dict(self._entries)}
+            self._dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Save cache error: {e}", file=sys.stderr)
+
+class RemoteMetadataCache:
+    """远程仓库元数据缓存：默认分支与远程标签列表，以远程 URL 为键
+
+    由 git ls-remote --symref 一次取得，TTL 内不再访问网络；插件行与本体页面共用同一份。
+    默认分支很少变化，过期条目仍可作为后备使用，只是会在后台刷新。
+    """
+    VERSION = 1
+
+    def __init__(self, path, ttl_seconds=1800):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self._pending = {}  # url -> 正在进行的刷新任务（只在事件循环线程中访问）
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._entries = data.get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, url):
+        """返回缓存条目（可能已过期），不存在时返回 None"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def is_stale(self, entry):
+        return entry is None or time.time() - entry.get("fetched_at", 0) > self.ttl_seconds
+
+    def put(self, url, default_branch, tags):
+        entry = {"default_branch": default_branch, "tags": list(tags), "fetched_at": time.time()}
+        with self._lock:
+            self._entries[url] = entry
+            self._dirty = True
+        return entry
+
+    async def refresh(self, url, ls_remote):
+        """ls_remote 为返回 (code, out, err) 的协程函数；同一 URL 的并发刷新合并为一次
+
+        只能在事件循环线程中调用。失败时保留旧条目。
+        """
+        task = self._pending.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(url, ls_remote))
+            self._pending[url] = task
+            task.add_done_callback(lambda _: self._pending.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, url, ls_remote):
+        code, out, _ = await ls_remote()
+        if code != 0:
+            return self.get(url)
+        default_branch, tags = parse_ls_remote(out)
+        return self.put(url, default_branch, tags)
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": self.VERSION, "entries": dict(self._entries)}
+            self._dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Save remote cache error: {e}", file=sys.stderr)
+
+# --- 目录监视：轮询 custom_nodes 与各仓库 HEAD/refs 的修改时间 ---
+class NodesWatcher:
+    """用 scandir + mtime 快照轮询插件目录，不依赖任何平台相关的文件通知接口
+
+    发现目录增删或 HEAD/refs 变化时调用 on_change(added, removed, changed)（目录名列表），
+    每轮结束调用 on_stats(watcher)。两个回调都在监视线程中执行。
+    git 更新 loose ref 时会在 refs 目录里创建并重命名 .lock 文件，因此只需
+    stat HEAD、packed-refs 和几个 refs 目录，无需遍历全部 ref 文件。
+    """
+    def __init__(self, get_nodes_path, on_change, interval=5.0, on_stats=None):
+        self.get_nodes_path = get_nodes_path
+        self.on_change = on_change
+        self.on_stats = on_stats
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._nodes_path = None
+        self._dir_mtime = None
+        self._folders = []
+        self._stamps = {}
+        self._git_dirs = {}
+        # 开销统计
+        self.polls = 0
+        self.last_wall_ms = 0.0
+        self.last_cpu_ms = 0.0
+        self._cpu_total = 0.0
+        self._started_at = None
+
+    @property
+    def cpu_percent(self):
+        """监视线程自启动以来占用的 CPU 时间比例"""
+        if not self._started_at:
+            return 0.0
+        elapsed = time.monotonic() - self._started_at
+        return self._cpu_total / elapsed * 100 if elapsed > 0 else 0.0
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                added, removed, changed = self.poll()
+                if added or removed or changed:
+                    self.on_change(added, removed, changed)
+                if self.on_stats:
+                    self.on_stats(self)
+            except Exception as e:
+                print(f"Watcher error: {e}", file=sys.stderr)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _repo_stamp(self, folder_path):
+        dirs = self._git_dirs.get(folder_path)
+        if dirs is None:
+            reader = GitDirReader(folder_path)
+            dirs = (reader.git_dir, reader.common_dir)
+            if reader.git_dir:
+                self._git_dirs[folder_path] = dirs
+        git_dir, common_dir = dirs
+        if not git_dir:
+            # 非 Git 目录只看目录本身，出现 .git 时目录 mtime 会变化
+            return (self._mtime(folder_path),)
+        refs = os.path.join(common_dir, "refs")
+        stamp = [self._mtime(os.path.join(git_dir, "HEAD")), self._mtime(os.path.join(common_dir, "packed-refs")),
+                 self._mtime(os.path.join(refs, "heads")), self._mtime(os.path.join(refs, "tags"))]
+        try:
+            with os.scandir(os.path.join(refs, "remotes")) as it:
+                stamp.extend(e.stat().st_mtime_ns for e in it if e.is_dir())
+        except OSError:
+            pass
+        return tuple(stamp)
+
+    def poll(self):
+        """扫描一次并返回与上次快照相比的 (新增, 删除, 变化) 目录名"""
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        nodes_path = self.get_nodes_path()
+        if nodes_path != self._nodes_path:
+            # 根目录切换后重新建立基线，不上报差异
+            self._nodes_path, self._dir_mtime, self._folders = nodes_path, None, []
+            self._stamps, self._git_dirs = {}, {}
+            baseline = True
+        else:
+            baseline = False
+
+        added, removed, changed = [], [], []
+        if nodes_path and os.path.isdir(nodes_path):
+            dir_mtime = self._mtime(nodes_path)
+            if dir_mtime != self._dir_mtime:
+                self._dir_mtime = dir_mtime
+                with os.scandir(nodes_path) as it:
+                    self._folders = [e.name for e in it
+                                     if e.is_dir() and not (e.name.startswith("__") or e.name.startswith("."))]
+            stamps = {}
+            for name in self._folders:
+                folder_path = os.path.join(nodes_path, name)
+                stamps[name] = self._repo_stamp(folder_path)
+                old = self._stamps.get(name)
+                if old is None:
+                    added.append(name)
+                elif old != stamps[name]:
+                    changed.append(name)
+            removed = [name for name in self._stamps if name not in stamps]
+            for name in removed:
+                self._git_dirs.pop(os.path.join(nodes_path, name), None)
+            self._stamps = stamps
+
+        self.polls += 1
+        self.last_wall_ms = (time.perf_counter() - wall_start) * 1000
+        self.last_cpu_ms = (time.thread_time() - cpu_start) * 1000
+        self._cpu_total += self.last_cpu_ms / 1000
+        if baseline:
+            return [], [], []
+        return added, removed, changed
+
+
+# --- 版本模型：下拉框文字由结构化数据生成，不再反向解析 ---
+class VersionEntry:
+    """版本列表中的一项：最新版本 / 标签 / 提交"""
+    __slots__ = ("kind", "ref", "sha", "subject", "date", "author")
+
+    LATEST = "latest"
+    TAG = "tag"
+    COMMIT = "commit"
+
+    def __init__(self, kind, ref="", sha="", subject="", date="", author=""):
+        self.kind = kind
+        self.ref = ref
+        self.sha = sha
+        self.subject = subject
+        self.date = date
+        self.author = author
+
+    @classmethod
+    def latest(cls):
+        return cls(cls.LATEST)
+
+    @property
+    def short_sha(self):
+        return self.sha[:7]
+
+    @property
+    def target(self):
+        """git checkout 使用的目标"""
+        return self.ref if self.kind == self.TAG else self.sha
+
+    def label(self):
+        if self.kind == self.LATEST:
+            return "最新版本 (Latest)"
+        if self.kind == self.TAG:
+            return f"Tag: {self.ref}"
+        return f"Commit: {self.short_sha} - {self.subject}"
+
+    def log_line(self):
+        """提交历史面板中的一行"""
+        return f"[{self.short_sha}] {self.subject} ({self.date}) - {self.author}"
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{k: data.get(k, "") for k in cls.__slots__})
+
+
+# 一次 for-each-ref / 一次 log 的输出格式，字段以 NUL 分隔
+TAG_REF_FORMAT = "%(refname:short)%00%(objectname)%00%(*objectname)%00%(creatordate:short)%00%(subject)"
+COMMIT_LOG_FORMAT = "%H%x00%cd%x00%an%x00%s"
+
+
+def parse_tag_refs(output):
+    tags = []
+    for line in output.splitlines():
+        fields = line.split("\0")
+        if len(fields) < 5 or not fields[0]:
+            continue
+        name, sha, peeled, date, subject = fields[:5]
+        tags.append(VersionEntry(VersionEntry.TAG, name, peeled or sha, subject, date))
+    return tags
+
+
+def parse_ls_remote(output):
+    """解析 git ls-remote --symref 的输出，返回 (默认分支或 None, 标签名列表)"""
+    default_branch, tags = None, []
+    for line in output.splitlines():
+        if line.startswith("ref: ") and line.endswith("\tHEAD"):
+            target = line[len("ref: "):-len("\tHEAD")].strip()
+            if target.startswith("refs/heads/"):
+                default_branch = target[len("refs/heads/"):]
+            continue
+        _, _, ref = line.partition("\t")
+        if ref.startswith("refs/tags/") and not ref.endswith("^{}"):
+            tags.append(ref[len("refs/tags/"):])
+    return default_branch, tags
+
+
+def _natural_key(name):
+    """标签排序用：数字部分按数值比较（v1.10 排在 v1.9 之后）"""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+def parse_commit_log(output):
+    commits = []
+    for line in output.splitlines():
+        fields = line.split("\0")
+        if len(fields) < 4 or not _is_sha(fields[0]):
+            continue
+        sha, date, author, subject = fields[:4]
+        commits.append(VersionEntry(VersionEntry.COMMIT, "", sha, subject, date, author))
+    return commits
+
+# --- 操作日志：git / pip 输出逐行写入固定容量的环形缓冲区 ---
+_GIT_PROGRESS_RE = re.compile(r"^(?:remote:\s*)?([A-Za-z][A-Za-z ]+):\s+(\d+)%")
+_PIP_PHASES = (
+    (re.compile(r"^\s*Collecting (\S+)"), "解析 {0}"),
+    (re.compile(r"^\s*Downloading (\S+?)(?:-\d[^ ]*)?(?:\s+\(([^)]+)\))?$"), "下载 {0} {1}"),
+    (re.compile(r"^\s*Building wheels? for (\S+)"), "构建 {0}"),
+    (re.compile(r"^\s*Installing collected packages"), "安装中"),
+    (re.compile(r"^\s*Successfully installed"), "安装完成"),
+)
+
+
+def parse_progress(line):
+    """从 git / pip 输出中解析进度，返回 (阶段, 百分比或 None)，无法识别时返回 None
+
+    git: "Receiving objects:  45% (450/1000)" 之类的行带百分比；
+    pip: 非终端下没有进度条，只能按 Collecting / Downloading 等阶段显示。
+    """
+    m = _GIT_PROGRESS_RE.match(line)
+    if m:
+        return m.group(1).strip(), int(m.group(2))
+    for pattern, template in _PIP_PHASES:
+        m = pattern.match(line)
+        if m:
+            return template.format(*(g or "" for g in m.groups())).strip(), None
+    return None
+
+
+class OperationLog:
+    """一次操作（更新、安装依赖等）的输出
+
+    append() 可以在任意线程调用；界面按序号增量读取 lines_since()，
+    只保留最近 max_lines 行，长时间的 pip 安装也不会占用越来越多的内存。
+    """
+    MAX_LINES = 2000
+    RUNNING, SUCCEEDED, FAILED = "running", "succeeded", "failed"
+
+    def __init__(self, title, max_lines=MAX_LINES):
+        self.title = title
+        self.state = self.RUNNING
+        self.phase = ""
+        self.percent = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lines = collections.deque(maxlen=max_lines)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(log) 在进度或状态变化时调用（调用线程不确定）"""
+        self._listeners.append(callback)
+
+    def append(self, text, is_stderr=False):
+        with self._lock:
+            self._seq += 1
+            self._lines.append((self._seq, text))
+        progress = parse_progress(text)
+        if progress is not None and progress != (self.phase, self.percent):
+            self.phase, self.percent = progress
+            self._notify()
+
+    def command(self, cmd_args):
+        self.append("$ " + " ".join(cmd_args))
+
+    def finish(self, success, message=""):
+        if message:
+            self.append(message)
+        self.state = self.SUCCEEDED if success else self.FAILED
+        self.finished_at = time.time()
+        self._notify()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def lines_since(self, seq):
+        """返回 (序号 > seq 的行, 是否有行已被挤出缓冲区)"""
+        with self._lock:
+            lines = [item for item in self._lines if item[0] > seq]
+            truncated = bool(self._lines) and self._lines[0][0] > seq + 1
+        return lines, truncated
+
+    def progress_text(self):
+        if self.percent is not None:
+            return f"{self.phase} {self.percent}%"
+        return self.phase
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Log listener error: {e}", file=sys.stderr)
+
+
+# 本地修改与更新冲突时 git 输出中的关键词
+_LOCAL_CHANGE_ERRORS = ("overwritten by merge", "overwritten by checkout", "stash them", "local changes", "aborted")
+
+
+def is_local_change_conflict(err):
+    return any(k in err for k in _LOCAL_CHANGE_ERRORS)
+
+
+# --- 核心类：Git 操作及依赖管理基类 ---
+class GitItemBase:
+    __slots__ = ("app", "full_path", "display_name", "is_update_available", "has_requirements",
+                 "ahead_count", "behind_count", "cancel_token", "fetch_error")
+
+    def __init__(self, app, path, display_name):
+        self.app = app
+        self.full_path = path
+        self.display_name = display_name
+        self.is_update_available = False
+        self.has_requirements = False
+        # 相对上游的提交数差异 (领先, 落后)
+        self.ahead_count = 0
+        self.behind_count = 0
+        # 移除该项时取消其所有命令
+        self.cancel_token = CancelToken()
+        # 最近一次 fetch 失败的原因（主机熔断、网络错误），成功时为 None
+        self.fetch_error = None
+
+    def check_requirements(self):
+        """检查是否存在 requirements.txt"""
+        req_path = os.path.join(self.full_path, "requirements.txt")
+        self.has_requirements = os.path.exists(req_path)
+        return self.has_requirements
+
+    def dependency_status(self):
+        """requirements.txt 在目标环境中的满足情况（只查环境索引，不启动进程）
+
+        没有 requirements.txt 或索引尚未就绪时返回 None。
+        """
+        req_path = os.path.join(self.full_path, "requirements.txt")
+        if not os.path.exists(req_path):
+            return None
+        return self.app.environment_index.status(self.app.python_exe, req_path)
+
+    def run_cmd_generic(self, cmd_args, cwd=None, show_window=False):
+        """通用的命令行执行方法 (用于 git 和 pip)"""
+        target_cwd = cwd if cwd else self.full_path
+        return self.app.run_cmd(cmd_args, target_cwd, show_window, token=self.cancel_token)
+
+    def run_git(self, args, log=None):
+        """log 为 OperationLog 时逐行输出到日志（网络命令附加 --progress 以显示进度）"""
+        cmd = [self.app.git_exe] + args
+        if log is None:
+            return self.run_cmd_generic(cmd)
+        if args and args[0] in ("fetch", "pull", "clone"):
+            cmd.insert(2, "--progress")
+        return self.app.run_cmd_streaming(cmd, self.full_path, log, token=self.cancel_token)
+
+    async def run_git_async(self, args, timeout=None, kind="git", log=None):
+        """在命令引擎的事件循环中执行 git（协程版本）；log 为 OperationLog 时逐行输出到日志"""
+        cmd = [self.app.git_exe] + args
+        if log is None:
+            return await self.app.engine.run(cmd, self.full_path, kind, timeout, self.app.command_env(),
+                                             self.cancel_token)
+        log.command(cmd)
+        return await self.app.engine.stream(cmd, self.full_path, kind, log.append, timeout, self.app.command_env(),
+                                            self.cancel_token)
+    
+    def run_pip_install(self, log=None):
+        """只为未满足的依赖执行 pip install，输出逐行写入 log"""
+        if not self.check_requirements():
+            return False, "未找到 requirements.txt"
+        req_path = os.path.join(self.full_path, "requirements.txt")
+        return self.app.install_requirements(req_path, self.display_name, self.full_path, log)
+
+    def git_reader(self):
+        return GitDirReader(self.full_path)
+
+    def is_git_repo(self):
+        return self.git_reader().is_repo
+
+    def remote_host(self):
+        return remote_host(self.git_reader().remote_url()) or "local"
+
+    @traced("fetch")
+    async def fetch_async(self):
+        """经 HostPolicy 执行 git fetch：同一主机限流、暂时性失败重试、主机熔断时直接跳过
+
+        传输速度持续低于 1KB/s 达 30 秒时由 git 自行中止，不必等到命令超时。
+        """
+        mirror, url = self.app.mirror, self.git_reader().remote_url()
+        if mirror is not None and url:
+            code, out, err = await self._fetch_via_mirror(mirror, url)
+        else:
+            args = ["-c", "http.lowSpeedLimit=1000", "-c", "http.lowSpeedTime=30", "fetch"] + await self._fetch_options()
+            code, out, err = await self.app.host_policy.run(
+                self.remote_host(), lambda: self.run_git_async(args, kind="git-network"))
+        self.fetch_error = None if code == 0 else (err or f"git fetch 返回错误码: {code}")
+        return code, out, err
+
+    async def _fetch_via_mirror(self, mirror, url):
+        """上游先同步到对象池（离线模式跳过），再从对象池本地 fetch，对象通过 alternates 共享
+
+        对象池总是完整 fetch，此时不使用 [FetchStrategy] 中的策略。
+        """
+        if not mirror.offline:
+            code, out, err = await self.app.host_policy.run(self.remote_host(), lambda: mirror.sync(url))
+            if code != 0:
+                return code, out, err
+        elif not await mirror.has(url):
+            return 1, "", "对象池中没有该上游的镜像"
+        if not mirror.attach(self.git_reader()):
+            return 1, "", "无法把对象池加入 alternates"
+        return await self.run_git_async(mirror.fetch_args(url))
+
+    def fetch_strategy(self):
+        return self.app.fetch_strategy(self.full_path, self.git_reader())
+
+    async def _fetch_options(self):
+        """按 fetch 策略附加的参数"""
+        if self.fetch_strategy() == FETCH_BLOBLESS:
+            # 只下载提交与目录树，文件内容在 checkout / merge 时按需获取
+            return ["--filter=blob:none"]
+        # 浅克隆同样不加参数：不带 --depth 的 fetch 只取新提交，不改变本地的浅克隆边界
+        return []
+
+    def ensure_version_available(self, version, log=None):
+        """目标标签或提交不在本地时（浅克隆、只存在于远程的标签）先按需拉取
+
+        不使用 --depth：git 会按这次拉取的引用重新计算浅克隆边界，可能截断当前分支已有的历史。
+        """
+        reader = self.git_reader()
+        if version.kind == VersionEntry.TAG:
+            if not reader.resolve_ref(f"refs/tags/{version.ref}"):
+                self.run_git(["fetch", "--no-tags", "origin", "tag", version.ref], log)
+            return
+        if not reader.is_shallow() or self.run_git(["cat-file", "-e", f"{version.sha}^{{commit}}"])[0] == 0:
+            return
+        code, _, _ = self.run_git(["fetch", "origin", version.sha], log)
+        if code != 0:
+            # 服务器不允许按 SHA 拉取时只能补全全部历史
+            self.run_git(["fetch", "--unshallow"], log)
+
+    @traced("metadata")
+    async def refresh_remote_metadata_async(self, force=False):
+        """TTL 过期时用一次 ls-remote 同时取得默认分支与远程标签，返回缓存条目"""
+        url = self.git_reader().remote_url()
+        if not url:
+            return None
+        cache = self.app.remote_metadata
+        entry = cache.get(url)
+        if force or cache.is_stale(entry):
+            args = ["ls-remote", "--symref", "origin", "HEAD", "refs/tags/*"]
+            entry = await cache.refresh(url, lambda: self.app.host_policy.run(
+                self.remote_host(), lambda: self.run_git_async(args, kind="git-network")))
+        return entry
+
+    def schedule_metadata_refresh(self):
+        """元数据过期时在后台刷新，不阻塞调用方"""
+        url = self.git_reader().remote_url()
+        cache = self.app.remote_metadata
+        if url and cache.is_stale(cache.get(url)):
+            self.app.engine.submit(self.refresh_remote_metadata_async(), self.cancel_token)
+
+    async def default_branch_async(self):
+        """远程默认分支：先读本地 refs/remotes/origin/HEAD，其次元数据缓存，都没有时才 ls-remote 一次"""
+        reader = self.git_reader()
+        branch = reader.remote_default_branch()
+        if branch:
+            return branch
+        url = reader.remote_url()
+        entry = self.app.remote_metadata.get(url) if url else None
+        if entry is None:
+            entry = await self.refresh_remote_metadata_async()
+        return entry.get("default_branch") if entry else None
+
+    def default_branch(self):
+        """default_branch_async 的同步版本，供普通线程调用"""
+        return self.app.engine.call(self.default_branch_async(), self.cancel_token)
+
+    def remote_tags(self):
+        """元数据缓存中的远程标签名（不访问网络，缓存中没有时为空列表）"""
+        url = self.git_reader().remote_url()
+        entry = self.app.remote_metadata.get(url) if url else None
+        return entry["tags"] if entry else []
+
+    def check_status_base(self, fetch=True):
+        """check_status_async 的同步版本，供普通线程调用"""
+        return self.app.engine.call(self.check_status_async(fetch), self.cancel_token)
+
+    @traced("check")
+    async def check_status_async(self, fetch=True):
+        """fetch=False 时只读取本地 refs，用于离线快速判断"""
+        reader = self.git_reader()
+        if not reader.is_repo:
+            return "非Git仓库", "gray", False
+        
+        if fetch:
+            await self.fetch_async()
+            if self.fetch_error is None:
+                self.schedule_metadata_refresh()
+
+        self.ahead_count, self.behind_count = 0, 0
+        # 先直接比较 HEAD 与上游引用，无需启动 git 进程
+        head_ref, head_sha = reader.read_head()
+        if head_ref is None and head_sha:
+            return "处于历史版本", "orange", False
+        upstream = "@{upstream}"
+        if head_ref and head_sha and head_ref.startswith("refs/heads/"):
+            upstream = reader.upstream_ref(head_ref[len("refs/heads/"):])
+            upstream_sha = reader.resolve_ref(upstream)
+            if upstream_sha is None or upstream_sha == head_sha:
+                return "最新版本", "green", False
+
+        # 本地与上游不一致时，按 refs 计算精确的领先/落后提交数（与 git 语言设置无关，也不扫描工作区）
+        code, out, _ = await self.run_git_async(["rev-list", "--left-right", "--count", f"HEAD...{upstream}"])
+        counts = out.split()
+        if code != 0 or len(counts) != 2 or not all(c.isdigit() for c in counts):
+            return "最新版本", "green", False
+        self.ahead_count, self.behind_count = int(counts[0]), int(counts[1])
+
+        if self.behind_count:
+            return f"落后 {self.behind_count}", "red", True
+        if self.ahead_count:
+            return f"领先 {self.ahead_count}", "green", False
+        return "最新版本", "green", False
+
+    def fetch_versions_base(self, commit_limit=15, tag_limit=8):
+        """fetch_versions_async 的同步版本，供普通线程调用"""
+        return self.app.engine.call(self.fetch_versions_async(commit_limit, tag_limit), self.cancel_token)
+
+    @traced("versions")
+    async def fetch_versions_async(self, commit_limit=15, tag_limit=8):
+        """for-each-ref 与 log 并发执行，取得全部版本信息，返回 VersionEntry 列表
+
+        列表顺序：最新版本、标签（按创建时间倒序）、提交（从 HEAD 开始）。
+        """
+        if not self.is_git_repo():
+            return []
+        versions = [VersionEntry.latest()]
+
+        (tag_code, tag_out, _), (log_code, log_out, _) = await asyncio.gather(
+            self.run_git_async(["for-each-ref", "--sort=-creatordate", f"--count={tag_limit}",
+                                f"--format={TAG_REF_FORMAT}", "refs/tags"]),
+            self.run_git_async(["log", f"--format={COMMIT_LOG_FORMAT}", "--date=short", "-n", str(commit_limit)]),
+        )
+        if tag_code == 0 and tag_out:
+            versions.extend(parse_tag_refs(tag_out))
+        if self.git_reader().is_shallow():
+            # 浅克隆通常缺少较早的标签，补上元数据缓存中的远程标签，选中时再按需拉取
+            local = {v.ref for v in versions if v.kind == VersionEntry.TAG}
+            remote_only = sorted((t for t in self.remote_tags() if t not in local), key=_natural_key, reverse=True)
+            versions.extend(VersionEntry(VersionEntry.TAG, t) for t in remote_only[:max(0, tag_limit - len(local))])
+        if log_code == 0 and log_out:
+            versions.extend(parse_commit_log(log_out))
+        return versions
+
+    @traced("fast-forward")
+    async def fast_forward_async(self, log=None):
+        """用已 fetch 到本地的上游引用快进当前分支（merge --ff-only），不访问网络
+
+        分离头指针时先切回远程默认分支。返回 (成功, 信息)。
+        """
+        reader = self.git_reader()
+        head_ref, old_sha = reader.read_head()
+        if head_ref is None:
+            branch = await self.default_branch_async()
+            if not branch:
+                return False, "处于历史版本，且无法确定默认分支"
+            code, _, err = await self.run_git_async(["checkout", branch], log=log)
+            if code != 0:
+                return False, f"切换到 {branch} 失败: {err}"
+            reader = self.git_reader()
+            head_ref, _ = reader.read_head()
+        if not head_ref or not head_ref.startswith("refs/heads/"):
+            return False, "无法确定当前分支"
+        upstream = reader.upstream_ref(head_ref[len("refs/heads/"):])
+        if reader.resolve_ref(upstream) is None:
+            return False, f"未找到上游引用 {upstream}"
+
+        code, _, err = await self.run_git_async(["merge", "--ff-only", upstream], log=log)
+        if code != 0 and is_local_change_conflict(err):
+            # 确认对话框可能需要等待用户，放到线程池中执行，不阻塞事件循环
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, self.app.confirm_discard_changes, self.display_name):
+                await self.run_git_async(["reset", "--hard", "HEAD"], log=log)
+                code, _, err = await self.run_git_async(["merge", "--ff-only", upstream], log=log)
+        if code != 0:
+            if "not possible to fast-forward" in err.lower() or "diverging" in err.lower():
+                return False, "本地有独立提交，无法快进"
+            return False, f"快进失败: {err}"
+        new_sha = self.git_reader().read_head()[1]
+        return True, f"{(old_sha or '')[:7]} → {(new_sha or '')[:7]}"
+
+    @traced("update")
+    def do_update_logic(self, version, silent=False, log=None):
+        """version 为 VersionEntry；log 为 OperationLog 时实时记录 git 输出"""
+        try:
+            def try_force_reset(err_msg):
+                if is_local_change_conflict(err_msg):
+                    if self.app.confirm_discard_changes(self.display_name):
+                        r_code, _, r_err = self.run_git(["reset", "--hard", "HEAD"], log)
+                        return r_code == 0
+                return False
+
+            if version.kind == VersionEntry.LATEST:
+                # 默认分支来自本地 origin/HEAD 或元数据缓存，通常不需要额外的网络往返
+                head_branch = self.default_branch() or self.git_reader().current_branch()
+                if not head_branch:
+                    return False, "无法确定远程默认分支"
+
+                self.run_git(["checkout", head_branch], log)
+                code, out, err = self.run_git(["pull"], log)
+                if code != 0:
+                    if try_force_reset(err):
+                        code, out, err = self.run_git(["pull"], log)
+
+                if code == 0:
+                    return True, "更新成功"
+                else:
+                    return False, f"更新失败: {err}"
+
+            elif version.kind in (VersionEntry.TAG, VersionEntry.COMMIT):
+                self.ensure_version_available(version, log)
+                code, _, err = self.run_git(["checkout", version.target], log)
+                if code != 0:
+                    if try_force_reset(err):
+                        code, _, err = self.run_git(["checkout", version.target], log)
+                
+                if code == 0:
+                    return True, f"已回退: {version.ref or version.short_sha}"
+                else:
+                    return False, f"切换失败: {err}"
+            return False, "未选择操作"
+
+        except Exception as e:
+            return False, str(e)
+
+
+# --- 批量更新流水线：网络阶段并发 fetch，磁盘阶段本地快进 ---
+class StageStats:
+    """流水线单个阶段的吞吐统计"""
+    __slots__ = ("name", "count", "failed", "busy", "started", "finished")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.failed = 0
+        self.busy = 0.0         # 各仓库耗时之和
+        self.started = None     # 第一个仓库开始的时间 (time.monotonic)
+        self.finished = None    # 最后一个仓库结束的时间
+
+    def record(self, started, ok):
+        now = time.monotonic()
+        self.count += 1
+        self.failed += 0 if ok else 1
+        self.busy += now - started
+        self.started = started if self.started is None else min(self.started, started)
+        self.finished = now if self.finished is None else max(self.finished, now)
+
+    @property
+    def wall(self):
+        return (self.finished - self.started) if self.count else 0.0
+
+    @property
+    def throughput(self):
+        return self.count / self.wall if self.wall > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.name}: {self.count} 个仓库, 失败 {self.failed}, 用时 {self.wall:.2f}s, "
+                f"{self.throughput:.1f} 个/秒, 平均 {self.busy / self.count if self.count else 0:.2f}s/个")
+
+    def to_dict(self):
+        return {"count": self.count, "failed": self.failed, "wall": round(self.wall, 4),
+                "busy": round(self.busy, 4), "throughput": round(self.throughput, 3)}
+
+
+class UpdateResult:
+    """单个仓库在流水线中的结果"""
+    __slots__ = ("item", "fetch_state", "fetch_seconds", "merge_state", "merge_seconds", "behind", "message")
+
+    def __init__(self, item):
+        self.item = item
+        self.fetch_state = "pending"    # ok / failed / skipped
+        self.fetch_seconds = 0.0
+        self.merge_state = "pending"    # updated / up-to-date / failed / skipped
+        self.merge_seconds = 0.0
+        self.behind = 0
+        self.message = ""
+
+    @property
+    def ok(self):
+        return self.fetch_state != "failed" and self.merge_state not in ("failed", "pending")
+
+    def to_dict(self):
+        return {
+            "name": self.item.display_name,
+            "path": self.item.full_path,
+            "ok": self.ok,
+            "fetch": self.fetch_state,
+            "action": self.merge_state,
+            "commits": self.behind,
+            "update_available": self.behind > 0 and self.merge_state != "updated",
+            "message": self.message,
+            "timings": {"fetch": round(self.fetch_seconds, 4), "merge": round(self.merge_seconds, 4)},
+            "head": self.item.git_reader().read_head()[1],
+        }
+
+
+class UpdatePipeline:
+    """批量更新的两段流水线
+
+    网络阶段以较高并发执行 fetch（同一主机仍受 HostPolicy 限制），每完成一个就交给
+    磁盘阶段；磁盘阶段按本地引用计算落后数并 merge --ff-only，不再访问网络，
+    并发数按本地磁盘调整。两个阶段同时进行。
+    on_event(result, stage) 在事件循环线程中调用，stage 为 "fetch" 或 "merge"。
+    """
+    def __init__(self, app, items, network_concurrency=None, disk_concurrency=None, on_event=None, log=None):
+        self.app = app
+        self.results = [UpdateResult(item) for item in items]
+        self.network_concurrency = network_concurrency or max(app.check_concurrency, 16)
+        self.disk_concurrency = disk_concurrency or app.disk_concurrency
+        self.on_event = on_event
+        self.log = log
+        self.stages = {"fetch": StageStats("网络阶段 (fetch)"), "merge": StageStats("磁盘阶段 (快进)")}
+        self.elapsed = 0.0
+
+    @traced("update-all")
+    async def run(self):
+        start = time.monotonic()
+        queue = asyncio.Queue()
+        network_slots = asyncio.Semaphore(self.network_concurrency)
+
+        async def fetch_stage(result):
+            async with network_slots:
+                await self._fetch(result)
+            await queue.put(result)
+
+        async def disk_stage():
+            while True:
+                result = await queue.get()
+                if result is None:
+                    return
+                await self._merge(result)
+
+        workers = [asyncio.ensure_future(disk_stage()) for _ in range(max(1, self.disk_concurrency))]
+        await asyncio.gather(*(fetch_stage(r) for r in self.results))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        self.elapsed = time.monotonic() - start
+        if self.log is not None:
+            self.log.append(self.summary_table())
+        return self.results
+
+    def _emit(self, result, stage):
+        if self.log is not None:
+            state = result.fetch_state if stage == "fetch" else result.merge_state
+            self.log.append(f"[{stage}] {result.item.display_name}: {state} {result.message}".rstrip())
+        if self.on_event is not None:
+            self.on_event(result, stage)
+
+    async def _fetch(self, result):
+        item = result.item
+        if not item.is_git_repo():
+            result.fetch_state, result.merge_state, result.message = "skipped", "skipped", "非Git仓库"
+            self._emit(result, "fetch")
+            return
+        started = time.monotonic()
+        try:
+            code, _, err = await item.fetch_async()
+        except asyncio.CancelledError:
+            code, err = -1, "已取消"
+        result.fetch_seconds = time.monotonic() - started
+        result.fetch_state = "ok" if code == 0 else "failed"
+        if code != 0:
+            result.merge_state, result.message = "skipped", err.splitlines()[-1] if err else "fetch 失败"
+        self.stages["fetch"].record(started, code == 0)
+        self._emit(result, "fetch")
+
+    async def _merge(self, result):
+        if result.merge_state != "pending":
+            return
+        item = result.item
+        started = time.monotonic()
+        try:
+            if item.git_reader().is_detached():
+                # 用户固定在某个标签/提交上，批量更新不改动
+                result.merge_state, result.message = "skipped", "处于历史版本，跳过"
+                return
+            await item.check_status_async(fetch=False)
+            result.behind = item.behind_count
+            if item.behind_count == 0:
+                result.merge_state, result.message = "up-to-date", "已是最新"
+                return
+            ok, msg = await item.fast_forward_async(self.log)
+            result.merge_state, result.message = ("updated" if ok else "failed"), msg
+            if ok:
+                item.behind_count, item.is_update_available = 0, False
+        except asyncio.CancelledError:
+            result.merge_state, result.message = "failed", "已取消"
+        finally:
+            result.merge_seconds = time.monotonic() - started
+            self.stages["merge"].record(started, result.merge_state != "failed")
+            self._emit(result, "merge")
+
+    def summary_table(self):
+        """文字表格：每个仓库一行，末尾附各阶段吞吐"""
+        labels = {"ok": "成功", "failed": "失败", "skipped": "跳过", "pending": "-",
+                  "updated": "已更新", "up-to-date": "已是最新"}
+        name_width = max([len(r.item.display_name) for r in self.results] + [4])
+        lines = [f"{'插件'.ljust(name_width)}  获取    快进      提交  耗时     信息"]
+        for r in self.results:
+            lines.append(f"{r.item.display_name.ljust(name_width)}  {labels[r.fetch_state]:<6}"
+                         f"{labels[r.merge_state]:<8}{r.behind:>6}  {r.fetch_seconds + r.merge_seconds:>6.2f}s  {r.message}")
+        lines.append("")
+        lines += [stage.summary() for stage in self.stages.values()]
+        updated = sum(1 for r in self.results if r.merge_state == "updated")
+        failed = sum(1 for r in self.results if not r.ok)
+        lines.append(f"总计: {len(self.results)} 个仓库, 更新 {updated}, 失败 {failed}, 总用时 {self.elapsed:.2f}s")
+        return "\n".join(lines)
+
+    def stats_dict(self):
+        return {name: stage.to_dict() for name, stage in self.stages.items()}
+
+
+# --- 配置与运行环境：图形界面与命令行模式共用 ---
+class UpdaterBase:
+    """保存全局设置并提供统一的命令执行入口
+
+    conflict_policy 决定更新遇到本地修改时的处理方式：
+    "ask" 由界面询问用户，"reset" 丢弃本地修改，"skip" 放弃该仓库。
+    """
+    def __init__(self, config_path=CONFIG_FILE):
+        self.config_path = config_path
+        self.config = configparser.ConfigParser()
+
+        # 默认值
+        self.git_exe = "git"
+        self.python_exe = "python"
+        self.comfyui_root = ""
+        self.nodes_path = ""
+        self.proxy_url = "" 
+        self.check_concurrency = 8  # 同时进行状态检查的插件数量上限
+        self.host_concurrency = 4  # 同一远程主机（如 github.com）同时进行的 fetch 数量上限
+        self.disk_concurrency = 2  # 批量更新时同时进行本地快进的仓库数量
+        self.fetch_strategies = {}  # [FetchStrategy] 目录名(小写) -> full / blobless / auto
+        self.mirror_path = ""  # 共享对象池目录，留空表示不使用
+        self.mirror_offline = False  # 只从对象池更新，不访问上游
+        self.profile_concurrency = 4  # 导入耗时分析时同时运行的 Python 进程数
+        self.profile_timeout = 120  # 单个插件导入超过该秒数视为超时
+        self.profile_preload = []  # 分析前预先导入、不计入插件耗时的模块（如 torch）
+        self.cache_ttl_minutes = 30  # 缓存超过该时长才重新 fetch
+        self.watch_interval_seconds = 5.0  # 目录监视的轮询间隔，0 表示关闭
+        self.conflict_policy = "skip"
+        self._requirements_cache = None
+        self._environment_index = None
+        self._engine = None
+        self._host_policy = None
+        self._remote_metadata = None
+        self._mirror = None
+        self._profile_history = None
+
+    @property
+    def cache_path(self):
+        return os.path.join(os.path.dirname(self.config_path), CACHE_FILE)
+
+    @property
+    def engine(self):
+        """全局共享的命令引擎，git 并发上限跟随 check_concurrency"""
+        if self._engine is None:
+            self._engine = CommandEngine({"git": self.check_concurrency})
+        return self._engine
+
+    @property
+    def host_policy(self):
+        """网络 git 命令按远程主机限流与熔断（只在命令引擎的事件循环中使用）"""
+        if self._host_policy is None:
+            self._host_policy = HostPolicy(self.host_concurrency)
+        return self._host_policy
+
+    def fetch_strategy(self, repo_path, reader=None):
+        """[FetchStrategy] 中按目录名指定的策略；未指定或为 auto 时保持仓库原有的克隆方式：
+        已是部分克隆的使用 blobless，其余完整 fetch（浅克隆保持原有边界）
+
+        完整克隆不会自动改为 blobless：部分克隆在 merge / checkout 时会联网补取文件内容，
+        落盘阶段与离线模式都不再可靠。
+        """
+        strategy = self.fetch_strategies.get(os.path.basename(os.path.normpath(repo_path)).lower(), FETCH_AUTO)
+        if strategy in (FETCH_FULL, FETCH_BLOBLESS):
+            return strategy
+        reader = reader or GitDirReader(repo_path)
+        if reader.is_partial():
+            return FETCH_BLOBLESS
+        return FETCH_FULL
+
+    def command_env(self):
+        env = os.environ.copy()
+        env["GIT_TERMINAL_PROMPT"] = "0"
+        env["GCM_INTERACTIVE"] = "never"
+        if self.proxy_url:
+            env["http_proxy"] = self.proxy_url
+            env["https_proxy"] = self.proxy_url
+        return env
+
+    def command_kind(self, cmd_args):
+        """按可执行文件区分命令类型，各类型有独立的并发上限与超时"""
+        if cmd_args and cmd_args[0] == self.git_exe:
+            return "git"
+        if cmd_args[1:3] == ["-m", "pip"]:
+            return "pip"
+        return "other"
+
+    @property
+    def remote_metadata(self):
+        """远程默认分支与标签的缓存，所有仓库共用"""
+        if self._remote_metadata is None:
+            path = os.path.join(os.path.dirname(self.config_path), REMOTE_CACHE_FILE)
+            self._remote_metadata = RemoteMetadataCache(path, self.cache_ttl_minutes * 60)
+        return self._remote_metadata
+
+    @property
+    def mirror(self):
+        """配置了 [Mirror] path 时返回共享对象池，否则为 None"""
+        if self._mirror is None and self.mirror_path:
+            self._mirror = MirrorStore(self, self.mirror_path, self.mirror_offline)
+        return self._mirror
+
+    @property
+    def profile_history(self):
+        """插件导入耗时分析的历史记录"""
+        if self._profile_history is None:
+            self._profile_history = ProfileHistory(os.path.join(os.path.dirname(self.config_path),
+                                                                PROFILE_HISTORY_FILE))
+        return self._profile_history
+
+    @property
+    def environment_index(self):
+        """python_exe 环境中已安装包的索引，依赖相关的功能共用"""
+        if self._environment_index is None:
+            path = os.path.join(os.path.dirname(self.config_path), ENVIRONMENT_INDEX_FILE)
+            self._environment_index = EnvironmentIndex(path)
+        return self._environment_index
+
+    @property
+    def requirements_cache(self):
+        if self._requirements_cache is None:
+            path = os.path.join(os.path.dirname(self.config_path), REQUIREMENTS_CACHE_FILE)
+            self._requirements_cache = RequirementsCache(path)
+        return self._requirements_cache
+
+    def load_config(self):
+        if not os.path.exists(self.config_path): return
+        try:
+            self.config.read(self.config_path, encoding='utf-8')
+            if 'Settings' in self.config:
+                self.git_exe = self.config['Settings'].get('git_path', 'git').strip()
+                self.python_exe = self.config['Settings'].get('python_path', 'python').strip()
+                
+                p = self.config['Settings'].get('comfyui_root_path', '').strip()
+                if p:
+                    # 如果是相对路径，按配置文件所在目录转为绝对路径
+                    if not os.path.isabs(p):
+                        p = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(self.config_path)), p))
+                    self.comfyui_root = p
+            
+            if 'Network' in self.config:
+                self.proxy_url = self.config['Network'].get('https_proxy', '').strip()
+
+            if 'Performance' in self.config:
+                self.check_concurrency = self.config['Performance'].getint('check_concurrency', self.check_concurrency)
+                self.host_concurrency = self.config['Performance'].getint('host_concurrency', self.host_concurrency)
+                self.disk_concurrency = self.config['Performance'].getint('disk_concurrency', self.disk_concurrency)
+                self.cache_ttl_minutes = self.config['Performance'].getint('cache_ttl_minutes', self.cache_ttl_minutes)
+                self.watch_interval_seconds = self.config['Performance'].getfloat('watch_interval_seconds', self.watch_interval_seconds)
+            if 'Mirror' in self.config:
+                p = self.config['Mirror'].get('path', '').strip()
+                if p and not os.path.isabs(p):
+                    p = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(self.config_path)), p))
+                self.mirror_path = p
+                self.mirror_offline = self.config['Mirror'].getboolean('offline', self.mirror_offline)
+
+            if 'Profile' in self.config:
+                self.profile_concurrency = self.config['Profile'].getint('concurrency', self.profile_concurrency)
+                self.profile_timeout = self.config['Profile'].getint('timeout', self.profile_timeout)
+                preload = self.config['Profile'].get('preload', '')
+                self.profile_preload = [m.strip() for m in preload.split(',') if m.strip()]
+
+            if 'FetchStrategy' in self.config:
+                self.fetch_strategies = {name.lower(): value.strip().lower()
+                                         for name, value in self.config['FetchStrategy'].items()}
+        except Exception as e:
+            print(f"Load config error: {e}", file=sys.stderr)
+
+    def write_config(self):
+        """将当前内存中的变量写入 config.ini，失败时抛出 OSError"""
+        if 'Settings' not in self.config: self.config['Settings'] = {}
+        if 'Network' not in self.config: self.config['Network'] = {}
+        if 'Performance' not in self.config: self.config['Performance'] = {}
+        if 'Mirror' not in self.config: self.config['Mirror'] = {}
+        if 'Profile' not in self.config: self.config['Profile'] = {}
+
+        self.config['Settings']['git_path'] = self.git_exe
+        self.config['Settings']['python_path'] = self.python_exe
+        
+        # 尝试存相对路径以便便携，如果不在同级目录则存绝对路径
+        try:
+            rel_path = os.path.relpath(self.comfyui_root, os.getcwd())
+            if ".." in rel_path and not rel_path.startswith(".."): # 简单的判断
+                 self.config['Settings']['comfyui_root_path'] = self.comfyui_root
+            else:
+                 self.config['Settings']['comfyui_root_path'] = rel_path
+        except:
+            self.config['Settings']['comfyui_root_path'] = self.comfyui_root
+
+        self.config['Network']['https_proxy'] = self.proxy_url
+        self.config['Performance']['check_concurrency'] = str(self.check_concurrency)
+        self.config['Performance']['host_concurrency'] = str(self.host_concurrency)
+        self.config['Performance']['disk_concurrency'] = str(self.disk_concurrency)
+        self.config['Performance']['cache_ttl_minutes'] = str(self.cache_ttl_minutes)
+        self.config['Performance']['watch_interval_seconds'] = str(self.watch_interval_seconds)
+        self.config['Mirror']['path'] = self.mirror_path
+        self.config['Mirror']['offline'] = str(self.mirror_offline).lower()
+        self.config['Profile']['concurrency'] = str(self.profile_concurrency)
+        self.config['Profile']['timeout'] = str(self.profile_timeout)
+        self.config['Profile']['preload'] = ", ".join(self.profile_preload)
+
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            self.config.write(f)
+
+    def set_paths(self, root_path):
+        self.comfyui_root = root_path
+        self.nodes_path = os.path.join(root_path, "custom_nodes")
+
+    def list_plugin_folders(self):
+        """custom_nodes 下的插件目录名（忽略 __pycache__ 与隐藏目录）"""
+        if not self.nodes_path or not os.path.exists(self.nodes_path):
+            return []
+        with os.scandir(self.nodes_path) as it:
+            folders = [e.name for e in it if e.is_dir() and not (e.name.startswith("__") or e.name.startswith("."))]
+        return sorted(folders, key=str.lower)
+
+    def confirm_discard_changes(self, display_name):
+        """更新因本地修改失败时是否丢弃修改，界面模式下由子类弹窗询问"""
+        return self.conflict_policy == "reset"
+
+    def run_cmd(self, cmd_args, cwd, show_window=False, timeout=None, token=None):
+        """执行命令，统一处理代理和环境（在命令引擎中运行，调用线程同步等待）
+        
+        Args:
+            cmd_args: 命令参数列表
+            cwd: 工作目录
+            show_window: 是否显示终端窗口（用于pip安装等需要用户查看进度的操作）
+            timeout: 超时秒数，默认按命令类型决定
+            token: CancelToken，取消后立即返回 (-1, "", "已取消")
+        """
+        return self.engine.run_sync(cmd_args, cwd, self.command_kind(cmd_args), timeout,
+                                    self.command_env(), token, show_window)
+
+    def run_cmd_streaming(self, cmd_args, cwd, log, timeout=None, token=None):
+        """执行命令并把输出逐行写入 log (OperationLog)，返回 (返回码, stdout 末尾, stderr 末尾)"""
+        log.command(cmd_args)
+        return self.engine.stream_sync(cmd_args, cwd, self.command_kind(cmd_args), log.append, timeout,
+                                       self.command_env(), token)
+
+    def new_operation_log(self, title):
+        """创建一次操作的日志；图形界面会把它加入日志面板"""
+        return OperationLog(title)
+
+    def run_pip(self, pip_args, cwd, log):
+        """用配置的 Python 执行 pip，输出逐行写入 log，返回 (成功, 输出末尾)"""
+        if not self.python_exe:
+            return False, "未配置 Python 路径"
+        code, out, err = self.run_cmd_streaming([self.python_exe, "-m", "pip"] + pip_args, cwd, log)
+        # 即使失败也可能装上了部分包，环境索引下次使用前重新检查
+        self.environment_index.invalidate()
+        if code == 0:
+            return True, out or "依赖安装完成"
+        return False, err or out or f"pip 返回错误码: {code}"
+
+    @traced("pip")
+    def install_requirements(self, req_path, title, cwd, log=None, remember=True):
+        """只为尚未满足的依赖执行 pip；requirements 与环境都没变化时不启动 pip
+
+        输出逐行写入 log，未提供时新建一个操作日志。
+        """
+        if log is None:
+            log = self.new_operation_log(f"安装依赖: {title}")
+        lines, reason = find_unmet_requirements(self, req_path, remember)
+        log.append(reason)
+        if not lines:
+            log.finish(True)
+            return True, reason
+
+        fd, pending_path = tempfile.mkstemp(suffix=".txt", prefix="comfy_pending_requirements_")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        try:
+            success, msg = self.run_pip(["install", "-r", pending_path], cwd, log)
+        finally:
+            try:
+                os.remove(pending_path)
+            except OSError:
+                pass
+        if success and remember:
+            remember_requirements_installed(self, req_path)
+        log.finish(success)
+        return success, msg
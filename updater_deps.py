@@ -0,0 +1,733 @@
+"""依赖合并：汇总所有插件与本体的 requirements.txt，一次 pip 解析安装（不依赖 tkinter）
+
+每个插件单独 pip install 会重复解析、互相降级；这里先把全部需求按包名归并，
+提前找出互相矛盾的版本约束并指出来源插件，再交给一次 pip install 统一解析。
+安装前会用 requirements 指纹与环境快照过滤掉已经满足的需求，没有变化时不启动 pip。
+目标环境已安装的包由 EnvironmentIndex 统一索引，site-packages 未变化时各功能都不必再启动 python。
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import sys
+
+REQUIREMENTS_FILE = "requirements.txt"
+REQUIREMENTS_CACHE_FILE = "requirements_cache.json"
+ENVIRONMENT_INDEX_FILE = "environment_index.json"
+CORE_SOURCE = "ComfyUI"
+
+# pip 会透传的全局选项（合并后放在文件开头）
+_GLOBAL_OPTIONS = ("--index-url", "-i", "--extra-index-url", "--find-links", "-f", "--trusted-host", "--pre")
+_NAME_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*(.*)$")
+_SPEC_RE = re.compile(r"^\s*(===|==|!=|~=|>=|<=|>|<)\s*([^\s,;]+)\s*$")
+_VERSION_RE = re.compile(
+    r"^\s*v?(?:\d+!)?(\d+(?:\.\d+)*)"
+    r"(?:[-_.]?(a|b|c|rc|alpha|beta|pre|preview)[-_.]?(\d*))?"
+    r"(?:[-_.]?(post|rev|r)[-_.]?(\d*)|-(\d+))?"
+    r"(?:[-_.]?(dev)[-_.]?(\d*))?"
+    r"(?:\+[a-z0-9.]*)?\s*$", re.I)
+_PRE_RANK = {"a": 0, "alpha": 0, "b": 1, "beta": 1, "c": 2, "rc": 2, "pre": 2, "preview": 2}
+
+
+def normalize_name(name):
+    """PEP 503 包名规范化：大小写与 -_. 差异视为同一个包"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_version(text):
+    """把版本号转为可比较的元组，无法识别时返回 None"""
+    m = _VERSION_RE.match(text)
+    if not m:
+        return None
+    release = tuple(int(p) for p in m.group(1).split("."))
+    while len(release) > 1 and release[-1] == 0:
+        release = release[:-1]
+    pre, pre_n, post, post_n, post_implicit, dev, dev_n = m.group(2, 3, 4, 5, 6, 7, 8)
+    has_post = post is not None or post_implicit is not None
+    if pre:
+        pre_key = (0, _PRE_RANK[pre.lower()], int(pre_n or 0))
+    elif dev and not has_post:
+        pre_key = (-1,)
+    else:
+        pre_key = (1,)
+    post_key = (1, int(post_n or post_implicit or 0)) if has_post else (0,)
+    dev_key = (0, int(dev_n or 0)) if dev else (1,)
+    return release, pre_key, post_key, dev_key
+
+
+def version_satisfies(version, op, spec_version):
+    """判断 version 是否满足单个约束；无法解析的版本按满足处理（不误报冲突）"""
+    if op == "===":
+        return version.strip() == spec_version.strip()
+    if spec_version.endswith(".*") and op in ("==", "!="):
+        v = parse_version(version)
+        prefix = parse_version(spec_version[:-2])
+        if v is None or prefix is None:
+            return True
+        matched = (v[0] + (0,) * len(prefix[0]))[:len(prefix[0])] == prefix[0]
+        return matched if op == "==" else not matched
+    v, s = parse_version(version), parse_version(spec_version)
+    if v is None or s is None:
+        return True
+    if op == "==":
+        return v == s
+    if op == "!=":
+        return v != s
+    if op == ">=":
+        return v >= s
+    if op == "<=":
+        return v <= s
+    if op == ">":
+        return v > s
+    if op == "<":
+        return v < s
+    if op == "~=":
+        release = tuple(int(p) for p in re.findall(r"\d+", spec_version.split("+")[0])[:-1]) or (0,)
+        return v >= s and (v[0] + (0,) * len(release))[:len(release)] == release
+    return True
+
+
+class Requirement:
+    """requirements.txt 中的一行需求"""
+    __slots__ = ("name", "key", "extras", "specs", "marker", "url", "source", "line")
+
+    def __init__(self, name, extras=(), specs=(), marker="", url="", source="", line=""):
+        self.name = name
+        self.key = normalize_name(name)
+        self.extras = set(extras)
+        self.specs = list(specs)    # [(op, version)]
+        self.marker = marker
+        self.url = url
+        self.source = source
+        self.line = line
+
+    def spec_text(self):
+        if self.url:
+            return f"@ {self.url}"
+        return ",".join(f"{op}{v}" for op, v in self.specs)
+
+
+def parse_requirement_line(line, source=""):
+    """解析一行需求，返回 Requirement；无法识别为具名需求时返回 None"""
+    requirement, _, marker = line.partition(";")
+    m = _NAME_RE.match(requirement.strip())
+    if not m:
+        return None
+    name, extras, rest = m.groups()
+    extras = [e.strip() for e in extras[1:-1].split(",") if e.strip()] if extras else []
+    rest = rest.strip()
+    url = ""
+    specs = []
+    if rest.startswith("@"):
+        url = rest[1:].strip()
+    elif rest:
+        rest = rest.strip("()")
+        for part in rest.split(","):
+            sm = _SPEC_RE.match(part)
+            if not sm:
+                return None
+            specs.append(sm.groups())
+    return Requirement(name, extras, specs, marker.strip(), url, source, line)
+
+
+def read_requirements(path, source, _seen=None):
+    """读取 requirements 文件（支持 -r 嵌套引用与续行）
+
+    返回 (需求列表, 全局选项列表, 无法合并而需原样保留的行)。
+    """
+    seen = _seen if _seen is not None else set()
+    real = os.path.normcase(os.path.abspath(path))
+    if real in seen:
+        return [], [], []
+    seen.add(real)
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+    except OSError:
+        return [], [], []
+
+    requirements, options, passthrough = [], [], []
+    for raw in content.replace("\\\n", "").splitlines():
+        line = re.sub(r"(^|\s)#.*$", "", raw).strip()
+        if not line:
+            continue
+        if line.startswith(("-r ", "--requirement ", "-r", "--requirement=")):
+            target = re.sub(r"^(-r|--requirement)=?\s*", "", line)
+            nested = os.path.join(os.path.dirname(path), target)
+            reqs, opts, extra = read_requirements(nested, source, seen)
+            requirements += reqs
+            options += opts
+            passthrough += extra
+        elif line.startswith(_GLOBAL_OPTIONS):
+            options.append(line)
+        elif line.startswith("-"):
+            # -e / -c 等与具体插件目录相关的行，保留原样并改为绝对路径
+            passthrough.append((source, _absolutize(line, os.path.dirname(path))))
+        else:
+            req = parse_requirement_line(line, source)
+            if req is None:
+                passthrough.append((source, _absolutize(line, os.path.dirname(path))))
+            else:
+                requirements.append(req)
+    return requirements, options, passthrough
+
+
+def _absolutize(line, base_dir):
+    """把相对路径形式的本地包/约束文件（./pkg、-e ../pkg、-c constraints.txt）改为绝对路径，
+    合并后的临时文件放在别处时仍然有效"""
+    flag, _, target = line.partition(" ") if line.startswith("-") else ("", "", line)
+    target = target.strip()
+    if "://" not in target and os.path.exists(os.path.join(base_dir, target)):
+        target = os.path.normpath(os.path.join(base_dir, target))
+    return f"{flag} {target}".strip()
+
+
+class DependencyConflict:
+    """同一个包的约束无法同时满足"""
+    __slots__ = ("key", "marker", "requirements", "reason")
+
+    def __init__(self, key, marker, requirements, reason):
+        self.key = key
+        self.marker = marker
+        self.requirements = requirements
+        self.reason = reason
+
+    def describe(self):
+        sources = "; ".join(f"{r.source}: {r.name}{r.spec_text()}" for r in self.requirements)
+        return f"{self.key}{' ; ' + self.marker if self.marker else ''} — {self.reason} ({sources})"
+
+
+def _find_conflict(reqs):
+    """检查同一个包的多条约束是否矛盾，返回 (原因, 相关需求) 或 None"""
+    urls = {r.url for r in reqs if r.url}
+    if len(urls) > 1:
+        return "指定了不同的安装地址", [r for r in reqs if r.url]
+    specs = [(op, v, r) for r in reqs for op, v in r.specs]
+    pins = [(v, r) for op, v, r in specs if op in ("==", "===") and not v.endswith(".*")]
+    for pin, owner in pins:
+        for op, v, r in specs:
+            if r is not owner and not version_satisfies(pin, op, v):
+                return f"{owner.source} 固定为 {pin}，与 {op}{v} 冲突", [owner, r]
+
+    lower, upper = None, None
+    for op, v, r in specs:
+        pv = parse_version(v)
+        if pv is None:
+            continue
+        if op in (">=", ">", "~=") and (lower is None or pv > lower[0] or (pv == lower[0] and op == ">")):
+            lower = (pv, op, v, r)
+        elif op in ("<=", "<") and (upper is None or pv < upper[0] or (pv == upper[0] and op == "<")):
+            upper = (pv, op, v, r)
+    if lower and upper:
+        strict = lower[1] == ">" or upper[1] == "<"
+        if lower[0] > upper[0] or (lower[0] == upper[0] and strict):
+            return f"下限 {lower[1]}{lower[2]} 高于上限 {upper[1]}{upper[2]}", [lower[3], upper[3]]
+    return None
+
+
+class DependencyPlan:
+    """合并后的依赖清单
+
+    merged: {(包名, marker): [Requirement]}，同一个包在不同 marker 下分开处理；
+    conflicts: DependencyConflict 列表。冲突的包在生成的清单中只保留本体的约束，
+    本体未声明时不加版本约束，交给 pip 自行选择。
+    """
+    def __init__(self):
+        self.sources = []       # [(来源名, requirements.txt 路径)]
+        self.merged = {}
+        self.options = []
+        self.passthrough = []   # [(来源名, 原样保留的行)]
+        self.conflicts = []
+
+    def add_file(self, source, path):
+        self.sources.append((source, path))
+        reqs, options, passthrough = read_requirements(path, source)
+        for req in reqs:
+            self.merged.setdefault((req.key, req.marker), []).append(req)
+        for opt in options:
+            if opt not in self.options:
+                self.options.append(opt)
+        for src, line in passthrough:
+            if line not in [l for _, l in self.passthrough]:
+                self.passthrough.append((src, line))
+
+    def analyze(self):
+        self.conflicts = []
+        for (key, marker), reqs in sorted(self.merged.items()):
+            found = _find_conflict(reqs)
+            if found:
+                reason, involved = found
+                self.conflicts.append(DependencyConflict(key, marker, involved, reason))
+        return self.conflicts
+
+    @property
+    def package_count(self):
+        return len({key for key, _ in self.merged})
+
+    def _merged_line(self, key, marker, reqs, conflicted):
+        if conflicted:
+            core = [r for r in reqs if r.source == CORE_SOURCE]
+            reqs = core or [Requirement(reqs[0].name)]
+        name = reqs[0].name
+        extras = sorted(set().union(*(r.extras for r in reqs)))
+        url = next((r.url for r in reqs if r.url), "")
+        specs = []
+        for r in reqs:
+            for spec in r.specs:
+                if spec not in specs:
+                    specs.append(spec)
+        line = name + (f"[{','.join(extras)}]" if extras else "")
+        if url:
+            line += f" @ {url}"
+        elif specs:
+            line += ",".join(f"{op}{v}" for op, v in specs)
+        if marker:
+            line += f" ; {marker}"
+        return line
+
+    def to_requirements_text(self):
+        conflicted = {(c.key, c.marker) for c in self.conflicts}
+        lines = ["# 由 ComfyUI-Updater 合并生成，来源: " + ", ".join(name for name, _ in self.sources)]
+        lines += self.options
+        for (key, marker), reqs in sorted(self.merged.items()):
+            lines.append(self._merged_line(key, marker, reqs, (key, marker) in conflicted))
+        lines += [line for _, line in self.passthrough]
+        return "\n".join(lines) + "\n"
+
+    def write_temp_file(self):
+        fd, path = tempfile.mkstemp(suffix=".txt", prefix="comfy_merged_requirements_")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.to_requirements_text())
+        return path
+
+    def summary(self):
+        lines = [f"来源: {len(self.sources)} 个 requirements.txt，合并后共 {self.package_count} 个包"]
+        if self.passthrough:
+            lines.append(f"原样保留的行: {len(self.passthrough)} 条（如 git+/本地路径）")
+        if self.conflicts:
+            lines.append(f"发现 {len(self.conflicts)} 处版本冲突:")
+            lines += [f"  · {c.describe()}" for c in self.conflicts]
+        else:
+            lines.append("未发现版本冲突。")
+        return "\n".join(lines)
+
+
+def collect_dependency_plan(app):
+    """收集本体与所有插件的 requirements.txt 并合并分析"""
+    plan = DependencyPlan()
+    if app.comfyui_root:
+        core_req = os.path.join(app.comfyui_root, REQUIREMENTS_FILE)
+        if os.path.isfile(core_req):
+            plan.add_file(CORE_SOURCE, core_req)
+    for folder in app.list_plugin_folders():
+        req_path = os.path.join(app.nodes_path, folder, REQUIREMENTS_FILE)
+        if os.path.isfile(req_path):
+            plan.add_file(folder, req_path)
+    plan.analyze()
+    return plan
+
+
+def indexed_requirements(req_path, source=""):
+    """requirements.txt 中可由环境索引判断的需求行与无法判断的行，返回 ([需求行], [无法判断的行])
+
+    带 --hash 等逐行选项的需求去掉选项后判断；-c、--hash、--extra-index-url 等纯选项行不算需求；
+    -e 与 VCS、URL、本地路径无法从已安装的包判断。
+    """
+    reqs, _, passthrough = read_requirements(req_path, source)
+    lines, unknown = [r.line for r in reqs], []
+    for _, line in passthrough:
+        if line.startswith("-"):
+            if line.startswith(("-e", "--editable")):
+                unknown.append(line)
+            continue
+        bare = re.split(r"\s+--?[A-Za-z]", line, 1)[0].strip()
+        if bare != line and parse_requirement_line(bare) is not None:
+            lines.append(bare)
+        else:
+            unknown.append(line)
+    return lines, unknown
+
+
+def collect_requirement_lines(app):
+    """本体与所有插件 requirements.txt 中的具名需求行，返回 {来源: [行]}"""
+    sources = {}
+    targets = [(CORE_SOURCE, app.comfyui_root)] if app.comfyui_root else []
+    targets += [(folder, os.path.join(app.nodes_path, folder)) for folder in app.list_plugin_folders()]
+    for source, directory in targets:
+        req_path = os.path.join(directory, REQUIREMENTS_FILE)
+        if os.path.isfile(req_path):
+            sources[source] = indexed_requirements(req_path, source)[0]
+    return sources
+
+
+# --- 跳过重复安装：requirements 指纹 + 目标环境快照 ---
+# 在 python_exe 中执行，一次性列出已安装的包并判断给定需求是否满足。
+# 每行需求的判断结果为 [状态, 已安装版本]，状态: ok 满足 / skip 环境标记不适用 /
+# missing 未安装 / mismatch 版本不符 / unknown 带 extras、URL 或无法解析。
+# packaging 优先用环境自带的，没有时用 pip 内置的副本；都没有则全部视为未满足。
+# 带 extras 或 URL 的需求无法可靠判断，同样交给 pip。
+_PROBE_SCRIPT = r"""
+import json, os, re, sys
+try:
+    from importlib import metadata
+except ImportError:
+    import importlib_metadata as metadata
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    try:
+        from pip._vendor.packaging.requirements import Requirement
+    except ImportError:
+        Requirement = None
+norm = lambda n: re.sub(r"[-_.]+", "-", n).lower()
+dists = {}
+for d in metadata.distributions():
+    name = d.metadata["Name"]
+    if name:
+        dists.setdefault(norm(name), d.version)
+unmet, checks = [], []
+with open(sys.argv[1], "r", encoding="utf-8") as f:
+    lines = json.load(f)
+for i, line in enumerate(lines):
+    try:
+        req = Requirement(line)
+    except Exception:
+        unmet.append(i)
+        checks.append(["unknown", None])
+        continue
+    if req.marker is not None and not req.marker.evaluate():
+        checks.append(["skip", None])
+        continue
+    version = dists.get(norm(req.name))
+    if version is None:
+        state = "missing"
+    elif req.extras or req.url:
+        state = "unknown"
+    else:
+        state = "ok" if req.specifier.contains(version, prereleases=True) else "mismatch"
+    checks.append([state, version])
+    if state != "ok":
+        unmet.append(i)
+paths = [p for p in sys.path if p and os.path.isdir(p)]
+print(json.dumps({"dists": dists, "paths": paths, "unmet": unmet, "checks": checks}))
+"""
+
+
+def path_mtimes(paths):
+    """site-packages 等目录的 mtime；安装/卸载包会新增或删除其中的条目"""
+    mtimes = {}
+    for p in paths:
+        try:
+            mtimes[p] = os.stat(p).st_mtime_ns
+        except OSError:
+            mtimes[p] = None
+    return mtimes
+
+
+class EnvironmentSnapshot:
+    """一次探测得到的目标环境信息"""
+    __slots__ = ("dists", "paths", "unmet", "checks")
+
+    def __init__(self, dists, paths, unmet, checks=()):
+        self.dists = dists      # {规范化包名: 版本}
+        self.paths = paths      # {sys.path 目录: mtime}
+        self.unmet = unmet      # 未满足的需求在传入列表中的下标
+        self.checks = list(checks)  # 每行需求的 [状态, 已安装版本]
+
+    @property
+    def dists_hash(self):
+        text = "\n".join(f"{k}=={v}" for k, v in sorted(self.dists.items()))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def probe_environment(app, requirement_lines=()):
+    """调用一次 python_exe 获取已安装的包并检查需求，失败时返回 None"""
+    if not app.python_exe:
+        return None
+    # 需求行写入临时文件而不是放在命令行上：插件多时会超过 Windows 命令行 32767 字符的上限
+    try:
+        fd, lines_path = tempfile.mkstemp(suffix=".json", prefix="comfy_probe_requirements_")
+    except OSError:
+        return None
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(list(requirement_lines), f, ensure_ascii=False)
+        code, out, _ = app.run_cmd([app.python_exe, "-c", _PROBE_SCRIPT, lines_path], app.comfyui_root or None)
+    finally:
+        try:
+            os.remove(lines_path)
+        except OSError:
+            pass
+    if code != 0:
+        return None
+    try:
+        data = json.loads(out.splitlines()[-1])
+    except (ValueError, IndexError):
+        return None
+    return EnvironmentSnapshot(data["dists"], path_mtimes(data["paths"]), data["unmet"], data.get("checks", ()))
+
+
+class DependencyStatus:
+    """一个 requirements.txt 在目标环境中的满足情况（根据 EnvironmentIndex，不启动进程）"""
+    __slots__ = ("total", "missing", "unknown")
+
+    def __init__(self, total, missing, unknown):
+        self.total = total          # 适用于当前环境的具名需求数
+        self.missing = missing      # [(行, 已安装版本或 None)]：未安装或版本不符
+        self.unknown = unknown      # 无法判断的行（-e、git+ 等），交给 pip
+
+    @property
+    def satisfied(self):
+        return not self.missing and not self.unknown
+
+    def describe(self):
+        """如 依赖已满足 / 缺 3 项"""
+        if self.missing:
+            return f"缺 {len(self.missing)} 项"
+        if self.unknown:
+            return f"{len(self.unknown)} 项无法判断"
+        return "依赖已满足"
+
+
+class EnvironmentIndex:
+    """python_exe 环境中已安装包的索引，依赖相关的功能共用
+
+    一次调用 python_exe 列出全部已安装的包，同时判断本体与所有插件的每一行需求是否满足，
+    结果保存在 environment_index.json。Python 路径与 sys.path 各目录（site-packages 等）的 mtime
+    都未变化时直接使用索引；安装、升级、卸载包都会改变这些目录的 mtime，索引随之作废。
+    出现索引中没有的需求行（插件更新或新装）时重新构建。
+    """
+    VERSION = 1
+    # 两次检查目录 mtime 的最短间隔（秒），列表中大量行同时查询时只 stat 一次
+    VALIDATE_INTERVAL = 2.0
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._data = None
+        self._validated_at = 0.0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._data = data
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _current(self, python_exe):
+        """仍然有效的索引数据，已作废时返回 None"""
+        with self._lock:
+            data = self._data
+            if data is None or data.get("python") != python_exe:
+                return None
+            now = time.monotonic()
+            if now - self._validated_at < self.VALIDATE_INTERVAL:
+                return data
+            if path_mtimes(data["paths"]) != data["paths"]:
+                self._data = None
+                return None
+            self._validated_at = now
+            return data
+
+    def invalidate(self):
+        """pip 执行后调用：下次使用前重新检查目录 mtime"""
+        with self._lock:
+            self._validated_at = 0.0
+
+    def is_valid(self, python_exe):
+        return self._current(python_exe) is not None
+
+    def dists(self, python_exe):
+        """{规范化包名: 版本}，索引无效时返回 None"""
+        data = self._current(python_exe)
+        return data["dists"] if data else None
+
+    def lookup(self, python_exe, lines):
+        """各行需求的 [状态, 已安装版本]；索引无效或有未收录的行时返回 None"""
+        data = self._current(python_exe)
+        if data is None:
+            return None
+        checks = data["checks"]
+        if any(line not in checks for line in lines):
+            return None
+        return [checks[line] for line in lines]
+
+    def build(self, app, extra_lines=()):
+        """调用一次 python_exe 重建索引，收录本体、所有插件与 extra_lines 中的需求；失败时返回 False"""
+        sources = collect_requirement_lines(app)
+        lines = list(dict.fromkeys([line for ls in sources.values() for line in ls] + list(extra_lines)))
+        snapshot = probe_environment(app, lines)
+        if snapshot is None or len(snapshot.checks) != len(lines):
+            return False
+        data = {
+            "version": self.VERSION,
+            "python": app.python_exe,
+            "built_at": time.time(),
+            "paths": snapshot.paths,
+            "dists": snapshot.dists,
+            "checks": dict(zip(lines, snapshot.checks)),
+            "sources": sources,
+        }
+        with self._lock:
+            self._data = data
+            self._validated_at = time.monotonic()
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"写入环境索引失败: {e}", file=sys.stderr)
+        return True
+
+    def ensure(self, app, lines=()):
+        """返回各行需求的判断结果，索引无效或缺少某些行时重建（多个线程同时调用只重建一次）"""
+        checks = self.lookup(app.python_exe, lines)
+        if checks is not None:
+            return checks
+        with self._build_lock:
+            checks = self.lookup(app.python_exe, lines)
+            if checks is None and self.build(app, lines):
+                checks = self.lookup(app.python_exe, lines)
+        return checks
+
+    def snapshot(self, app, lines=()):
+        """与 probe_environment 相同的 EnvironmentSnapshot，索引有效时不启动进程"""
+        checks = self.ensure(app, lines)
+        with self._lock:
+            data = self._data
+        if checks is None or data is None:
+            return None
+        unmet = [i for i, (state, _) in enumerate(checks) if state not in ("ok", "skip")]
+        return EnvironmentSnapshot(data["dists"], data["paths"], unmet, checks)
+
+    def status(self, python_exe, req_path):
+        """requirements.txt 的满足情况；索引无效或未收录其中的需求时返回 None（需要先 ensure）"""
+        lines, unknown = indexed_requirements(req_path)
+        checks = self.lookup(python_exe, lines)
+        if checks is None:
+            return None
+        missing, total = [], 0
+        for line, (state, version) in zip(lines, checks):
+            if state == "skip":
+                continue
+            total += 1
+            # 带 extras 或 URL 的需求只要包已安装就视为满足；安装时仍交给 pip 判断
+            if state in ("missing", "mismatch"):
+                missing.append((line, version))
+            elif state == "unknown" and version is None:
+                unknown.append(line)
+        return DependencyStatus(total, missing, unknown)
+
+    def dependents(self, python_exe, key):
+        """哪些来源（本体或插件）的哪些需求由该包满足，返回 [(来源, 行)]"""
+        data = self._current(python_exe)
+        if data is None:
+            return []
+        result = []
+        for source, lines in data.get("sources", {}).items():
+            for line in lines:
+                req = parse_requirement_line(line)
+                if req is not None and req.key == key and data["checks"].get(line, ("",))[0] == "ok":
+                    result.append((source, line))
+        return result
+
+
+class RequirementsCache:
+    """记录每个 requirements.txt 最近一次确认已满足时的指纹
+
+    requirements 内容（含 -r 引用）、Python 路径、环境目录 mtime 都未变化时直接跳过，
+    连 python_exe 都不需要启动；目录有变化但已安装包列表一致时也跳过。
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._entries = data.get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    @staticmethod
+    def _key(req_path):
+        return os.path.normcase(os.path.abspath(req_path))
+
+    def get(self, req_path):
+        with self._lock:
+            return self._entries.get(self._key(req_path))
+
+    def put(self, req_path, digest, python_exe, snapshot):
+        with self._lock:
+            self._entries[self._key(req_path)] = {
+                "digest": digest,
+                "python": python_exe,
+                "paths": snapshot.paths,
+                "dists": snapshot.dists_hash,
+            }
+            self._write()
+
+    def remove(self, req_path):
+        with self._lock:
+            if self._entries.pop(self._key(req_path), None) is not None:
+                self._write()
+
+    def _write(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "entries": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"写入依赖缓存失败: {e}", file=sys.stderr)
+
+
+def requirements_digest(python_exe, lines):
+    return hashlib.sha1("\n".join([python_exe or ""] + lines).encode("utf-8")).hexdigest()
+
+
+def find_unmet_requirements(app, req_path, remember=True):
+    """返回 (需要交给 pip 的行, 说明)，没有需要安装的内容时行列表为空
+
+    remember=False 用于合并生成的临时文件：只过滤已满足的需求，不写入指纹缓存。
+    """
+    reqs, options, passthrough = read_requirements(req_path, "")
+    req_lines = [r.line for r in reqs]
+    extra_lines = [line for _, line in passthrough]
+    digest = requirements_digest(app.python_exe, options + req_lines + extra_lines)
+    cache = app.requirements_cache
+    entry = cache.get(req_path) if remember else None
+    if entry and entry["digest"] == digest and path_mtimes(entry["paths"]) == entry["paths"]:
+        return [], "依赖与环境均未变化，跳过安装"
+
+    snapshot = app.environment_index.snapshot(app, req_lines)
+    if snapshot is None:
+        return options + req_lines + extra_lines, "无法读取已安装的包，执行完整安装"
+    if entry and entry["digest"] == digest and entry["dists"] == snapshot.dists_hash:
+        cache.put(req_path, digest, app.python_exe, snapshot)
+        return [], "依赖未变化，已安装的包也未变化，跳过安装"
+
+    # git+/本地路径等无法判断是否已安装，交给 pip 处理
+    unmet = [req_lines[i] for i in snapshot.unmet] + extra_lines
+    if not unmet:
+        if remember:
+            cache.put(req_path, digest, app.python_exe, snapshot)
+        return [], "所有依赖均已满足，跳过安装"
+    return options + unmet, f"{len(unmet)} 项依赖未满足"
+
+
+def remember_requirements_installed(app, req_path):
+    """pip 安装成功后记录指纹，下次未变化时直接跳过"""
+    reqs, options, passthrough = read_requirements(req_path, "")
+    lines = options + [r.line for r in reqs] + [line for _, line in passthrough]
+    snapshot = app.environment_index.snapshot(app)
+    if snapshot is not None:
+        app.requirements_cache.put(req_path, requirements_digest(app.python_exe, lines), app.python_exe, snapshot)
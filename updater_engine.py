@@ -0,0 +1,504 @@
+"""异步命令引擎：所有 git / pip 子进程在同一个事件循环线程中以协程方式运行（不依赖 tkinter）
+
+- 按命令类型限制并发（git 与 pip 各自独立，pip 默认串行，避免同时写入同一个环境）
+- 每条命令有独立的超时，网络类 git 命令与 pip 的超时更长
+- CancelToken 与插件行绑定，行被移除时终止其排队中与运行中的命令
+- HostPolicy 按远程主机协调网络命令：每主机并发上限、带抖动的指数退避重试、熔断
+- stream() 逐行回调输出（git 进度、pip 下载），只保留末尾若干行
+- 普通线程可以通过 call() / run_sync() / stream_sync() 同步等待结果（命令行模式、更新操作）
+- 每条命令的排队时间、耗时、返回码与输出量记录到 tracer（见 updater_trace）
+"""
+import asyncio
+import collections
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+
+from updater_trace import CommandTracer
+# 各类命令同时运行的进程数上限；fetch 等网络命令 (git-network) 与本地 git 查询分开排队
+DEFAULT_LIMITS = {"git": 8, "git-network": 16, "pip": 1, "profile": 4, "other": 4}
+# 超时（秒）：本地 git 查询很快，网络操作与 pip 安装可能很慢
+DEFAULT_TIMEOUTS = {"git": 60, "git-network": 300, "pip": 1800, "profile": 120, "other": 300}
+NETWORK_GIT_COMMANDS = {"fetch", "pull", "clone", "ls-remote", "push", "submodule"}
+
+CANCELLED_RESULT = (-1, "", "已取消")
+
+
+def git_subcommand(args):
+    """取出 git 子命令名（跳过 -c key=value 等全局参数）"""
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ("-c", "-C"):
+            skip = True
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def command_timeout(kind, args):
+    if kind == "git" and git_subcommand(args) in NETWORK_GIT_COMMANDS:
+        return DEFAULT_TIMEOUTS["git-network"]
+    return DEFAULT_TIMEOUTS.get(kind, DEFAULT_TIMEOUTS["other"])
+
+
+class CancelToken:
+    """取消标记：cancel() 可以在任意线程调用，终止所有已登记的任务"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self.cancelled = False
+
+    def attach(self, task):
+        """登记一个 asyncio.Task 或 concurrent.futures.Future"""
+        with self._lock:
+            registered = not self.cancelled
+            if registered:
+                self._tasks.add(task)
+        if registered:
+            # 任务已完成时回调会立即执行，不能在持有锁时登记
+            task.add_done_callback(self._discard)
+        else:
+            self._cancel_one(task)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            tasks, self._tasks = self._tasks, set()
+        for task in tasks:
+            self._cancel_one(task)
+
+    def _discard(self, task):
+        with self._lock:
+            self._tasks.discard(task)
+
+    @staticmethod
+    def _cancel_one(task):
+        if isinstance(task, asyncio.Task):
+            task.get_loop().call_soon_threadsafe(task.cancel)
+        else:
+            task.cancel()
+
+
+class _Limiter:
+    """可调整上限的计数信号量，只在事件循环线程中使用"""
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self._waiters = collections.deque()
+
+    async def acquire(self):
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+                raise
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def set_limit(self, limit):
+        self.limit = max(1, int(limit))
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.active
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+class CommandEngine:
+    """在后台线程中运行一个事件循环，按需启动"""
+    def __init__(self, limits=None, tracer=None):
+        self._limit_config = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.tracer = tracer or CommandTracer()
+        self._limiters = {}
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # --- 生命周期 ---
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return self._loop
+            ready = threading.Event()
+
+            def run():
+                if os.name == "nt":
+                    # 子进程需要 Proactor 事件循环
+                    self._loop = asyncio.ProactorEventLoop()
+                else:
+                    self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="CommandEngine", daemon=True)
+            self._thread.start()
+            ready.wait()
+            return self._loop
+
+    def stop(self):
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        def shutdown():
+            # 取消所有任务（运行中的子进程会被结束），下一轮循环再停止
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+            loop.call_soon(loop.stop)
+
+        loop.call_soon_threadsafe(shutdown)
+
+    @property
+    def loop(self):
+        return self.start()
+
+    def in_loop_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    # --- 并发上限 ---
+    def set_limit(self, kind, limit):
+        self._limit_config[kind] = limit
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: self._limiter(kind).set_limit(limit))
+
+    def _limiter(self, kind):
+        limiter = self._limiters.get(kind)
+        if limiter is None:
+            limiter = self._limiters[kind] = _Limiter(self._limit_config.get(kind, DEFAULT_LIMITS["other"]))
+        return limiter
+
+    # --- 执行 ---
+    async def run(self, cmd_args, cwd=None, kind="other", timeout=None, env=None, token=None, show_window=False,
+                  on_start=None):
+        """运行一条命令并返回 (返回码, stdout, stderr)
+
+        超时返回码为 -1（可用 is_timeout 判断）；token 被取消时抛出 asyncio.CancelledError。
+        on_start 在拿到并发名额、即将启动进程时于事件循环线程中调用，之前的时间是排队时间。
+        """
+        if timeout is None:
+            timeout = command_timeout(kind, cmd_args)
+        span = self.tracer.begin(cmd_args, cwd, kind)
+
+        def factory():
+            if on_start:
+                on_start()
+            return self._run_process(cmd_args, cwd, timeout, env, show_window, span)
+        return await self._guarded(kind, token, span, factory)
+
+    async def stream(self, cmd_args, cwd=None, kind="other", on_line=None, timeout=None, env=None, token=None,
+                     tail_lines=200):
+        """逐行读取输出并回调 on_line(文本, 是否 stderr)，不在内存中保留完整输出
+
+        git 的进度行以 \\r 刷新，同样按行拆分。返回 (返回码, stdout 末尾几行, stderr 末尾几行)。
+        """
+        if timeout is None:
+            timeout = command_timeout(kind, cmd_args)
+        span = self.tracer.begin(cmd_args, cwd, kind)
+
+        def counted(text, is_stderr):
+            # 流式输出按解码后的字符数统计输出量
+            span.bytes_out += len(text) + 1
+            if on_line:
+                on_line(text, is_stderr)
+        return await self._guarded(kind, token, span, lambda: self._stream_process(
+            cmd_args, cwd, timeout, env, counted, tail_lines))
+
+    async def _guarded(self, kind, token, span, factory):
+        if token is not None and token.cancelled:
+            self.tracer.finish(span, None)
+            raise asyncio.CancelledError()
+        task = asyncio.ensure_future(self._run_limited(kind, span, factory))
+        if token is not None:
+            token.attach(task)
+        return await task
+
+    async def _run_limited(self, kind, span, factory):
+        limiter = self._limiter(kind)
+        code = None
+        try:
+            await limiter.acquire()
+            try:
+                self.tracer.started(span)
+                result = await factory()
+                code = result[0]
+                return result
+            finally:
+                limiter.release()
+        finally:
+            self.tracer.finish(span, code)
+
+    @staticmethod
+    async def _spawn(cmd_args, cwd, env, show_window=False):
+        kwargs = {}
+        if os.name == "nt" and not show_window:
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            kwargs["startupinfo"] = startupinfo
+        return await asyncio.create_subprocess_exec(
+            *cmd_args, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+
+    async def _run_process(self, cmd_args, cwd, timeout, env, show_window, span):
+        try:
+            proc = await self._spawn(cmd_args, cwd, env, show_window)
+        except Exception as e:
+            return -1, "", str(e)
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill(proc)
+            return -1, "", _timeout_message(timeout, cmd_args)
+        except asyncio.CancelledError:
+            await self._kill(proc)
+            raise
+        span.bytes_out = len(out) + len(err)
+        return (proc.returncode,
+                out.decode("utf-8", errors="ignore").strip(),
+                err.decode("utf-8", errors="ignore").strip())
+
+    async def _stream_process(self, cmd_args, cwd, timeout, env, on_line, tail_lines):
+        try:
+            proc = await self._spawn(cmd_args, cwd, env)
+        except Exception as e:
+            if on_line:
+                on_line(str(e), True)
+            return -1, "", str(e)
+        out_tail = collections.deque(maxlen=tail_lines)
+        err_tail = collections.deque(maxlen=tail_lines)
+        readers = asyncio.gather(_read_lines(proc.stdout, False, on_line, out_tail),
+                                 _read_lines(proc.stderr, True, on_line, err_tail))
+        try:
+            await asyncio.wait_for(readers, timeout)
+            await proc.wait()
+        except asyncio.TimeoutError:
+            await self._kill(proc)
+            message = _timeout_message(timeout, cmd_args)
+            if on_line:
+                on_line(message, True)
+            return -1, "\n".join(out_tail), message
+        except asyncio.CancelledError:
+            readers.cancel()
+            await self._kill(proc)
+            raise
+        return proc.returncode, "\n".join(out_tail), "\n".join(err_tail)
+
+    @staticmethod
+    async def _kill(proc):
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        try:
+            await asyncio.shield(proc.wait())
+        except asyncio.CancelledError:
+            pass
+
+    # --- 线程桥接 ---
+    def submit(self, coro, token=None):
+        """从任意线程提交协程，返回 concurrent.futures.Future"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if token is not None:
+            token.attach(future)
+        return future
+
+    def call(self, coro, token=None):
+        """在普通线程中同步等待协程结果（不能在事件循环线程中调用）"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("不能在事件循环线程中同步等待命令")
+        return self.submit(coro, token).result()
+
+    def run_sync(self, cmd_args, cwd=None, kind="other", timeout=None, env=None, token=None, show_window=False):
+        return self._call_command(self.run(cmd_args, cwd, kind, timeout, env, token, show_window), token)
+
+    def stream_sync(self, cmd_args, cwd=None, kind="other", on_line=None, timeout=None, env=None, token=None):
+        return self._call_command(self.stream(cmd_args, cwd, kind, on_line, timeout, env, token), token)
+
+    def _call_command(self, coro, token):
+        try:
+            return self.call(coro, token)
+        except Exception as e:
+            if token is not None and token.cancelled:
+                return CANCELLED_RESULT
+            return -1, "", str(e)
+
+
+# --- 远程主机协调：同一主机的 fetch 限流、重试与熔断 ---
+# 这些错误说明主机或网络暂时有问题，值得重试；认证失败、仓库不存在等重试也没有用
+TRANSIENT_ERRORS = (
+    "could not resolve host", "timed out", "connection reset", "connection refused", "failed to connect",
+    "rpc failed", "early eof", "the remote end hung up", "returned error: 429", "returned error: 5",
+    "operation too slow", "gnutls", "ssl_read", "temporarily unavailable", "rate limit", "命令超时",
+)
+
+
+def is_transient_failure(code, err):
+    if code == 0:
+        return False
+    err = err.lower()
+    return any(k in err for k in TRANSIENT_ERRORS)
+
+
+def remote_host(url):
+    """从 remote URL 中取出主机名：https://host/x、ssh://user@host:22/x、user@host:x；本地路径返回 "local" """
+    if not url:
+        return None
+    m = re.match(r"^([a-z][a-z0-9+.-]*)://(?:[^@/]*@)?(\[[^\]]+\]|[^/:]*)", url, re.I)
+    if m:
+        return "local" if m.group(1).lower() == "file" or not m.group(2) else m.group(2).lower()
+    if not re.match(r"^[A-Za-z]:[\\/]", url):
+        m = re.match(r"^(?:[^@/]+@)?([^/:]+):", url)
+        if m:
+            return m.group(1).lower()
+    return "local"
+
+
+class _HostState:
+    __slots__ = ("limiter", "failures", "open_until", "probing")
+
+    def __init__(self, limit):
+        self.limiter = _Limiter(limit)
+        self.failures = 0       # 连续失败（重试用尽）的操作数
+        self.open_until = 0.0   # 熔断截止时间 (time.monotonic)
+        self.probing = False    # 冷却结束后只放行一个试探请求
+
+
+class HostPolicy:
+    """按远程主机协调网络 git 命令，只在引擎的事件循环中使用
+
+    - 每个主机同时最多 per_host_limit 个请求，慢主机不会堆积上百个 fetch
+    - 暂时性失败按带抖动的指数退避重试 retries 次
+    - 连续 failure_threshold 个操作失败后熔断 cooldown 秒，期间直接返回失败；
+      冷却结束后先放行一个试探请求，成功则恢复
+    """
+    def __init__(self, per_host_limit=4, retries=2, base_delay=1.0, max_delay=30.0,
+                 failure_threshold=3, cooldown=120.0):
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.per_host_limit)
+        return state
+
+    def set_limit(self, per_host_limit):
+        self.per_host_limit = per_host_limit
+        for state in self._hosts.values():
+            state.limiter.set_limit(per_host_limit)
+
+    def open_remaining(self, host):
+        """主机处于熔断状态时返回剩余冷却秒数，否则为 0"""
+        state = self._hosts.get(host)
+        return max(0.0, state.open_until - time.monotonic()) if state else 0.0
+
+    def snapshot(self):
+        """{主机: (连续失败次数, 剩余熔断秒数)}"""
+        now = time.monotonic()
+        return {host: (st.failures, max(0.0, st.open_until - now)) for host, st in self._hosts.items()}
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _unavailable(self, host, state):
+        remaining = state.open_until - time.monotonic()
+        return -1, "", f"主机 {host} 暂时不可用（连续失败 {state.failures} 次，{remaining:.0f} 秒后重试）"
+
+    async def run(self, host, attempt):
+        """attempt 为返回 (返回码, stdout, stderr) 的协程函数"""
+        state = self._state(host)
+        now = time.monotonic()
+        half_open = False
+        if state.open_until:
+            if state.open_until > now or state.probing:
+                return self._unavailable(host, state)
+            half_open = state.probing = True
+        try:
+            result = None
+            for attempt_no in range(self.retries + 1):
+                await state.limiter.acquire()
+                try:
+                    # 排队期间其它请求可能已触发熔断
+                    if not half_open and state.open_until > time.monotonic():
+                        return self._unavailable(host, state)
+                    result = await attempt()
+                finally:
+                    state.limiter.release()
+                if not is_transient_failure(result[0], result[2]):
+                    state.failures = 0
+                    state.open_until = 0.0
+                    return result
+                if half_open or attempt_no == self.retries:
+                    break
+                await asyncio.sleep(self.backoff(attempt_no))
+            state.failures += 1
+            if half_open or state.failures >= self.failure_threshold:
+                state.open_until = time.monotonic() + self.cooldown
+            return result
+        finally:
+            if half_open:
+                state.probing = False
+
+
+# 单行超过该长度仍没有换行时直接输出，避免无限增长
+_MAX_LINE_BYTES = 64 * 1024
+
+
+async def _read_lines(reader, is_stderr, on_line, tail):
+    pending = b""
+    while True:
+        chunk = await reader.read(8192)
+        if not chunk:
+            break
+        parts = re.split(rb"[\r\n]", pending + chunk)
+        pending = parts.pop()
+        if len(pending) > _MAX_LINE_BYTES:
+            parts.append(pending)
+            pending = b""
+        for part in parts:
+            _emit_line(part, is_stderr, on_line, tail)
+    _emit_line(pending, is_stderr, on_line, tail)
+
+
+def _emit_line(raw, is_stderr, on_line, tail):
+    text = raw.decode("utf-8", errors="ignore").rstrip()
+    if not text:
+        return
+    tail.append(text)
+    if on_line:
+        on_line(text, is_stderr)
+
+
+def _timeout_message(timeout, cmd_args):
+    return f"命令超时 ({timeout}s): {' '.join(cmd_args[:3])}"
+
+
+def is_timeout(code, err):
+    """run / stream 的结果是否为超时：返回码 -1 且 stderr 为超时说明"""
+    return code == -1 and err.startswith("命令超时 (")
@@ -0,0 +1,163 @@
+"""共享对象池：多个插件仓库、多份 ComfyUI 安装共用一个裸仓库（不依赖 tkinter）
+
+每个上游只由对象池 fetch 一次，引用按 URL 放在 refs/mirrors/<key>/ 下，
+同一上游的多个 fork 只下载彼此不同的对象。插件仓库通过 objects/info/alternates
+借用对象池中的对象，再从对象池做一次本地 fetch 更新 refs/remotes/origin/*。
+对象池可以放在局域网共享目录，由一台联网的机器维护，其余机器设为 offline，只从对象池更新。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+import sys
+
+from updater_engine import remote_host
+
+MIRROR_REF_PREFIX = "refs/mirrors"
+# 同一上游两次同步的最短间隔（秒），多个仓库指向同一上游时只同步一次
+SYNC_INTERVAL = 60
+
+
+def _ref_component(part):
+    part = re.sub(r"[^A-Za-z0-9._-]", "_", part).lstrip(".")
+    if not part or part.endswith(".lock"):
+        part += "_"
+    return part
+
+
+def mirror_key(url):
+    """把远程 URL 转为对象池中的引用命名空间，如 github.com/owner/repo；本地路径按哈希区分"""
+    host = remote_host(url)
+    if not host or host == "local":
+        return "local/" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+    m = re.match(r"^[a-z][a-z0-9+.-]*://[^/]*(/.*)?$", url, re.I) or re.match(r"^(?:[^@/]+@)?[^/:]+:(.*)$", url)
+    path = (m.group(1) if m else "") or ""
+    path = path.strip("/").lower()
+    if path.endswith(".git"):
+        path = path[:-4]
+    parts = [_ref_component(p) for p in path.split("/") if p]
+    return "/".join([_ref_component(host)] + parts)
+
+
+class MirrorStore:
+    """对象池裸仓库，协程方法只在命令引擎的事件循环中调用
+
+    对象池从不删除引用，并关闭自动 gc，借用对象的插件仓库不会因为上游强制推送而损坏。
+    """
+    def __init__(self, app, path, offline=False):
+        self.app = app
+        self.path = path
+        self.offline = offline
+        self._ready = False
+        self._init_task = None
+        self._pending = {}    # key -> 正在进行的同步任务
+        self._synced_at = {}  # key -> 上次成功同步的时间 (time.monotonic)
+
+    @property
+    def objects_dir(self):
+        return os.path.join(self.path, "objects")
+
+    def namespace(self, url):
+        return f"{MIRROR_REF_PREFIX}/{mirror_key(url)}"
+
+    async def _git(self, args, kind="git"):
+        cmd = [self.app.git_exe, f"--git-dir={self.path}"] + args
+        return await self.app.engine.run(cmd, None, kind, None, self.app.command_env())
+
+    async def ensure_ready(self):
+        """对象池不存在时创建（离线模式下不创建），并发调用只初始化一次"""
+        if self._ready:
+            return True
+        if self._init_task is None:
+            self._init_task = asyncio.ensure_future(self._init())
+        if not await asyncio.shield(self._init_task):
+            self._init_task = None  # 失败时允许下次重试
+            return False
+        return True
+
+    async def _init(self):
+        if not os.path.isdir(self.objects_dir):
+            if self.offline:
+                return False
+            code, _, err = await self.app.engine.run([self.app.git_exe, "init", "--bare", "-q", self.path],
+                                                     None, "git", None, self.app.command_env())
+            if code != 0:
+                print(f"Create mirror error: {err}", file=sys.stderr)
+                return False
+        for key, value in (("gc.auto", "0"), ("gc.pruneExpire", "never"), ("core.logAllRefUpdates", "false")):
+            await self._git(["config", key, value])
+        self._ready = True
+        return True
+
+    async def sync(self, url):
+        """把上游的分支与标签 fetch 到对象池；同一上游的并发请求合并，SYNC_INTERVAL 内不重复"""
+        key = mirror_key(url)
+        synced_at = self._synced_at.get(key)
+        if synced_at is not None and time.monotonic() - synced_at < SYNC_INTERVAL:
+            return 0, "", ""
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._sync(url))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _sync(self, url):
+        if not await self.ensure_ready():
+            return 1, "", f"对象池不可用: {self.path}"
+        ns = self.namespace(url)
+        result = await self._git(["-c", "http.lowSpeedLimit=1000", "-c", "http.lowSpeedTime=30",
+                                  "fetch", "--no-tags", url, f"+refs/heads/*:{ns}/heads/*",
+                                  f"+refs/tags/*:{ns}/tags/*"], kind="git-network")
+        if result[0] == 0:
+            self._synced_at[mirror_key(url)] = time.monotonic()
+        return result
+
+    async def has(self, url):
+        """对象池中是否已有该上游的分支"""
+        if not os.path.isdir(self.objects_dir):
+            return False
+        code, out, _ = await self._git(["for-each-ref", "--count=1", "--format=%(refname)",
+                                        f"{self.namespace(url)}/heads"])
+        return code == 0 and bool(out.strip())
+
+    def attach(self, reader):
+        """把对象池加入仓库的 objects/info/alternates（已存在时不重复添加）"""
+        if not reader.common_dir:
+            return False
+        info_dir = os.path.join(reader.common_dir, "objects", "info")
+        alternates = os.path.join(info_dir, "alternates")
+        target = os.path.abspath(self.objects_dir)
+        try:
+            with open(alternates, "r", encoding="utf-8") as f:
+                existing = [line.strip() for line in f if line.strip()]
+        except OSError:
+            existing = []
+        if any(os.path.normcase(os.path.abspath(p)) == os.path.normcase(target) for p in existing):
+            return True
+        try:
+            os.makedirs(info_dir, exist_ok=True)
+            with open(alternates, "a", encoding="utf-8") as f:
+                f.write(target + "\n")
+        except OSError as e:
+            print(f"Attach mirror error: {e}", file=sys.stderr)
+            return False
+        return True
+
+    def fetch_args(self, url):
+        """插件仓库从对象池更新 origin 远程分支与标签的 fetch 参数（纯本地操作）"""
+        ns = self.namespace(url)
+        return ["fetch", "--no-tags", os.path.abspath(self.path),
+                f"+{ns}/heads/*:refs/remotes/origin/*", f"+{ns}/tags/*:refs/tags/*"]
+
+    def size(self):
+        """对象池 pack 文件与松散对象的总字节数"""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
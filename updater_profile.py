@@ -0,0 +1,328 @@
+"""插件导入耗时分析：找出拖慢 ComfyUI 启动的插件（不依赖 tkinter）
+
+每个插件在独立的 Python 进程中（python -X importtime）按 ComfyUI 的方式导入 __init__.py，
+并行执行并有超时。记录导入耗时、峰值内存、失败原因与耗时最多的模块；结果按插件路径
+保存历史，并记下当时的 HEAD，变慢时可以对应到引起变化的那次更新。
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import sys
+
+from updater_engine import is_timeout
+from updater_trace import traced
+
+PROFILE_HISTORY_FILE = "profile_history.json"
+# 每个插件保留的历史记录条数
+HISTORY_LIMIT = 20
+# 比上次慢 REGRESSION_RATIO 倍且至少慢 REGRESSION_MIN_SECONDS 才算变慢
+REGRESSION_RATIO = 1.5
+REGRESSION_MIN_SECONDS = 0.5
+RESULT_MARKER = "__UPDATER_IMPORT_PROFILE__"
+BEGIN_MARKER = "__UPDATER_IMPORT_BEGIN__"
+END_MARKER = "__UPDATER_IMPORT_END__"
+
+# 子进程中执行的脚本：argv = [ComfyUI 根目录, 插件目录, 模块名, 预先导入的模块(逗号分隔)]
+WORKER_SCRIPT = r'''
+import importlib, importlib.util, json, os, sys, time, traceback
+
+def peak_memory():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        import ctypes
+        from ctypes import wintypes
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters),
+                                                 counters.cb)
+        return counters.PeakWorkingSetSize
+
+root, path, name, preload = sys.argv[1:5]
+sys.path.insert(0, root)
+result = {"ok": False, "error": "", "preload_error": ""}
+for module in filter(None, preload.split(",")):
+    try:
+        importlib.import_module(module.strip())
+    except Exception as e:
+        result["preload_error"] += f"{module}: {e}\n"
+result["base_memory"] = peak_memory()
+sys.stderr.write("%s\n" % "''' + BEGIN_MARKER + r'''")
+sys.stderr.flush()
+start = time.perf_counter()
+failure = None
+try:
+    spec = importlib.util.spec_from_file_location(name, os.path.join(path, "__init__.py"),
+                                                  submodule_search_locations=[path])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    result["ok"] = True
+    result["nodes"] = len(getattr(module, "NODE_CLASS_MAPPINGS", None) or {})
+except BaseException:
+    failure = sys.exc_info()
+result["seconds"] = time.perf_counter() - start
+sys.stderr.write("%s\n" % "''' + END_MARKER + r'''")
+sys.stderr.flush()
+if failure:
+    result["error"] = "".join(traceback.format_exception(*failure, limit=8))
+result["peak_memory"] = peak_memory()
+sys.stdout.write("\n''' + RESULT_MARKER + r'''" + json.dumps(result) + "\n")
+sys.stdout.flush()
+'''
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)")
+
+
+def parse_importtime(stderr, limit=10):
+    """从 -X importtime 输出中取出插件导入期间耗时最多的顶层模块，返回 [(模块, 累计秒数)]"""
+    begin = stderr.rfind(BEGIN_MARKER)
+    if begin >= 0:
+        stderr = stderr[begin + len(BEGIN_MARKER):]
+    end = stderr.find(END_MARKER)
+    if end >= 0:
+        stderr = stderr[:end]
+    modules = []
+    for line in stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m and len(m.group(3)) <= 1:  # 只统计由插件直接导入的模块
+            modules.append((m.group(4), int(m.group(2)) / 1e6))
+    modules.sort(key=lambda t: t[1], reverse=True)
+    return modules[:limit]
+
+
+def _strip_importtime(stderr):
+    return "\n".join(line for line in stderr.splitlines()
+                     if not line.startswith("import time:") and line not in (BEGIN_MARKER, END_MARKER))
+
+
+class ImportProfile:
+    """一个插件的一次导入分析结果
+
+    status: ok 成功 / failed 导入出错 / timeout 超时 / skipped 没有 __init__.py
+    """
+    __slots__ = ("name", "path", "head", "status", "seconds", "process_seconds", "peak_mb", "delta_mb", "nodes",
+                 "error", "top_modules", "profiled_at", "regression")
+
+    def __init__(self, name, path, head=None):
+        self.name = name
+        self.path = path
+        self.head = head
+        self.status = "pending"
+        self.seconds = 0.0          # exec_module 的耗时（不含解释器启动与预先导入的模块）
+        self.process_seconds = 0.0  # 整个子进程的耗时
+        self.peak_mb = 0.0
+        self.delta_mb = 0.0         # 导入插件使峰值内存增加的量
+        self.nodes = 0
+        self.error = ""
+        self.top_modules = []
+        self.profiled_at = time.time()
+        self.regression = None      # 与上次相比明显变慢时，为上一次的记录
+
+    @property
+    def ok(self):
+        return self.status in ("ok", "skipped")
+
+    def describe(self):
+        """简短说明，如 2.31s / 850MB；失败时为错误类型"""
+        if self.status == "ok":
+            return f"{self.seconds:.2f}s / {self.peak_mb:.0f}MB"
+        if self.status == "timeout":
+            return "超时"
+        if self.status == "skipped":
+            return "-"
+        return "导入失败"
+
+    def regression_text(self):
+        """变慢说明，如 比上次慢 1.8s (1a2b3c4 → 5d6e7f8)"""
+        prev = self.regression
+        if prev is None:
+            return ""
+        change = f"{(prev.get('head') or '-')[:7]} → {(self.head or '-')[:7]}" if prev.get("head") != self.head \
+            else "版本未变，可能是依赖变化"
+        return f"比上次慢 {self.seconds - prev['seconds']:.1f}s ({change})"
+
+    def to_dict(self):
+        return {
+            "name": self.name, "path": self.path, "head": self.head, "status": self.status,
+            "seconds": round(self.seconds, 4), "process_seconds": round(self.process_seconds, 4),
+            "peak_mb": round(self.peak_mb, 1), "delta_mb": round(self.delta_mb, 1), "nodes": self.nodes,
+            "error": self.error, "top_modules": [[m, round(s, 4)] for m, s in self.top_modules],
+            "profiled_at": self.profiled_at,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        profile = cls(d.get("name", ""), d.get("path", ""), d.get("head"))
+        for key in ("status", "seconds", "process_seconds", "peak_mb", "delta_mb", "nodes", "error", "profiled_at"):
+            if key in d:
+                setattr(profile, key, d[key])
+        profile.top_modules = [tuple(m) for m in d.get("top_modules", [])]
+        return profile
+
+
+class ProfileHistory:
+    """按插件路径保存最近 HISTORY_LIMIT 次分析结果（profile_history.json）"""
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def _key(repo_path):
+        return os.path.normcase(os.path.abspath(repo_path))
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._entries = data.get("entries", {})
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def history(self, repo_path):
+        """该插件的历史记录，从旧到新"""
+        with self._lock:
+            return list(self._entries.get(self._key(repo_path), []))
+
+    def latest(self, repo_path):
+        entries = self.history(repo_path)
+        return ImportProfile.from_dict(entries[-1]) if entries else None
+
+    def add(self, profile):
+        """记录一次结果，并与上一次成功的结果比较，明显变慢时设置 profile.regression"""
+        if profile.status == "skipped":
+            return
+        key = self._key(profile.path)
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            previous = next((e for e in reversed(entries) if e.get("status") == "ok"), None)
+            entries.append(profile.to_dict())
+            del entries[:-HISTORY_LIMIT]
+            self._dirty = True
+        if previous and profile.status == "ok" and profile.seconds >= previous["seconds"] * REGRESSION_RATIO \
+                and profile.seconds - previous["seconds"] >= REGRESSION_MIN_SECONDS:
+            profile.regression = previous
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": self.VERSION, "entries": self._entries}
+            self._dirty = False
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Save profile history error: {e}", file=sys.stderr)
+
+
+def _module_name(folder):
+    """与 ComfyUI 加载插件时使用的模块名一致：目录名中的 . 替换为 _x_"""
+    return folder.replace(".", "_x_")
+
+
+class ImportProfiler:
+    """并行分析多个插件的导入耗时（协程方法在命令引擎的事件循环中运行）
+
+    on_event(profile) 在事件循环线程中调用。结果按导入耗时从高到低排列在 profiles 中。
+    """
+    def __init__(self, app, items, concurrency=None, timeout=None, preload=None, on_event=None):
+        self.app = app
+        self.items = items
+        self.concurrency = concurrency or app.profile_concurrency
+        self.timeout = timeout or app.profile_timeout
+        self.preload = app.profile_preload if preload is None else preload
+        self.on_event = on_event
+        self.profiles = []
+        self.elapsed = 0.0
+
+    @traced("profile")
+    async def run(self):
+        start = time.monotonic()
+        self.app.engine.set_limit("profile", self.concurrency)
+        profiles = await asyncio.gather(*(self._profile(item) for item in self.items))
+        history = self.app.profile_history
+        for profile in profiles:
+            history.add(profile)
+        history.flush()
+        self.profiles = sorted(profiles, key=lambda p: (p.status != "ok", -p.seconds))
+        self.elapsed = time.monotonic() - start
+        return self.profiles
+
+    async def _profile(self, item):
+        reader = item.git_reader()
+        head = reader.read_head()[1] if reader.is_repo else None
+        profile = ImportProfile(item.display_name, item.full_path, head)
+        if not os.path.isfile(os.path.join(item.full_path, "__init__.py")):
+            profile.status = "skipped"
+        else:
+            await self._run_worker(item, profile)
+        if self.on_event:
+            self.on_event(profile)
+        return profile
+
+    async def _run_worker(self, item, profile):
+        cmd = [self.app.python_exe, "-X", "importtime", "-c", WORKER_SCRIPT, self.app.comfyui_root,
+               item.full_path, _module_name(item.display_name), ",".join(self.preload)]
+        env = self.app.command_env()
+        env["PYTHONIOENCODING"] = "utf-8"
+        started = []  # 进程启动时间，不含在 profile 并发队列中等待的时间
+        code, out, err = await self.app.engine.run(cmd, self.app.comfyui_root, "profile", self.timeout, env,
+                                                   on_start=lambda: started.append(time.monotonic()))
+        profile.process_seconds = time.monotonic() - started[0] if started else 0.0
+        marker = out.rfind(RESULT_MARKER)
+        if marker < 0:
+            if is_timeout(code, err):
+                profile.status, profile.error = "timeout", f"超过 {self.timeout}s 未完成导入"
+            else:
+                profile.status = "failed"
+                profile.error = (_strip_importtime(err) or f"进程退出码 {code}")[-2000:]
+            return
+        try:
+            result = json.loads(out[marker + len(RESULT_MARKER):].splitlines()[0])
+        except (ValueError, IndexError):
+            profile.status, profile.error = "failed", "无法解析分析结果"
+            return
+        profile.status = "ok" if result["ok"] else "failed"
+        profile.seconds = result["seconds"]
+        profile.peak_mb = result["peak_memory"] / 1024 / 1024
+        profile.delta_mb = max(0, result["peak_memory"] - result["base_memory"]) / 1024 / 1024
+        profile.nodes = result.get("nodes", 0)
+        profile.error = (result["error"] or result["preload_error"])[-2000:]
+        profile.top_modules = parse_importtime(err)
+
+    def summary_table(self):
+        """文字表格：按导入耗时从高到低，每个插件一行"""
+        labels = {"ok": "成功", "failed": "失败", "timeout": "超时", "skipped": "跳过", "pending": "-"}
+        name_width = max([len(p.name) for p in self.profiles] + [4])
+        lines = [f"{'插件'.ljust(name_width)}  结果    导入耗时  峰值内存  增加内存  最慢的模块"]
+        for p in self.profiles:
+            top = ", ".join(f"{m} {s:.2f}s" for m, s in p.top_modules[:3])
+            note = p.regression_text() or (p.error.strip().splitlines() or [""])[-1]
+            lines.append(f"{p.name.ljust(name_width)}  {labels[p.status]:<6}{p.seconds:>8.2f}s{p.peak_mb:>8.0f}MB"
+                         f"{p.delta_mb:>8.0f}MB  {top}{'  ' + note if note else ''}")
+        total = sum(p.seconds for p in self.profiles if p.status == "ok")
+        failed = sum(1 for p in self.profiles if p.status in ("failed", "timeout"))
+        lines.append("")
+        lines.append(f"总计: {len(self.profiles)} 个插件, 导入耗时合计 {total:.2f}s, 失败 {failed}, "
+                     f"分析用时 {self.elapsed:.2f}s")
+        return "\n".join(lines)
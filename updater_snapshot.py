@@ -0,0 +1,301 @@
+"""快照：把本体与所有插件的远程 URL、分支、SHA 写入锁文件，并按锁文件并发还原（不依赖 tkinter）
+
+还原前先与当前状态比较，只处理不一致的仓库；本地缺少目标提交的仓库才访问网络，
+其余仓库直接本地 checkout。快照中有而本地不存在的插件会重新 clone，
+本地多出的插件只在结果中列出，不会被删除。
+"""
+import asyncio
+import json
+import os
+import time
+
+from updater_core import GitItemBase, StageStats, is_local_change_conflict
+from updater_engine import remote_host
+from updater_trace import traced
+
+SNAPSHOT_VERSION = 1
+CORE_NAME = "ComfyUI"
+
+
+def capture_snapshot(app):
+    """直接读取各仓库的 .git 生成快照，不启动 git 进程；非 Git 目录不记录"""
+    targets = [(CORE_NAME, app.comfyui_root)]
+    targets += [(folder, os.path.join(app.nodes_path, folder)) for folder in app.list_plugin_folders()]
+    repos = []
+    for name, path in targets:
+        reader = GitItemBase(app, path, name).git_reader()
+        _, sha = reader.read_head() if reader.is_repo else (None, None)
+        if not sha:
+            continue
+        repos.append({
+            "name": name,
+            "path": os.path.relpath(path, app.comfyui_root).replace(os.sep, "/"),
+            "url": reader.remote_url(),
+            "branch": reader.current_branch(),
+            "sha": sha,
+        })
+    return {
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "root": app.comfyui_root,
+        "repos": repos,
+    }
+
+
+def save_snapshot(path, snapshot):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """读取快照文件，格式不对时抛出 ValueError"""
+    with open(path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照格式: {path}")
+    for entry in snapshot.get("repos", []):
+        if not entry.get("path") or not entry.get("sha"):
+            raise ValueError(f"快照条目缺少 path 或 sha: {entry}")
+    return snapshot
+
+
+class RestoreResult:
+    """快照中一个仓库与当前状态的差异及还原结果
+
+    action: same 一致 / checkout 需要切换 / clone 目录不存在需要克隆 /
+            missing 目录不存在且没有 URL / invalid 目录存在但不是 Git 仓库 / extra 快照中没有的插件
+    """
+    __slots__ = ("item", "entry", "action", "current_sha", "current_branch", "state", "fetched", "message", "seconds")
+
+    CHANGES = ("checkout", "clone")
+
+    def __init__(self, item, entry, action, current_sha=None, current_branch=None):
+        self.item = item
+        self.entry = entry
+        self.action = action
+        self.current_sha = current_sha
+        self.current_branch = current_branch
+        self.state = "pending" if action in self.CHANGES else "skipped"  # restored / failed / skipped
+        self.fetched = False
+        self.message = ""
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return self.state != "failed" and self.action not in ("missing", "invalid")
+
+    def describe(self):
+        """差异说明，如 main@1a2b3c4 → 5d6e7f8"""
+        def ref(branch, sha):
+            short = (sha or "")[:7] or "-"
+            return f"{branch}@{short}" if branch else short
+        if self.action == "same":
+            return "与快照一致"
+        if self.action == "extra":
+            return f"快照中没有该插件 ({ref(self.current_branch, self.current_sha)})"
+        target = ref(self.entry.get("branch"), self.entry["sha"])
+        if self.action == "clone":
+            return f"需要克隆 → {target}"
+        if self.action == "missing":
+            return "目录不存在且快照中没有远程 URL"
+        if self.action == "invalid":
+            return "目录存在但不是 Git 仓库"
+        return f"{ref(self.current_branch, self.current_sha)} → {target}"
+
+    def to_dict(self):
+        return {
+            "name": self.item.display_name,
+            "path": self.item.full_path,
+            "ok": self.ok,
+            "action": self.action,
+            "state": self.state,
+            "fetched": self.fetched,
+            "from": self.current_sha,
+            "to": self.entry["sha"] if self.entry else None,
+            "message": self.message or self.describe(),
+            "timings": {"restore": round(self.seconds, 4)},
+        }
+
+
+def diff_snapshot(app, snapshot):
+    """逐个仓库比较快照与当前状态，返回 RestoreResult 列表（只读取 .git，不启动 git 进程）"""
+    results, seen = [], set()
+    for entry in snapshot.get("repos", []):
+        path = os.path.normpath(os.path.join(app.comfyui_root, entry["path"]))
+        seen.add(os.path.normcase(path))
+        item = GitItemBase(app, path, entry.get("name") or os.path.basename(path))
+        if not os.path.exists(path):
+            results.append(RestoreResult(item, entry, "clone" if entry.get("url") else "missing"))
+            continue
+        reader = item.git_reader()
+        if not reader.is_repo:
+            results.append(RestoreResult(item, entry, "invalid"))
+            continue
+        _, sha = reader.read_head()
+        branch = reader.current_branch()
+        same = sha == entry["sha"] and branch == entry.get("branch")
+        results.append(RestoreResult(item, entry, "same" if same else "checkout", sha, branch))
+
+    for folder in app.list_plugin_folders():
+        path = os.path.join(app.nodes_path, folder)
+        if os.path.normcase(os.path.normpath(path)) in seen:
+            continue
+        item = GitItemBase(app, path, folder)
+        reader = item.git_reader()
+        _, sha = reader.read_head() if reader.is_repo else (None, None)
+        results.append(RestoreResult(item, None, "extra", sha, reader.current_branch() if sha else None))
+    return results
+
+
+class SnapshotRestore:
+    """按差异并发还原：缺少目标提交的仓库先 fetch / clone（网络并发），再 checkout（磁盘并发）
+
+    快照记录了分支时，只有该分支没有未推送的本地提交才会被移动到目标提交（checkout -B），
+    否则以分离头指针方式 checkout，不丢失任何本地提交。
+    on_event(result) 在事件循环线程中调用。
+    """
+    def __init__(self, app, results, network_concurrency=None, disk_concurrency=None, on_event=None, log=None):
+        self.app = app
+        self.results = results
+        self.network_concurrency = network_concurrency or max(app.check_concurrency, 16)
+        self.disk_concurrency = disk_concurrency or app.disk_concurrency
+        self.on_event = on_event
+        self.log = log
+        self.stages = {"fetch": StageStats("网络阶段 (fetch/clone)"), "checkout": StageStats("磁盘阶段 (checkout)")}
+        self.elapsed = 0.0
+
+    @property
+    def pending(self):
+        return [r for r in self.results if r.action in RestoreResult.CHANGES]
+
+    @traced("restore")
+    async def run(self):
+        start = time.monotonic()
+        network_slots = asyncio.Semaphore(self.network_concurrency)
+        disk_slots = asyncio.Semaphore(self.disk_concurrency)
+        await asyncio.gather(*(self._restore(r, network_slots, disk_slots) for r in self.pending))
+        self.elapsed = time.monotonic() - start
+        if self.log is not None:
+            self.log.append(self.summary_table())
+        return self.results
+
+    def _log(self, text):
+        if self.log is not None:
+            self.log.append(text)
+
+    async def _restore(self, result, network_slots, disk_slots):
+        started = time.monotonic()
+        try:
+            sha = result.entry["sha"]
+            if result.action == "clone" or not await self._has_commit(result.item, sha):
+                async with network_slots:
+                    fetch_started = time.monotonic()
+                    ok, msg = await (self._clone(result) if result.action == "clone" else self._fetch(result))
+                    self.stages["fetch"].record(fetch_started, ok)
+                result.fetched = True
+                if not ok:
+                    result.state, result.message = "failed", msg
+                    return
+            async with disk_slots:
+                checkout_started = time.monotonic()
+                ok, msg = await self._checkout(result)
+                self.stages["checkout"].record(checkout_started, ok)
+            result.state, result.message = ("restored" if ok else "failed"), msg
+        except asyncio.CancelledError:
+            result.state, result.message = "failed", "已取消"
+        finally:
+            result.seconds = time.monotonic() - started
+            self._log(f"[restore] {result.item.display_name}: {result.state} {result.message}".rstrip())
+            if self.on_event is not None:
+                self.on_event(result)
+
+    @staticmethod
+    async def _has_commit(item, sha):
+        code, _, _ = await item.run_git_async(["cat-file", "-e", f"{sha}^{{commit}}"])
+        return code == 0
+
+    async def _fetch(self, result):
+        item, sha = result.item, result.entry["sha"]
+        await item.fetch_async()
+        if await self._has_commit(item, sha):
+            return True, ""
+        # 目标提交已不在任何分支上（例如上游强制推送过），尝试按 SHA 直接拉取
+        code, _, err = await self.app.host_policy.run(
+            item.remote_host(), lambda: item.run_git_async(["fetch", "origin", sha], kind="git-network", log=self.log))
+        if code == 0 and await self._has_commit(item, sha):
+            return True, ""
+        return False, item.fetch_error or f"无法获取提交 {sha[:7]}: {err}"
+
+    async def _clone(self, result):
+        item, url = result.item, result.entry["url"]
+        cmd = [self.app.git_exe, "clone", "--progress"]
+        mirror = self.app.mirror
+        if mirror is not None:
+            cmd += ["--reference-if-able", os.path.abspath(mirror.path)]
+        cmd += [url, item.full_path]
+        parent = os.path.dirname(item.full_path)
+
+        async def clone():
+            if self.log is None:
+                return await self.app.engine.run(cmd, parent, "git-network", None, self.app.command_env(),
+                                                 item.cancel_token)
+            self.log.command(cmd)
+            return await self.app.engine.stream(cmd, parent, "git-network", self.log.append, None,
+                                                self.app.command_env(), item.cancel_token)
+        code, _, err = await self.app.host_policy.run(remote_host(url) or "local", clone)
+        if code != 0:
+            return False, f"克隆失败: {err}"
+        if not await self._has_commit(item, result.entry["sha"]):
+            return await self._fetch(result)
+        return True, ""
+
+    async def _can_move_branch(self, item, branch, sha):
+        """分支不存在、已在目标提交、或其提交全部已在上游时，移动分支不会丢失本地提交"""
+        reader = item.git_reader()
+        tip = reader.resolve_ref(f"refs/heads/{branch}")
+        if tip is None or tip == sha:
+            return True
+        upstream = reader.upstream_ref(branch)
+        if reader.resolve_ref(upstream) is None:
+            return False
+        code, _, _ = await item.run_git_async(["merge-base", "--is-ancestor", tip, upstream])
+        return code == 0
+
+    async def _checkout(self, result):
+        item, sha, branch = result.item, result.entry["sha"], result.entry.get("branch")
+        args = ["checkout", sha]
+        if branch and await self._can_move_branch(item, branch, sha):
+            args = ["checkout", "-B", branch, sha]
+        code, _, err = await item.run_git_async(args, log=self.log)
+        if code != 0 and is_local_change_conflict(err):
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, self.app.confirm_discard_changes, item.display_name):
+                await item.run_git_async(["reset", "--hard", "HEAD"], log=self.log)
+                code, _, err = await item.run_git_async(args, log=self.log)
+        if code != 0:
+            return False, f"切换失败: {err}"
+        if args[1] == "-B":
+            return True, f"{branch}@{sha[:7]}"
+        return True, f"{sha[:7]} (分离头指针)" if branch else sha[:7]
+
+    def summary_table(self):
+        """文字表格：每个需要还原的仓库一行，末尾附各阶段吞吐"""
+        labels = {"restored": "已还原", "failed": "失败", "skipped": "跳过", "pending": "-"}
+        rows = self.pending
+        name_width = max([len(r.item.display_name) for r in rows] + [4])
+        lines = [f"{'仓库'.ljust(name_width)}  结果      获取  耗时     信息"]
+        for r in rows:
+            lines.append(f"{r.item.display_name.ljust(name_width)}  {labels[r.state]:<8}{'是' if r.fetched else '否':<4}"
+                         f"{r.seconds:>6.2f}s  {r.message or r.describe()}")
+        lines.append("")
+        lines += [stage.summary() for stage in self.stages.values()]
+        restored = sum(1 for r in rows if r.state == "restored")
+        failed = sum(1 for r in rows if r.state == "failed")
+        lines.append(f"总计: {len(rows)} 个仓库需要还原, 成功 {restored}, 失败 {failed}, 总用时 {self.elapsed:.2f}s")
+        return "\n".join(lines)
+
+    def stats_dict(self):
+        return {name: stage.to_dict() for name, stage in self.stages.items()}
@@ -0,0 +1,279 @@
+"""命令追踪：记录每一条 git / pip 调用的耗时、排队时间、返回码与输出量（不依赖 tkinter）
+
+CommandEngine 为每条命令生成一个 Span，记录所属仓库（工作目录）与阶段。阶段由调用方用
+trace_phase() 标注，嵌套时以 "/" 连接，如 "check/fetch"。协程与普通线程都可以使用：
+从线程提交到事件循环的命令会继承提交时的阶段。
+CommandTracer 只保留最近的 Span，并按命令累计直方图；可以导出为 Chrome Trace
+（chrome://tracing 或 https://ui.perfetto.dev 打开）。
+"""
+import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+_phase = contextvars.ContextVar("trace_phase", default="")
+
+# 耗时直方图的桶上限（毫秒），最后一个桶为无穷大
+HISTOGRAM_BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+@contextlib.contextmanager
+def trace_phase(name):
+    """标注其中发起的命令属于哪个阶段"""
+    parent = _phase.get()
+    token = _phase.set(f"{parent}/{name}" if parent else name)
+    try:
+        yield
+    finally:
+        _phase.reset(token)
+
+
+def traced(name):
+    """装饰器：函数或协程函数执行期间处于阶段 name"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with trace_phase(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_phase():
+    return _phase.get()
+
+
+def command_name(cmd_args):
+    """Span 名称：git 取子命令（git fetch），python -m pip 取 pip 子命令，其它取可执行文件名"""
+    if not cmd_args:
+        return "?"
+    exe = os.path.splitext(os.path.basename(cmd_args[0]))[0].lower()
+    rest = cmd_args[1:]
+    if rest[:2] == ["-m", "pip"]:
+        exe, rest = "pip", rest[2:]
+    if exe not in ("git", "pip"):
+        return exe
+    skip = False
+    for arg in rest:
+        if skip:
+            skip = False
+        elif arg in ("-c", "-C"):
+            skip = True
+        elif not arg.startswith("-"):
+            return f"{exe} {arg}"
+    return exe
+
+
+class Span:
+    """一条命令的记录；时间均为 time.monotonic()"""
+    __slots__ = ("seq", "name", "kind", "cwd", "phase", "cmd", "queued", "started", "ended", "code", "bytes_out",
+                 "lane")
+
+    def __init__(self, seq, cmd_args, cwd, kind):
+        self.seq = seq
+        self.name = command_name(cmd_args)
+        self.kind = kind
+        self.cwd = cwd or ""
+        self.phase = _phase.get()
+        self.cmd = " ".join(cmd_args)
+        self.queued = time.monotonic()
+        self.started = None   # 拿到并发名额、启动进程的时间
+        self.ended = None
+        self.code = None      # None 表示被取消
+        self.bytes_out = 0
+        self.lane = 0         # Chrome Trace 中的行号，同一时刻运行的命令各占一行
+
+    @property
+    def repo(self):
+        return os.path.basename(os.path.normpath(self.cwd)) if self.cwd else ""
+
+    @property
+    def queue_wait(self):
+        return ((self.started or self.ended or self.queued) - self.queued)
+
+    @property
+    def wall(self):
+        return (self.ended - self.started) if self.started is not None and self.ended is not None else 0.0
+
+    @property
+    def status(self):
+        if self.code is None:
+            return "cancelled"
+        return "ok" if self.code == 0 else "error"
+
+    def to_dict(self, origin):
+        return {
+            "seq": self.seq, "name": self.name, "kind": self.kind, "repo": self.repo, "cwd": self.cwd,
+            "phase": self.phase, "cmd": self.cmd, "start": round(self.queued - origin, 6),
+            "queue_wait": round(self.queue_wait, 6), "wall": round(self.wall, 6), "code": self.code,
+            "bytes_out": self.bytes_out,
+        }
+
+
+class CommandStats:
+    """单个命令（如 git fetch）的累计统计；分位数按最近的 RECENT 次计算"""
+    RECENT = 500
+    __slots__ = ("name", "kind", "count", "errors", "cancelled", "total", "max", "queue_total", "bytes_out",
+                 "buckets", "recent")
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.count = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.queue_total = 0.0
+        self.bytes_out = 0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.recent = collections.deque(maxlen=self.RECENT)
+
+    def add(self, span):
+        wall = span.wall
+        self.count += 1
+        self.errors += 1 if span.status == "error" else 0
+        self.cancelled += 1 if span.status == "cancelled" else 0
+        self.total += wall
+        self.max = max(self.max, wall)
+        self.queue_total += span.queue_wait
+        self.bytes_out += span.bytes_out
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, wall * 1000)] += 1
+        self.recent.append(wall)
+
+    def percentile(self, p):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def mean_queue(self):
+        return self.queue_total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        labels = [f"<={b}ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        return {
+            "name": self.name, "kind": self.kind, "count": self.count, "errors": self.errors,
+            "cancelled": self.cancelled, "total": round(self.total, 4), "mean": round(self.mean, 4),
+            "p50": round(self.percentile(50), 4), "p95": round(self.percentile(95), 4), "max": round(self.max, 4),
+            "mean_queue": round(self.mean_queue, 4), "bytes_out": self.bytes_out,
+            "histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+class CommandTracer:
+    """收集 Span 与按命令的统计，可在任意线程读取"""
+    MAX_SPANS = 5000
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self.origin = time.monotonic()
+        self.origin_wall = time.time()
+        self._lock = threading.Lock()
+        self._spans = collections.deque(maxlen=max_spans)
+        self._stats = {}
+        self._seq = 0
+        self._lanes = []   # 各行当前是否被占用（只在事件循环线程中访问）
+
+    def begin(self, cmd_args, cwd, kind):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        return Span(seq, cmd_args, cwd, kind)
+
+    def started(self, span):
+        span.started = time.monotonic()
+        for index, busy in enumerate(self._lanes):
+            if not busy:
+                break
+        else:
+            index = len(self._lanes)
+            self._lanes.append(False)
+        self._lanes[index] = True
+        span.lane = index
+
+    def finish(self, span, code):
+        span.ended = time.monotonic()
+        span.code = code
+        if span.started is not None:
+            self._lanes[span.lane] = False
+        with self._lock:
+            self._spans.append(span)
+            key = (span.kind, span.name)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = CommandStats(span.name, span.kind)
+            stats.add(span)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._stats.clear()
+
+    def spans(self, limit=None):
+        with self._lock:
+            spans = list(self._spans)
+        return spans[-limit:] if limit else spans
+
+    def stats(self):
+        """按总耗时从高到低排列的 CommandStats 列表"""
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda s: s.total, reverse=True)
+
+    def phase_totals(self):
+        """各阶段的命令数与命令耗时之和，返回 [(阶段, 次数, 耗时)]，按耗时从高到低"""
+        totals = {}
+        for span in self.spans():
+            count, wall = totals.get(span.phase or "-", (0, 0.0))
+            totals[span.phase or "-"] = (count + 1, wall + span.wall)
+        return sorted(((phase, c, w) for phase, (c, w) in totals.items()), key=lambda t: t[2], reverse=True)
+
+    def to_dict(self):
+        return {
+            "started_at": self.origin_wall,
+            "spans": [span.to_dict(self.origin) for span in self.spans()],
+            "commands": [stats.to_dict() for stats in self.stats()],
+        }
+
+    def chrome_trace(self):
+        """Chrome Trace Event 格式：每条命令一个完整事件 (ph=X)，排队时间放在 args 中"""
+        events = []
+        lanes = set()
+        for span in self.spans():
+            if span.started is None:
+                continue
+            lanes.add(span.lane)
+            events.append({
+                "name": span.name, "cat": span.kind, "ph": "X", "pid": 1, "tid": span.lane,
+                "ts": round((span.started - self.origin) * 1e6), "dur": round(span.wall * 1e6),
+                "args": {"repo": span.repo, "phase": span.phase, "cmd": span.cmd, "code": span.code,
+                         "queue_ms": round(span.queue_wait * 1000, 2), "bytes_out": span.bytes_out},
+            })
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": f"slot {lane}"}}
+                   for lane in sorted(lanes)]
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "ComfyUI-Updater commands"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"commands": [stats.to_dict() for stats in self.stats()]}}
+
+    def export(self, path):
+        """写出 Chrome Trace 文件（失败时抛出 OSError）"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)